@@ -0,0 +1,180 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Union
+
+# Root of the cache and the disk budget shared by every session
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", ".audio_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def content_key(*parts: Union[str, bytes]) -> str:
+    """SHA-256 over the parts, length-prefixed so ("ab", "c") and ("a", "bc") differ"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """
+    On-disk cache for synthesized speech and transcripts, keyed by content hash, plus
+    per-session directories for recordings and reply audio. Every file counts toward
+    max_bytes; the least recently used files are deleted once the total exceeds it.
+    """
+
+    def __init__(self, root: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # path -> size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key being produced, so concurrent misses for it make one API call
+        self._pending: Dict[str, threading.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        # Rebuild the LRU order from modification times left by a previous run
+        found = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._files[path] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _blob_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, "blobs", key[:2], f"{key}{suffix}")
+
+    def _touch(self, path: str) -> bool:
+        # Callers hold the lock; a file removed behind our back is forgotten
+        if not os.path.exists(path):
+            self._forget(path)
+            return False
+        if path in self._files:
+            self._files.move_to_end(path)
+        os.utime(path)
+        return True
+
+    def _forget(self, path: str):
+        size = self._files.pop(path, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._forget(path)
+            self._files[path] = len(data)
+            self.total_bytes += len(data)
+            self._evict(keep=path)
+
+    def _evict(self, keep: Optional[str] = None):
+        while self.total_bytes > self.max_bytes and self._files:
+            path = next(iter(self._files))
+            if path == keep:
+                # The newest file alone is over budget; keep it until something else is written
+                if len(self._files) == 1:
+                    break
+                self._files.move_to_end(path)
+                continue
+            self._forget(path)
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self, path: str) -> Optional[bytes]:
+        # Callers hold the lock, so eviction can't delete the file between the check and the read
+        if not self._touch(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        """Contents of a file in the cache, or None if it has been evicted"""
+        with self._lock:
+            return self._read(path)
+
+    def _get_or_create(self, path: str, produce: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            data = self._read(path)
+            if data is not None:
+                self.hits += 1
+                return data
+            pending = self._pending.setdefault(path, threading.Lock())
+        with pending:
+            with self._lock:
+                data = self._read(path)
+                if data is not None:
+                    self.hits += 1
+                    return data
+                self.misses += 1
+            try:
+                data = produce()
+                self._write(path, data)
+            finally:
+                with self._lock:
+                    self._pending.pop(path, None)
+        return data
+
+    def speech(self, text: str, voice: str, model: str, synthesize: Callable[[str], bytes]) -> bytes:
+        """Audio for text in this voice and model, synthesizing it only on a miss"""
+        path = self._blob_path(content_key("tts", model, voice, text), ".mp3")
+        return self._get_or_create(path, lambda: synthesize(text))
+
+    def transcript(self, audio: bytes, model: str, transcribe: Callable[[bytes], str]) -> str:
+        """Transcript of the audio, calling transcribe only for audio not seen before"""
+        path = self._blob_path(content_key("transcript", model, audio), ".txt")
+        return self._get_or_create(path, lambda: transcribe(audio).encode("utf-8")).decode("utf-8")
+
+    def session_dir(self, session_id: str) -> str:
+        return os.path.join(self.root, "sessions", session_id)
+
+    def save_session_file(self, session_id: str, filename: str, data: bytes) -> str:
+        """Write a file into the session's own directory, where other sessions can't overwrite it"""
+        path = os.path.join(self.session_dir(session_id), filename)
+        self._write(path, data)
+        return path
+
+    def clear_session(self, session_id: str):
+        """Delete the session's files; cached speech and transcripts stay for reuse"""
+        directory = self.session_dir(session_id)
+        with self._lock:
+            for path in [p for p in self._files if os.path.dirname(p) == directory]:
+                self._forget(path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
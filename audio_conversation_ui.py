@@ -1,45 +1,107 @@
 import streamlit as st
-import os
+import streamlit.components.v1 as components
+import base64
+import json
 import time
-import openai
+import uuid
+from typing import Optional
+from audio_cache import AudioCache
+from audio_utils import TRANSCRIPTION_MODEL, TTS_MODEL, TTS_VOICE, as_buffer, synthesize_speech, transcribe
+from concept_matcher import ConceptMatcher
+from conversation_memory import conversation_prompt, get_memory, reset_memory, update_memory
+from incremental_extraction import (
+    ExtractionCheckpoint, extraction_queue, extraction_status_ui, get_checkpoint, reset_checkpoint
+)
+from jobs import JobQueue
 from knowledge_base import KnowledgeBase
-from utils import extract_knowledge, update_knowledge_base
+from llm_clients import stream_chat
+from speech_pipeline import run_voice_turn
 
-def audio_conversation_ui(kb: KnowledgeBase, llm_config):
+ASSISTANT_SYSTEM_MESSAGE = (
+    "You are an interface to communicate with domain experts. Your goal is to"
+    " ask relevant questions to extract their knowledge about a specific domain."
+    " Ask one question at a time, focusing on technical details, processes,"
+    " relationships between concepts, and key attributes."
+)
+
+def audio_session_id():
+    """Per-browser-session namespace for this session's recordings and reply audio"""
+    if "audio_session_id" not in st.session_state:
+        st.session_state.audio_session_id = uuid.uuid4().hex
+    return st.session_state.audio_session_id
+
+def audio_conversation_ui(kb: KnowledgeBase, llm_config, concept_matcher: Optional[ConceptMatcher] = None,
+                          audio_cache: Optional[AudioCache] = None):
     """
     Interface for a back-and-forth audio conversation between user and bot.
     """
     st.header("Audio Conversation")
+    audio_cache = audio_cache or AudioCache()
     
     # Button to start a new conversation
     if st.button("Start New Conversation") or "messages" not in st.session_state:
+        # The previous conversation's audio is no longer shown, so free its disk space
+        audio_cache.clear_session(audio_session_id())
         st.session_state.messages = []
+        reset_checkpoint()
+        reset_memory()
         initial_message = "Hello! I'm your AI assistant. What would you like to talk about today?"
         st.session_state.messages.append({"role": "assistant", "content": initial_message})
         
-        # Auto-generate and play initial greeting
-        speech_file = f"assistant_audio_0.mp3"
-        generate_speech(initial_message, speech_file)
-        st.session_state.messages[-1]["audio_path"] = speech_file
+        # Auto-generate and play initial greeting; after the first time it comes from the cache
+        speech = generate_speech(initial_message, audio_cache)
+        if speech:
+            # A session copy, so the shared cache evicting its entry doesn't take the greeting with it
+            st.session_state.messages[-1]["audio_path"] = audio_cache.save_session_file(
+                audio_session_id(), "assistant_audio_0.mp3", speech
+            )
         st.rerun()
     
+    # Merge finished background extractions into the KB; polls while jobs are running
+    checkpoint, job_queue = extraction_status_ui(kb, llm_config)
+    memory = get_memory(llm_config)
+    if memory.last_prompt_tokens:
+        st.caption(memory.status())
+    
+    # An ended conversation shows its extracted knowledge once the jobs have landed
+    if checkpoint.ending:
+        if checkpoint.jobs:
+            st.info("Extracting knowledge in the background. You can keep using the app meanwhile.")
+        else:
+            show_extraction_results(checkpoint)
+        return
+    
     # Button to end conversation and extract knowledge
     if len(st.session_state.messages) > 0 and st.button("End Conversation & Extract Knowledge"):
-        end_conversation(kb, llm_config)
-        return
+        end_conversation(checkpoint, job_queue)
     
     # Display conversation with auto-play for new assistant messages
     for i, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
-            st.write(message["content"])
+            # Known concepts are highlighted in bold
+            content = message["content"]
+            st.markdown(concept_matcher.highlight(content) if concept_matcher else content)
             
-            # Display audio if available
-            if "audio_path" in message and os.path.exists(message["audio_path"]):
+            # Display audio if available; read through the cache, which may have evicted it
+            audio = audio_cache.read_file(message["audio_path"]) if "audio_path" in message else None
+            if audio:
+                audio_format = "audio/mpeg" if message["audio_path"].endswith(".mp3") else "audio/wav"
                 # Auto-play if this is the most recent assistant message
-                if message["role"] == "assistant" and i == len(st.session_state.messages) - 1:
-                    st.audio(message["audio_path"], autoplay=True)
+                if (message["role"] == "assistant" and i == len(st.session_state.messages) - 1
+                        and not message.get("autoplayed")):
+                    st.audio(audio, format=audio_format, autoplay=True)
                 else:
-                    st.audio(message["audio_path"])
+                    st.audio(audio, format=audio_format)
+            
+            # Latency of pipelined replies: first token, first audio and LLM completion
+            metrics = message.get("voice_metrics")
+            if metrics:
+                parts = [f"first token {metrics.get('first_token_s', 0):.2f}s"]
+                if "first_audio_s" in metrics:
+                    parts.append(f"first audio {metrics['first_audio_s']:.2f}s")
+                parts.append(f"reply done {metrics.get('llm_done_s', 0):.2f}s")
+                parts.append(f"{metrics['segments']} speech segments")
+                st.caption(" · ".join(parts).capitalize())
     
     # Audio input with instruction for manual stop
     st.markdown("##### Voice Recording (click 'Stop recording' when done)")
@@ -53,27 +115,34 @@ def audio_conversation_ui(kb: KnowledgeBase, llm_config):
     
     # Process audio input
     if audio_bytes is not None:
-        process_audio_input(audio_bytes, kb, llm_config)
+        process_audio_input(audio_bytes, kb, llm_config, audio_cache)
     
     # Process text input
     if text_button and text_input:
-        process_text_input(text_input, kb, llm_config)
+        process_text_input(text_input, kb, llm_config, audio_cache)
+    
+    stats = audio_cache.stats()
+    st.caption(
+        f"Audio cache: {stats['files']} files, {stats['bytes'] / 1e6:.1f} MB,"
+        f" {stats['hits']} hits / {stats['misses']} misses, {stats['evictions']} evicted"
+    )
 
-def process_audio_input(audio_bytes, kb, llm_config):
+def process_audio_input(audio_bytes, kb, llm_config, audio_cache):
     """Process audio input and generate a response"""
-    # Save audio to file
-    audio_file = f"user_audio_{len(st.session_state.messages)}.wav"
-    with open(audio_file, "wb") as f:
-        f.write(audio_bytes.getvalue())
-    
-    # Transcribe audio
+    # Transcribe straight from the recorded buffer, without a temp-file round trip
+    audio = as_buffer(audio_bytes)
     with st.spinner("Transcribing your audio..."):
-        transcript = transcribe_audio(audio_file)
+        transcript = transcribe_audio(audio, audio_cache)
         
         if not transcript:
             st.error("Failed to transcribe audio. Please try again.")
             return
     
+    # Keep the recording for playback in this session's directory
+    audio_file = audio_cache.save_session_file(
+        audio_session_id(), f"user_audio_{len(st.session_state.messages)}.wav", audio
+    )
+    
     # Add user message to conversation
     st.session_state.messages.append({
         "role": "user",
@@ -82,12 +151,12 @@ def process_audio_input(audio_bytes, kb, llm_config):
     })
     
     # Generate assistant response
-    generate_response(transcript, kb, llm_config)
+    generate_response(transcript, kb, llm_config, audio_cache)
     
     # Rerun to update UI
     st.rerun()
 
-def process_text_input(text, kb, llm_config):
+def process_text_input(text, kb, llm_config, audio_cache):
     """Process text input and generate a response"""
     # Add user message to conversation
     st.session_state.messages.append({
@@ -96,110 +165,125 @@ def process_text_input(text, kb, llm_config):
     })
     
     # Generate assistant response
-    generate_response(text, kb, llm_config)
+    generate_response(text, kb, llm_config, audio_cache)
     
     # Rerun to update UI
     st.rerun()
 
-def generate_response(user_input, kb, llm_config):
+def generate_response(user_input, kb, llm_config, audio_cache):
     """Generate a response from the assistant"""
-    # Create message list for the API
-    messages = [
-        {"role": "system", "content": """
-            You are an interface to communicate with domain experts. Your goal is to
-            ask relevant questions to extract their knowledge about a specific domain.
-            Ask one question at a time, focusing on technical details, processes,
-            relationships between concepts, and key attributes.
-        """}
-    ]
-    
-    # Add conversation history
-    for msg in st.session_state.messages:
-        messages.append({"role": msg["role"], "content": msg["content"]})
-    
-    # Get response from OpenAI
-    with st.spinner("Assistant is thinking..."):
-        try:
-            client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(
-                model="gpt-4o",  # or any model defined in llm_config
-                messages=messages,
-                max_tokens=500
-            )
-            
-            assistant_message = response.choices[0].message.content
-            
-            # Generate speech for the response
-            speech_file = f"assistant_audio_{len(st.session_state.messages)}.mp3"
-            speech_generated = generate_speech(assistant_message, speech_file)
-            
-            # Add assistant message to conversation
-            new_message = {
-                "role": "assistant",
-                "content": assistant_message
-            }
-            
-            if speech_generated:
-                new_message["audio_path"] = speech_file
-                
-            st.session_state.messages.append(new_message)
-            
-        except Exception as e:
-            st.error(f"Error generating response: {str(e)}")
-
-def transcribe_audio(audio_file):
-    """Transcribe audio file using OpenAI's Whisper API"""
+    # Recent turns verbatim plus a summary of the earlier ones, so the prompt stays bounded
+    messages = conversation_prompt(ASSISTANT_SYSTEM_MESSAGE, llm_config)
+    
+    # Stream the reply and speak it sentence by sentence while the rest is still being generated
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        with st.chat_message("assistant"):
+            text_placeholder = st.empty()
+            turn_id = f"turn-{len(st.session_state.messages)}-{time.time_ns()}"
+            result = run_voice_turn(
+                stream_chat(messages, llm_config, max_tokens=500),
+                # Repeated sentences are served from the cache without a TTS call
+                lambda text: audio_cache.speech(text, TTS_VOICE, TTS_MODEL, synthesize_speech),
+                on_text=lambda text: text_placeholder.markdown(text + "▌"),
+                on_audio=lambda index, audio: queue_audio_segment(turn_id, audio),
+            )
+            assistant_message = result["text"]
+            text_placeholder.markdown(assistant_message)
+        
+        # Add assistant message to conversation
+        new_message = {
+            "role": "assistant",
+            "content": assistant_message,
+            # The segments already played while streaming, so the rerun must not replay them
+            "autoplayed": True,
+            "voice_metrics": result["metrics"],
+        }
         
-        with open(audio_file, "rb") as f:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f
+        if any(result["segments"]):
+            # MP3 frames are self-contained, so the segments concatenate into one playable file
+            new_message["audio_path"] = audio_cache.save_session_file(
+                audio_session_id(), f"assistant_audio_{len(st.session_state.messages)}.mp3",
+                b"".join(result["segments"])
             )
+        if result["errors"]:
+            st.error(f"Error generating speech: {result['errors'][0]}")
             
-        return response.text
+        st.session_state.messages.append(new_message)
+        st.session_state.setdefault("voice_turn_metrics", []).append(result["metrics"])
+        
+        # Every few turns, extract the new messages in the background so ending is quick
+        get_checkpoint().maybe_submit(extraction_queue(llm_config), st.session_state.messages)
+        update_memory(llm_config)
+        
+    except Exception as e:
+        st.error(f"Error generating response: {str(e)}")
+
+def queue_audio_segment(turn_id, audio):
+    """
+    Queue a segment for playback in the browser. Segments of a turn play back to back,
+    each starting when the previous one ends, instead of overlapping as separate
+    autoplaying st.audio elements would.
+    """
+    data_url = "data:audio/mpeg;base64," + base64.b64encode(audio).decode("ascii")
+    components.html(f"""
+        <script>
+        const player = window.parent.__kbTts = window.parent.__kbTts || {{queue: [], playing: false, turn: null}};
+        if (player.turn !== {json.dumps(turn_id)}) {{
+            player.turn = {json.dumps(turn_id)};
+            player.queue = [];
+        }}
+        player.queue.push({json.dumps(data_url)});
+        const playNext = () => {{
+            const next = player.queue.shift();
+            if (!next) {{ player.playing = false; return; }}
+            player.playing = true;
+            const audio = new window.parent.Audio(next);
+            audio.onended = playNext;
+            audio.onerror = playNext;
+            audio.play().catch(playNext);
+        }};
+        if (!player.playing) playNext();
+        </script>
+    """, height=0)
+
+def transcribe_audio(audio, audio_cache):
+    """Transcribe recorded audio in memory using OpenAI's Whisper API, reusing cached transcripts"""
+    try:
+        return audio_cache.transcript(audio, TRANSCRIPTION_MODEL, transcribe)
         
     except Exception as e:
         st.error(f"Error transcribing audio: {str(e)}")
         return None
 
-def generate_speech(text, filename):
-    """Generate speech from text using OpenAI's TTS API"""
+def generate_speech(text, audio_cache):
+    """Speech for text, generated with OpenAI's TTS API unless it is cached"""
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        response = client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=text
-        )
-        
-        response.stream_to_file(filename)
-        return True
+        return audio_cache.speech(text, TTS_VOICE, TTS_MODEL, synthesize_speech)
         
     except Exception as e:
         st.error(f"Error generating speech: {str(e)}")
-        return False
+        return None
 
-def end_conversation(kb, llm_config):
-    """Extract knowledge from the conversation"""
+def end_conversation(checkpoint: ExtractionCheckpoint, job_queue: JobQueue):
+    """Queue extraction of the rest of the conversation and show progress until it lands"""
     if not st.session_state.messages:
         st.warning("No conversation to extract knowledge from.")
         return
         
-    # Get conversation text
-    conversation_text = "\n".join([msg["content"] for msg in st.session_state.messages])
-    
-    # Extract knowledge
-    with st.spinner("Extracting knowledge..."):
-        extraction_result = extract_knowledge(conversation_text, llm_config)
-    
-    # Update knowledge base
-    update_knowledge_base(extraction_result, kb)
+    # Only the messages not yet extracted in the background go into the final job
+    checkpoint.end(job_queue, st.session_state.messages)
+    st.rerun()
+
+def show_extraction_results(checkpoint: ExtractionCheckpoint):
+    """Knowledge extracted from the ended conversation"""
+    st.caption(checkpoint.summary())
+    extraction_result = checkpoint.result
     
     # Display results
-    st.success("Knowledge extracted successfully!")
+    if checkpoint.error:
+        st.error(checkpoint.error)
+    else:
+        st.success("Knowledge extracted successfully!")
     
     # Display concepts
     st.subheader("Extracted Concepts")
@@ -211,4 +295,4 @@ def end_conversation(kb, llm_config):
     st.subheader("Extracted Relationships")
     for rel in extraction_result.get("relationships", []):
         if all(k in rel for k in ["source", "relation", "target"]):
-            st.write(f"- {rel['source']} {rel['relation']} {rel['target']}")
\ No newline at end of file
+            st.write(f"- {rel['source']} {rel['relation']} {rel['target']}")
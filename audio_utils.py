@@ -1,27 +1,117 @@
-import os
-import openai
-from typing import Optional
+import io
+import wave
+from typing import Optional, Union
+import numpy as np
+from llm_clients import api_retry, get_retrying_client
+from tracing import count, traced
 
-def transcribe_audio(audio_file_path: str) -> Optional[str]:
+TRANSCRIPTION_MODEL = "whisper-1"
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+
+# Whisper works at 16 kHz mono, so higher rates and extra channels only add upload bytes
+TARGET_SAMPLE_RATE = 16000
+# Frames quieter than this (dBFS RMS over 20 ms) at either end are trimmed
+SILENCE_THRESHOLD_DB = -45.0
+SILENCE_FRAME_S = 0.02
+# Silence kept around the speech so word onsets are not clipped
+SILENCE_PADDING_S = 0.2
+
+AudioBuffer = Union[bytes, bytearray, memoryview, io.BytesIO]
+
+
+def as_buffer(audio: AudioBuffer) -> memoryview:
+    """A read-only view of the audio without copying; BytesIO (and Streamlit's UploadedFile) expose theirs"""
+    if isinstance(audio, io.BytesIO):
+        return audio.getbuffer().toreadonly()
+    return memoryview(audio).toreadonly()
+
+
+def _trim_silence(samples: np.ndarray, rate: int) -> np.ndarray:
+    frame = max(int(rate * SILENCE_FRAME_S), 1)
+    count = len(samples) // frame
+    if count == 0:
+        return samples
+    frames = samples[:count * frame].reshape(count, frame, -1)
+    rms = np.sqrt(np.mean(np.square(frames), axis=(1, 2)))
+    loud = np.flatnonzero(20 * np.log10(np.maximum(rms, 1e-9)) > SILENCE_THRESHOLD_DB)
+    if len(loud) == 0:
+        # Nothing above the threshold: leave it to the transcription model rather than send nothing
+        return samples
+    padding = int(rate * SILENCE_PADDING_S)
+    start = max(loud[0] * frame - padding, 0)
+    end = min((loud[-1] + 1) * frame + padding, len(samples))
+    return samples[start:end]
+
+
+def _resample(samples: np.ndarray, rate: int, target_rate: int) -> np.ndarray:
+    # Linear interpolation is enough for speech recognition input
+    length = int(round(len(samples) * target_rate / rate))
+    source_positions = np.arange(len(samples))
+    positions = np.linspace(0, len(samples) - 1, length)
+    return np.stack([np.interp(positions, source_positions, samples[:, c]) for c in range(samples.shape[1])], axis=1)
+
+
+@traced("audio.prepare")
+def prepare_audio(
+    audio: AudioBuffer,
+    target_rate: Optional[int] = TARGET_SAMPLE_RATE,
+    mono: bool = True,
+    trim_silence: bool = True,
+) -> memoryview:
     """
-    Transcribe audio file using OpenAI's Whisper API.
-    
-    Args:
-        audio_file_path: Path to the audio file to transcribe
-        
-    Returns:
-        Transcribed text or None if transcription failed
+    Shrink a 16-bit PCM WAV recording before upload: down-mix to mono, resample to
+    target_rate (never up) and trim leading/trailing silence. Anything that is not
+    16-bit PCM WAV is returned unchanged.
     """
+    view = as_buffer(audio)
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        with open(audio_file_path, "rb") as audio_file:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        
-        return response.text
-    except Exception as e:
-        print(f"Error transcribing audio: {str(e)}")
-        return None
\ No newline at end of file
+        with wave.open(io.BytesIO(view)) as reader:
+            channels, width, rate = reader.getnchannels(), reader.getsampwidth(), reader.getframerate()
+            frames = reader.readframes(reader.getnframes())
+    except (wave.Error, EOFError):
+        return view
+    if width != 2:
+        return view
+
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels).astype(np.float32) / 32768.0
+    if mono and channels > 1:
+        samples = samples.mean(axis=1, keepdims=True)
+    if trim_silence:
+        samples = _trim_silence(samples, rate)
+    if target_rate and rate > target_rate:
+        samples = _resample(samples, rate, target_rate)
+        rate = target_rate
+
+    output = io.BytesIO()
+    with wave.open(output, "wb") as writer:
+        writer.setnchannels(samples.shape[1])
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return output.getbuffer().toreadonly()
+
+
+@api_retry
+def _create_transcription(audio: memoryview, model: str) -> str:
+    # A fresh file object per attempt, since a failed upload leaves the previous one consumed
+    upload = io.BytesIO(audio)
+    upload.name = "audio.wav"
+    return get_retrying_client().audio.transcriptions.create(model=model, file=upload).text
+
+
+@traced("audio.transcribe")
+def transcribe(audio: AudioBuffer, model: str = TRANSCRIPTION_MODEL, prepare: bool = True) -> str:
+    """Transcribe in-memory audio with OpenAI's Whisper API; errors are raised"""
+    view = prepare_audio(audio) if prepare else as_buffer(audio)
+    count("audio_upload_bytes", len(view))
+    return _create_transcription(view, model)
+
+
+# Traced outside the retries, so a span covers every attempt
+@traced("audio.synthesize_speech")
+@api_retry
+def synthesize_speech(text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL) -> bytes:
+    """Synthesize speech with OpenAI's TTS API and return the MP3 bytes"""
+    count("tts_characters", len(text))
+    return get_retrying_client().audio.speech.create(model=model, voice=voice, input=text).content
@@ -0,0 +1,58 @@
+"""
+Upload size and preparation time of a voice recording before transcription: the raw
+browser WAV vs. the down-mixed, resampled and silence-trimmed buffer.
+
+Run from the repository root:
+    python -m benchmarks.audio_upload [--seconds 8] [--speech-fraction 0.6] [--rate 48000] [--channels 2]
+"""
+import argparse
+import io
+import time
+import wave
+
+import numpy as np
+
+from audio_utils import prepare_audio
+
+
+def synthetic_recording(seconds: float, speech_fraction: float, rate: int, channels: int) -> bytes:
+    """Low noise with a tone burst in the middle standing in for speech"""
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 0.0005, (int(seconds * rate), channels))
+    speech = int(len(samples) * speech_fraction)
+    start = (len(samples) - speech) // 2
+    t = np.arange(speech) / rate
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    samples[start:start + speech] += tone[:, None]
+    output = io.BytesIO()
+    with wave.open(output, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=8.0)
+    parser.add_argument("--speech-fraction", type=float, default=0.6)
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    recording = synthetic_recording(args.seconds, args.speech_fraction, args.rate, args.channels)
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        prepared = prepare_audio(io.BytesIO(recording))
+    elapsed = (time.perf_counter() - start) / args.runs
+
+    print(f"{args.seconds:.0f}s recording, {args.channels} ch @ {args.rate} Hz")
+    print(f"{'raw upload':>18}: {len(recording) / 1024:9.1f} KiB")
+    print(f"{'prepared upload':>18}: {len(prepared) / 1024:9.1f} KiB ({len(recording) / len(prepared):.1f}x smaller)")
+    print(f"{'preparation time':>18}: {elapsed * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark query-time entity linking: per-concept substring checks vs. the Aho-Corasick ConceptMatcher.
+
+Run from the repository root:
+    python -m benchmarks.concept_matcher [--concepts 100000] [--queries 200]
+"""
+import argparse
+import random
+import time
+
+from concept_matcher import ConceptMatcher
+
+WORDS = [
+    "neural", "network", "gradient", "descent", "kernel", "vector", "graph", "signal", "sensor",
+    "pressure", "valve", "thermal", "model", "layer", "batch", "queue", "cache", "index", "tensor",
+    "pump", "flow", "control", "loop", "feedback", "matrix", "sparse", "dense", "linear", "spline",
+]
+
+
+def make_concepts(n: int, rng: random.Random):
+    names = set()
+    while len(names) < n:
+        names.add(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f" {len(names)}")
+    return list(names)
+
+
+def make_queries(names, count: int, rng: random.Random):
+    return [
+        f"How does {rng.choice(names)} relate to {rng.choice(names)} in a {rng.choice(WORDS)} system?"
+        for _ in range(count)
+    ]
+
+
+def substring_match(names, query):
+    # The previous query_ui lookup: lowercase and test every concept on every query
+    return [name for name in names if name.lower() in query.lower()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concepts", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = make_concepts(args.concepts, rng)
+    queries = make_queries(names, args.queries, rng)
+
+    start = time.perf_counter()
+    matcher = ConceptMatcher()
+    for name in names:
+        matcher.add(name)
+    matcher.find("")  # force the lazy failure-link build
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        substring_match(names, query)
+    substring_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    for query in queries:
+        matcher.concepts_in(query)
+    matcher_time = (time.perf_counter() - start) / len(queries)
+
+    print(f"concepts: {len(names)}  queries: {len(queries)}")
+    print(f"automaton build:         {build_time:.3f} s")
+    print(f"substring scan / query:  {substring_time * 1e3:.3f} ms")
+    print(f"aho-corasick / query:    {matcher_time * 1e3:.3f} ms  ({substring_time / matcher_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
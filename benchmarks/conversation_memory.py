@@ -0,0 +1,76 @@
+"""
+Prompt size per turn over a long interview: resending the whole history vs. the recent
+window plus a rolling summary. Summaries come from a stub summarizer on a real job queue,
+which runs between turns as it would while the expert is answering.
+
+Run from the repository root:
+    python -m benchmarks.conversation_memory [--turns 200] [--recent-tokens 1500]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from conversation_memory import RECENT_TOKENS, SUMMARY_JOB, SUMMARY_WORDS, ConversationMemory
+from jobs import JobQueue
+from tokens import count_tokens
+
+SYSTEM_MESSAGE = "You are an interface to communicate with domain experts. Ask one question at a time."
+WORDS = ["impeller", "seal", "bearing", "pressure", "flow", "housing", "vibration", "torque", "shaft",
+         "clearance", "temperature", "coupling", "alignment", "cavitation", "inspection", "tolerance"]
+
+
+def synthetic_message(rng: random.Random, role: str) -> dict:
+    words = 20 if role == "assistant" else rng.randint(40, 160)
+    return {"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(words)) + "."}
+
+
+def stub_summary(payload, progress):
+    # A summary of bounded length, as the prompt asks for
+    words = (payload["summary"] + " " + payload["text"]).split()
+    return {"summary": " ".join(words[-SUMMARY_WORDS:])}
+
+
+def prompt_tokens(messages) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--recent-tokens", type=int, default=RECENT_TOKENS)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(os.path.join(tmp, "jobs.db"), max_workers=1)
+        queue.register(SUMMARY_JOB, stub_summary)
+        memory = ConversationMemory(recent_tokens=args.recent_tokens)
+        messages = [synthetic_message(rng, "assistant")]
+        full_total = memory_total = 0
+        build_seconds = 0.0
+        print(f"{'turn':>5} {'full history':>13} {'memory':>8} {'summarized':>11}")
+        for turn in range(1, args.turns + 1):
+            messages.append(synthetic_message(rng, "user"))
+            full = prompt_tokens([{"content": SYSTEM_MESSAGE}] + messages)
+            memory.apply_finished(queue)
+            start = time.perf_counter()
+            bounded = prompt_tokens(memory.build_messages(SYSTEM_MESSAGE, messages))
+            build_seconds += time.perf_counter() - start
+            full_total += full
+            memory_total += bounded
+            messages.append(synthetic_message(rng, "assistant"))
+            if memory.maybe_summarize(queue, messages):
+                # The expert's next answer takes far longer than the summary
+                while queue.get(memory.job[0])["status"] in ("queued", "running"):
+                    time.sleep(0.001)
+            if turn in (1, 10, 25, 50, 100, 200) or turn == args.turns:
+                print(f"{turn:>5} {full:>13} {bounded:>8} {memory.summarized:>11}")
+        print(f"Total prompt tokens over {args.turns} turns: full history {full_total},"
+              f" memory {memory_total} ({memory_total / full_total:.1%});"
+              f" {build_seconds / args.turns * 1000:.2f} ms per prompt build")
+
+
+if __name__ == "__main__":
+    main()
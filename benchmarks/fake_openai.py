@@ -0,0 +1,250 @@
+"""
+Local fake OpenAI-compatible server for offline testing and benchmarks.
+
+Serves /v1/chat/completions (streaming over SSE or not), /v1/audio/transcriptions,
+/v1/audio/speech and /v1/embeddings with canned replies and configurable latency, and can
+inject errors: a share of requests fail with an HTTP error, and a share of streamed
+replies are cut off halfway. Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Run from the repository root:
+    python -m benchmarks.fake_openai [--port 8901] [--first-token-latency 0.3] [--token-delay 0.02]
+        [--audio-latency 0.2] [--error-rate 0.0] [--interrupt-rate 0.0]
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Union
+
+import numpy as np
+
+DEFAULT_REPLY = (
+    "Thanks, that is helpful. Could you describe the main components involved and how they"
+    " depend on each other? In particular, which parameters matter most in practice?"
+)
+DEFAULT_TRANSCRIPT = "The impeller is driven by the motor shaft, and the seal keeps the housing dry."
+# Roughly what MP3 at 64 kbit/s takes per character of speech
+SPEECH_BYTES_PER_CHAR = 600
+
+
+class FakeOpenAIServer:
+    """Threaded fake server; use as a context manager or call start()/stop()"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 reply: Union[str, Callable[[Dict], str]] = DEFAULT_REPLY,
+                 first_token_latency: float = 0.0, token_delay: float = 0.0,
+                 transcript: str = DEFAULT_TRANSCRIPT, audio_latency: float = 0.0,
+                 speech_bytes_per_char: int = SPEECH_BYTES_PER_CHAR,
+                 embedding_latency: float = 0.0, embedding_dim: int = 1536,
+                 error_rate: float = 0.0, error_status: int = 500,
+                 interrupt_rate: float = 0.0, seed: Optional[int] = 0):
+        # reply is the chat reply, or a function of the request body returning it
+        self.reply = reply
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+        self.transcript = transcript
+        self.audio_latency = audio_latency
+        self.speech_bytes_per_char = speech_bytes_per_char
+        self.embedding_latency = embedding_latency
+        self.embedding_dim = embedding_dim
+        # Share of requests answered with error_status, and of streamed replies cut off halfway
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.interrupt_rate = interrupt_rate
+        self.requests = 0
+        # Requests, injected errors and interruptions per endpoint
+        self.counts: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply_text(self, request: Optional[Dict] = None) -> str:
+        return self.reply(request or {}) if callable(self.reply) else self.reply
+
+    def reply_tokens(self, request: Optional[Dict] = None):
+        # Word-sized deltas, keeping the separating spaces
+        words = self.reply_text(request).split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def embedding(self, text: str) -> np.ndarray:
+        # Deterministic per text, so repeated runs see the same vectors
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.embedding_dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                server.requests += 1
+                endpoint = self.path.rstrip("/").split("/v1/", 1)[-1]
+                server._count(endpoint)
+                handlers = {
+                    "chat/completions": self._chat,
+                    "audio/transcriptions": self._transcription,
+                    "audio/speech": self._speech,
+                    "embeddings": self._embeddings,
+                }
+                if endpoint not in handlers:
+                    self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                if server._chance(server.error_rate):
+                    server._count(f"{endpoint} errors")
+                    self._json(server.error_status, {"error": {"message": "Injected error", "type": "server_error"}})
+                    return
+                # Transcriptions are multipart uploads; everything else is JSON
+                handlers[endpoint](body if endpoint == "audio/transcriptions" else json.loads(body or b"{}"))
+
+            def _chat(self, request: dict):
+                model = request.get("model", "gpt-4o")
+                tokens = server.reply_tokens(request)
+                time.sleep(server.first_token_latency)
+                if not request.get("stream"):
+                    time.sleep(server.token_delay * len(tokens))
+                    self._json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(tokens)}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+                    return
+
+                # An interrupted reply drops the connection after half of its tokens
+                cut = len(tokens) // 2 if server._chance(server.interrupt_rate) else None
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i == cut:
+                        server._count("chat/completions interrupted")
+                        self.close_connection = True
+                        return
+                    if i:
+                        time.sleep(server.token_delay)
+                    self._event({
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                    })
+                self._event({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                })
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _transcription(self, upload: bytes):
+                time.sleep(server.audio_latency)
+                # The SDK asks for JSON unless told otherwise; the upload itself isn't decoded
+                self._json(200, {"text": server.transcript})
+
+            def _speech(self, request: dict):
+                time.sleep(server.audio_latency)
+                size = max(len(request.get("input", "")) * server.speech_bytes_per_char, 1)
+                audio = b"ID3" + bytes(size - 3) if size > 3 else bytes(size)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(audio)))
+                self.end_headers()
+                self.wfile.write(audio)
+
+            def _embeddings(self, request: dict):
+                time.sleep(server.embedding_latency)
+                texts = request.get("input", [])
+                texts = [texts] if isinstance(texts, str) else texts
+                data = []
+                for index, text in enumerate(texts):
+                    vector = server.embedding(str(text))
+                    # The SDK asks for base64 float32 by default to keep responses small
+                    embedding = (base64.b64encode(vector.tobytes()).decode("ascii")
+                                 if request.get("encoding_format") == "base64" else vector.tolist())
+                    data.append({"object": "embedding", "index": index, "embedding": embedding})
+                self._json(200, {
+                    "object": "list", "data": data, "model": request.get("model", "text-embedding-3-small"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+
+            def _event(self, payload: dict):
+                self._chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--audio-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--interrupt-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(port=args.port, first_token_latency=args.first_token_latency,
+                              token_delay=args.token_delay, audio_latency=args.audio_latency,
+                              error_rate=args.error_rate, interrupt_rate=args.interrupt_rate, seed=None)
+    print(f"Fake OpenAI server on {server.base_url}")
+    try:
+        server.start()._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Parsing a streamed extraction reply: the incremental parser fed delta by delta vs.
+re-running the old fence/brace slicing and json.loads on the accumulated text after
+every delta, plus how many items each recovers when the reply is cut off part way.
+
+Run from the repository root:
+    python -m benchmarks.json_parsing [--concepts 200] [--delta-chars 8]
+"""
+import argparse
+import json
+import re
+import time
+
+from extraction_schema import ITEM_DEPTH, validate_extraction
+from json_stream import JSONStreamParser
+
+JSON_FENCE_PATTERN = re.compile(r"```json\n(.*?)\n```", re.DOTALL)
+
+
+def legacy_parse(message: str):
+    # The fence regex and first "{" / last "}" slice the extractor used before
+    match = JSON_FENCE_PATTERN.search(message)
+    if match:
+        text = match.group(1)
+    else:
+        start, end = message.find("{"), message.rfind("}")
+        if start == -1 or end == -1:
+            return None
+        text = message[start:end + 1]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def synthetic_reply(concepts: int) -> str:
+    names = [f"Component {i}" for i in range(concepts)]
+    payload = {
+        "concepts": {name: {"description": f"Part of the pump assembly number {i}", "critical": i % 3 == 0}
+                     for i, name in enumerate(names)},
+        "relationships": [{"source": names[i], "relation": "connects to", "target": names[i + 1]}
+                          for i in range(concepts - 1)],
+    }
+    return "```json\n" + json.dumps(payload, indent=2) + "\n```"
+
+
+def items(parsed) -> int:
+    extraction = validate_extraction(parsed)
+    return len(extraction.concepts) + len(extraction.relationships) if extraction else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concepts", type=int, default=200)
+    parser.add_argument("--delta-chars", type=int, default=8)
+    args = parser.parse_args()
+
+    reply = synthetic_reply(args.concepts)
+    deltas = [reply[i:i + args.delta_chars] for i in range(0, len(reply), args.delta_chars)]
+
+    start = time.perf_counter()
+    stream = JSONStreamParser(atomic_depth=ITEM_DEPTH)
+    for delta in deltas:
+        stream.feed(delta)
+    incremental_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = ""
+    for delta in deltas:
+        text += delta
+        legacy_parse(text)
+    legacy_seconds = time.perf_counter() - start
+
+    print(f"Reply: {len(reply)} chars in {len(deltas)} deltas, {items(stream.snapshot())} items")
+    print(f"{'incremental':>12}: {incremental_seconds * 1000:8.1f} ms to follow the stream")
+    print(f"{'re-parse':>12}: {legacy_seconds * 1000:8.1f} ms re-parsing after every delta")
+    print("Items recovered from a reply cut off at:")
+    for fraction in (0.25, 0.5, 0.75, 0.99):
+        cut = reply[:int(len(reply) * fraction)]
+        print(f"{fraction:>11.0%}: incremental {items(JSONStreamParser(atomic_depth=ITEM_DEPTH).feed(cut).snapshot()):5d}"
+              f"  legacy {items(legacy_parse(cut)):5d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark relationship dedup and lookup: linear list scans vs. the indexed KnowledgeBase.
+
+Run from the repository root:
+    python -m benchmarks.kb_relationships [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+import time
+
+import streamlit as st
+from knowledge_base import KnowledgeBase
+
+# Operations timed per size; the linear baseline is O(n) per op so we sample instead of filling it
+SAMPLE_OPS = 200
+
+
+def make_triples(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    concepts = max(10, n // 10)
+    return [
+        (f"concept_{rng.randrange(concepts)}", f"rel_{i % 20}", f"concept_{rng.randrange(concepts)}_{i}")
+        for i in range(n)
+    ]
+
+
+def linear_add(relationships, source, relation, target):
+    # The pre-index implementation of KnowledgeBase.add_relationship
+    rel = {"source": source, "relation": relation, "target": target}
+    if rel not in relationships:
+        relationships.append(rel)
+
+
+def linear_query(relationships, concept):
+    # The pre-index implementation of KnowledgeBase.query_relationships
+    return [rel for rel in relationships if rel["source"] == concept or rel["target"] == concept]
+
+
+def per_op(fn, args_list) -> float:
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def run(n: int) -> dict:
+    triples = make_triples(n + SAMPLE_OPS)
+    base, extra = triples[:n], triples[n:]
+    relationships = [{"source": s, "relation": r, "target": t} for s, r, t in base]
+
+    st.session_state.clear()
+    st.session_state.knowledge_base = {"concepts": {}, "relationships": relationships}
+    build_start = time.perf_counter()
+    kb = KnowledgeBase()
+    build_time = time.perf_counter() - build_start
+
+    lookups = [(s,) for s, _, _ in random.Random(1).sample(base, SAMPLE_OPS)]
+    linear_list = list(relationships)
+
+    return {
+        "triples": n,
+        "index_build_s": build_time,
+        "linear_add_us": per_op(lambda *t: linear_add(linear_list, *t), extra) * 1e6,
+        "indexed_add_us": per_op(kb.add_relationship, extra) * 1e6,
+        "linear_query_us": per_op(lambda c: linear_query(linear_list, c), lookups) * 1e6,
+        "indexed_query_us": per_op(kb.query_relationships, lookups) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'triples':>10} {'build s':>9} {'add us (lin/idx)':>22} {'query us (lin/idx)':>24}")
+    for n in args.sizes:
+        r = run(n)
+        print(
+            f"{r['triples']:>10} {r['index_build_s']:>9.3f} "
+            f"{r['linear_add_us']:>10.1f} / {r['indexed_add_us']:<9.2f} "
+            f"{r['linear_query_us']:>11.1f} / {r['indexed_query_us']:<9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Knowledge Base statistics page: what every rerun costs with one expander/json element per
+concept and one line per relationship, vs. frames built once per KB version and filtered
+and paged on each rerun. Payload is the serialized data sent to the browser.
+
+Run from the repository root:
+    python -m benchmarks.kb_stats_page [--sizes 1000 10000 100000]
+"""
+import argparse
+import json
+import random
+import time
+
+import pyarrow as pa
+import streamlit as st
+from knowledge_base import KnowledgeBase
+from knowledge_stats import PAGE_SIZES, build_stats_frames, filter_concepts
+
+ATTRIBUTES = ["type", "description", "unit", "material", "range", "manufacturer"]
+RELATIONS = [f"rel_{i}" for i in range(30)]
+
+
+def make_kb(n: int, seed: int = 0) -> KnowledgeBase:
+    rng = random.Random(seed)
+    names = [f"Concept {i}" for i in range(n)]
+    concepts = {
+        name: {attribute: f"{attribute} of {name}" for attribute in rng.sample(ATTRIBUTES, rng.randint(1, 4))}
+        for name in names
+    }
+    relationships = [
+        {"source": rng.choice(names), "relation": rng.choice(RELATIONS), "target": rng.choice(names)}
+        for _ in range(2 * n)
+    ]
+    st.session_state.clear()
+    st.session_state.knowledge_base = {"concepts": concepts, "relationships": relationships}
+    return KnowledgeBase()
+
+
+def legacy_rerun(kb: KnowledgeBase) -> int:
+    # Payload of the old page: every concept's attributes and every relationship line
+    payload = 0
+    for concept, attributes in kb.iter_concepts():
+        payload += len(concept) + len(json.dumps(attributes))
+    for rel in kb.iter_relationships():
+        payload += len(f"- {rel['source']} {rel['relation']} {rel['target']}")
+    return payload
+
+
+def paged_rerun(frames, search: str) -> int:
+    # Filter server-side, then serialize only the page, as st.dataframe does
+    matches = filter_concepts(frames, search, "type", 1)
+    page = matches.iloc[:PAGE_SIZES[1]][["concept", "attributes", "out", "in", "degree", "details"]]
+    return pa.Table.from_pandas(page).nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'concepts':>9} {'build once':>11} {'legacy rerun':>13} {'legacy payload':>15}"
+          f" {'paged rerun':>12} {'paged payload':>14}")
+    for n in args.sizes:
+        kb = make_kb(n)
+        start = time.perf_counter()
+        frames = build_stats_frames(kb)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy_payload = legacy_rerun(kb)
+        legacy_seconds = time.perf_counter() - start
+
+        searches = ["", "concept 1", "99"]
+        start = time.perf_counter()
+        paged_payload = max(paged_rerun(frames, search) for search in searches)
+        paged_seconds = (time.perf_counter() - start) / len(searches)
+
+        print(f"{n:>9} {build_seconds * 1000:>9.0f}ms {legacy_seconds * 1000:>11.0f}ms"
+              f" {legacy_payload / 1e6:>13.2f}MB {paged_seconds * 1000:>10.1f}ms {paged_payload / 1e3:>12.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Time-to-first-token of streamed chat replies vs. the old wait-then-simulate rendering,
+measured against the local fake OpenAI server.
+
+Run from the repository root:
+    python -m benchmarks.streaming_latency [--first-token-latency 0.3] [--token-delay 0.02] [--runs 5]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from llm_clients import get_openai_client, stream_chat
+
+# Per-word delay of the simulated streaming the conversation page used to do
+SIMULATED_WORD_DELAY = 0.01
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = [{"role": "user", "content": "Tell me about pumps."}]
+    with FakeOpenAIServer(first_token_latency=args.first_token_latency, token_delay=args.token_delay) as server:
+        llm_config = {"config_list": [{"model": "gpt-4o", "api_key": "sk-fake", "base_url": server.base_url}]}
+        old_first, new_first, new_total = [], [], []
+        for _ in range(args.runs):
+            # Old path: full completion, then the first simulated word after one sleep
+            start = time.perf_counter()
+            client = get_openai_client("sk-fake", server.base_url)
+            reply = client.chat.completions.create(model="gpt-4o", messages=messages).choices[0].message.content
+            old_first.append(time.perf_counter() - start + SIMULATED_WORD_DELAY)
+
+            start = time.perf_counter()
+            first = None
+            for _delta in stream_chat(messages, llm_config):
+                if first is None:
+                    first = time.perf_counter() - start
+            new_first.append(first)
+            new_total.append(time.perf_counter() - start)
+
+    words = len(reply.split())
+    print(f"reply words: {words}")
+    print(f"old first visible word: {statistics.median(old_first) * 1000:.0f} ms"
+          f" (full reply visible after +{words * SIMULATED_WORD_DELAY * 1000:.0f} ms of simulated streaming)")
+    print(f"streamed first token:   {statistics.median(new_first) * 1000:.0f} ms"
+          f" (full reply {statistics.median(new_total) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
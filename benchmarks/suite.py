@@ -0,0 +1,268 @@
+"""
+End-to-end benchmark suite, fully offline: the extraction, query and audio-turn pipelines
+run headlessly against the local fake OpenAI server (chat, transcription, speech and
+embeddings) over synthetic KBs of increasing size. Reports p50/p95 latency, throughput
+and peak traced memory per pipeline as JSON. With --baseline, a p95 more than
+--tolerance above the baseline's fails the run, so regressions show up before deploy.
+
+Run from the repository root:
+    python -m benchmarks.suite [--sizes 1000 10000 50000] [--runs 10] [--output report.json]
+        [--first-token-latency 0.05] [--token-delay 0.002] [--audio-latency 0.05]
+        [--error-rate 0.0] [--interrupt-rate 0.0] [--baseline previous.json] [--tolerance 0.25]
+"""
+import os
+import shutil
+import tempfile
+
+# The app reads these when it is imported: keep the suite's reply cache and job
+# database out of the working tree, and out of reach of the next run
+WORKDIR = tempfile.mkdtemp(prefix="kb-benchmark-")
+os.environ["RESPONSE_CACHE_DIR"] = os.path.join(WORKDIR, "response_cache")
+os.environ["JOBS_DB_PATH"] = os.path.join(WORKDIR, "jobs.db")
+
+import argparse
+import contextlib
+import json
+import random
+import re
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+from streamlit.logger import set_log_level
+from audio_utils import synthesize_speech, transcribe
+from benchmarks.audio_upload import synthetic_recording
+from benchmarks.fake_openai import DEFAULT_REPLY, FakeOpenAIServer
+from benchmarks.kb_stats_page import make_kb
+from concept_matcher import ConceptMatcher
+from conversation_memory import ConversationMemory
+from embeddings import EmbeddingIndex, make_embedding_provider
+from llm_clients import ask_agent, stream_chat
+from query_pipeline import ANALYSIS_SYSTEM_MESSAGE, ANSWER_SYSTEM_MESSAGE, run_query
+from speech_pipeline import run_voice_turn
+from utils import EXTRACTION_SYSTEM_MESSAGE, run_extraction, update_knowledge_base
+
+API_KEY = "sk-benchmark"
+CONCEPT = re.compile(r"Concept \d+")
+ASSISTANT_SYSTEM_MESSAGE = "You are an interface to communicate with domain experts. Ask one question at a time."
+ANSWER_REPLY = (
+    "Based on the knowledge base, the two concepts are connected through a shared component."
+    " The relationship holds under normal load; check the attributes listed for each."
+)
+SPEECH_REPLY = DEFAULT_REPLY + " For example, which failure modes have you seen most often in the field?"
+ATTRIBUTES = ["type", "description", "unit", "material", "range", "manufacturer"]
+
+
+def fake_reply(request: Dict) -> str:
+    """The chat reply each pipeline expects, picked by its system message"""
+    messages = request.get("messages", [])
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    names = list(dict.fromkeys(CONCEPT.findall(messages[-1]["content"] if messages else "")))
+    if system == EXTRACTION_SYSTEM_MESSAGE:
+        return json.dumps({
+            "concepts": {name: {"type": "component", "mentioned_with": len(names)} for name in names},
+            "relationships": [
+                {"source": a, "relation": "affects", "target": b} for a, b in zip(names, names[1:])
+            ],
+        })
+    if system == ANALYSIS_SYSTEM_MESSAGE:
+        return json.dumps({"concepts": names[:3], "relations": ["affects"], "attributes": {}})
+    if system == ANSWER_SYSTEM_MESSAGE:
+        return ANSWER_REPLY
+    return SPEECH_REPLY
+
+
+def synthetic_conversation(kb_concepts: int, rng: random.Random, turns: int = 12) -> str:
+    # Mostly concepts already in the KB, some new ones
+    lines = []
+    for i in range(turns):
+        a, b = (f"Concept {rng.randrange(int(kb_concepts * 1.1))}" for _ in range(2))
+        role = "user" if i % 2 else "assistant"
+        lines.append(f"{role}: When {a} runs hot, {b} wears faster; we inspect both at every shutdown.")
+    return "\n".join(lines)
+
+
+def synthetic_query(kb_concepts: int, rng: random.Random) -> str:
+    # Half name their concepts outright; the others need the analysis call
+    if rng.random() < 0.5:
+        return f"How does Concept {rng.randrange(kb_concepts)} affect Concept {rng.randrange(kb_concepts)}?"
+    return f"What should I check when the {rng.choice(ATTRIBUTES)} of a part drifts after {rng.randrange(1000)} hours?"
+
+
+def measure(name: str, run: Callable[[int], None], runs: int, warmup: int = 1, **labels) -> Dict:
+    """Time runs of run(i) and trace one more for peak memory; failed runs are counted, not timed"""
+    for i in range(warmup):
+        with contextlib.suppress(Exception):
+            run(-1 - i)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(runs):
+        run_start = time.perf_counter()
+        try:
+            run(i)
+        except Exception as e:
+            errors += 1
+            print(f"{name}: run {i} failed: {e!r}", file=sys.stderr)
+            continue
+        latencies.append(time.perf_counter() - run_start)
+    wall = time.perf_counter() - start
+
+    # Tracing slows Python code down, so memory comes from a separate run
+    tracemalloc.start()
+    with contextlib.suppress(Exception):
+        run(runs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"pipeline": name, **labels, "runs": runs, "errors": errors}
+    if latencies:
+        result.update(
+            p50_ms=round(float(np.percentile(latencies, 50)) * 1000, 1),
+            p95_ms=round(float(np.percentile(latencies, 95)) * 1000, 1),
+            mean_ms=round(statistics.fmean(latencies) * 1000, 1),
+            throughput_per_s=round(len(latencies) / wall, 2),
+        )
+    result["peak_memory_mb"] = round(peak / 1e6, 2)
+    return result
+
+
+def benchmark_kb(size: int, llm_config: Dict, runs: int) -> List[Dict]:
+    """Extraction and query runs against a KB of size concepts"""
+    kb = make_kb(size)
+    start = time.perf_counter()
+    embedding_index = EmbeddingIndex(make_embedding_provider(API_KEY))
+    embedding_index.attach(kb)
+    concept_matcher = ConceptMatcher()
+    concept_matcher.attach(kb)
+    setup_seconds = time.perf_counter() - start
+    rng = random.Random(size)
+
+    def extract(i: int):
+        # A different conversation every run, so no reply comes from the response cache
+        result = run_extraction(synthetic_conversation(size, rng), llm_config)
+        if result["stats"]["unparsed_chunks"]:
+            raise RuntimeError(f"{result['stats']['unparsed_chunks']} unparsed chunks")
+        update_knowledge_base(result, kb)
+
+    def query(i: int):
+        kb_version = kb.version
+
+        def analyze(q):
+            return ask_agent("query_analyzer", ANALYSIS_SYSTEM_MESSAGE,
+                             f"Analyze this query: '{q}'. What information should I retrieve from the knowledge base?",
+                             llm_config, cache=True)
+
+        def answer(message):
+            return ask_agent("query_assistant", ANSWER_SYSTEM_MESSAGE, message, llm_config,
+                             cache=True, kb_version=kb_version)
+
+        run_query(synthetic_query(size, rng), kb, concept_matcher, embedding_index, analyze, answer)
+
+    labels = {"kb_concepts": size}
+    results = [measure("extraction", extract, runs, **labels), measure("query", query, runs, **labels)]
+    results[0]["index_build_s"] = round(setup_seconds, 2)
+    return results
+
+
+def benchmark_audio_turn(llm_config: Dict, runs: int) -> Dict:
+    """Transcribe a recording, then stream the reply and synthesize it sentence by sentence"""
+    recording = synthetic_recording(6.0, 0.6, 48000, 2)
+    first_audio: List[float] = []
+
+    def turn(i: int):
+        history = [{"role": "user", "content": transcribe(recording)}]
+        messages = ConversationMemory().build_messages(ASSISTANT_SYSTEM_MESSAGE, history)
+        result = run_voice_turn(stream_chat(messages, llm_config, max_tokens=500), synthesize_speech)
+        if result["metrics"].get("errors"):
+            raise RuntimeError(f"{result['metrics']['errors']} segments failed")
+        if i >= 0:
+            first_audio.append(result["metrics"]["first_audio_s"])
+
+    result = measure("audio_turn", turn, runs)
+    if first_audio:
+        result["first_audio_p50_ms"] = round(float(np.percentile(first_audio, 50)) * 1000, 1)
+        result["first_audio_p95_ms"] = round(float(np.percentile(first_audio, 95)) * 1000, 1)
+    return result
+
+
+def regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Pipelines whose p95 grew by more than tolerance over the baseline report"""
+    def key(result):
+        return result["pipeline"], result.get("kb_concepts")
+
+    previous = {key(result): result for result in baseline.get("results", [])}
+    found = []
+    for result in report["results"]:
+        before = previous.get(key(result), {}).get("p95_ms")
+        if before and result.get("p95_ms", 0) > before * (1 + tolerance):
+            found.append(f"{result['pipeline']} ({result.get('kb_concepts') or '-'} concepts):"
+                         f" p95 {before} ms -> {result['p95_ms']} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--audio-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with HTTP 500")
+    parser.add_argument("--interrupt-rate", type=float, default=0.0, help="share of streamed replies cut off")
+    parser.add_argument("--baseline", help="earlier report to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    # Bare-mode session_state warnings would bury the progress lines
+    set_log_level("error")
+
+    server = FakeOpenAIServer(
+        reply=fake_reply, first_token_latency=args.first_token_latency, token_delay=args.token_delay,
+        audio_latency=args.audio_latency, embedding_dim=args.embedding_dim,
+        error_rate=args.error_rate, interrupt_rate=args.interrupt_rate,
+    )
+    # Agents print every chat to stdout, where the report goes
+    try:
+        with server, open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            # Transcription, speech and embedding clients are built from the environment
+            os.environ.update(OPENAI_API_KEY=API_KEY, OPENAI_BASE_URL=server.base_url, EMBEDDING_PROVIDER="openai")
+            llm_config = {"config_list": [{"model": "gpt-4o", "api_key": API_KEY, "base_url": server.base_url}]}
+            results = []
+            for size in args.sizes:
+                print(f"KB of {size} concepts...", file=sys.stderr)
+                results.extend(benchmark_kb(size, llm_config, args.runs))
+            print("Audio turn...", file=sys.stderr)
+            results.append(benchmark_audio_turn(llm_config, args.runs))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+        "server_requests": dict(server.counts),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+What the instrumentation costs per call: a bare function vs. the same function traced
+with tracing off and on, and KnowledgeBase.query_concept (the most frequently called
+traced method) with tracing off and on, in ns per call.
+
+Run from the repository root:
+    python -m benchmarks.tracing_overhead [--calls 1000000] [--concepts 10000]
+"""
+import argparse
+import time
+
+from benchmarks.kb_stats_page import make_kb
+from tracing import traced, tracer
+
+
+def bare(x):
+    return x
+
+
+@traced("benchmark.noop")
+def noop(x):
+    return x
+
+
+def ns_per_call(fn, arg, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(arg)
+    return (time.perf_counter() - start) * 1e9 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000000)
+    parser.add_argument("--concepts", type=int, default=10000)
+    args = parser.parse_args()
+
+    kb = make_kb(args.concepts)
+    name = f"Concept {args.concepts // 2}"
+    base = ns_per_call(bare, 0, args.calls)
+    print(f"Bare function: {base:.0f} ns per call")
+    for enabled in (False, True):
+        tracer.enabled = enabled
+        tracer.reset()
+        label = "on" if enabled else "off"
+        print(f"Traced, tracing {label}: {ns_per_call(noop, 0, args.calls) - base:+.0f} ns per call over bare")
+        print(f"kb.query_concept, tracing {label}: {ns_per_call(kb.query_concept, name, args.calls // 10):.0f} ns per call")
+    tracer.enabled = False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Time-to-first-audio of a voice reply: the old sequential flow (wait for the whole LLM
+reply, then synthesize all of it) vs. sentence-level pipelined TTS. Both backends are
+stubs with configurable latency, so no network access is needed.
+
+Run from the repository root:
+    python -m benchmarks.voice_turn [--first-token-latency 0.3] [--token-delay 0.02]
+        [--tts-latency 0.25] [--tts-per-char 0.002] [--runs 3]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fake_openai import DEFAULT_REPLY
+from speech_pipeline import run_voice_turn
+
+REPLY = (
+    DEFAULT_REPLY + " For example, a centrifugal pump depends on its impeller diameter and speed."
+    " Which failure modes have you seen most often in the field?"
+)
+
+
+def stub_llm(reply: str, first_token_latency: float, token_delay: float):
+    words = reply.split(" ")
+    time.sleep(first_token_latency)
+    for i, word in enumerate(words):
+        if i:
+            time.sleep(token_delay)
+        yield word if i == 0 else " " + word
+
+
+def stub_tts(latency: float, per_char: float):
+    def synthesize(text: str) -> bytes:
+        # Fixed request overhead plus time proportional to the text length
+        time.sleep(latency + per_char * len(text))
+        return text.encode("utf-8")
+    return synthesize
+
+
+def sequential_turn(deltas, synthesize):
+    start = time.perf_counter()
+    text = "".join(deltas)
+    synthesize(text)
+    # Playback could only start once the single TTS request finished
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.25)
+    parser.add_argument("--tts-per-char", type=float, default=0.002)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    synthesize = stub_tts(args.tts_latency, args.tts_per_char)
+    sequential, first_audio, total, segments = [], [], [], 0
+    for _ in range(args.runs):
+        sequential.append(sequential_turn(
+            stub_llm(REPLY, args.first_token_latency, args.token_delay), synthesize))
+        result = run_voice_turn(stub_llm(REPLY, args.first_token_latency, args.token_delay), synthesize)
+        first_audio.append(result["metrics"]["first_audio_s"])
+        total.append(result["metrics"]["total_s"])
+        segments = result["metrics"]["segments"]
+
+    print(f"Reply of {len(REPLY)} chars in {segments} segments, {args.runs} runs (median)")
+    print(f"{'sequential first audio':>26}: {statistics.median(sequential) * 1000:8.0f} ms")
+    print(f"{'pipelined first audio':>26}: {statistics.median(first_audio) * 1000:8.0f} ms")
+    print(f"{'pipelined all audio ready':>26}: {statistics.median(total) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
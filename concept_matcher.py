@@ -0,0 +1,168 @@
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class ConceptMatch(NamedTuple):
+    concept: str
+    start: int
+    end: int
+
+
+def concept_aliases(attributes: Dict) -> List[str]:
+    """Aliases listed in a concept's "aliases"/"alias" attribute, if the extractor produced any"""
+    if not isinstance(attributes, dict):
+        return []
+    aliases = attributes.get("aliases", attributes.get("alias", []))
+    if isinstance(aliases, str):
+        return [aliases]
+    return [alias for alias in aliases if isinstance(alias, str)] if isinstance(aliases, list) else []
+
+
+class ConceptMatcher:
+    """
+    Aho-Corasick automaton over lowercased word tokens of concept names and aliases.
+    One pass over a text finds every mentioned concept at word boundaries. New names are
+    inserted into the trie immediately; failure links are rebuilt lazily on the next search.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._children: List[Dict[str, int]] = [{}]
+        # Patterns ending exactly at a node, as (concept, length in tokens)
+        self._own: List[List[Tuple[str, int]]] = [[]]
+        self._fail: List[int] = [0]
+        # _own merged along the failure chain, filled in by _build
+        self._out: List[List[Tuple[str, int]]] = [[]]
+        self._dirty = False
+        self.concepts: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.concepts)
+
+    def attach(self, kb):
+        """Keep the automaton in step with kb's concept writes, rebuilding it if it has drifted"""
+        kb.subscribe(self.on_change)
+        if len(self) != kb.concept_count():
+            self.reset()
+            for name, attributes in kb.iter_concepts():
+                self.add(name, concept_aliases(attributes))
+
+    def on_change(self, event: str, concepts: Dict[str, Dict]):
+        if event == "clear":
+            self.reset()
+        elif event == "upsert":
+            for name, attributes in concepts.items():
+                self.add(name, concept_aliases(attributes))
+        elif event == "remove":
+            self.remove(concepts)
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def add(self, concept: str, aliases: Iterable[str] = ()):
+        """Register a concept under its own name and any aliases"""
+        with self._lock:
+            self.concepts.add(concept)
+            for surface in [concept, *aliases]:
+                tokens = [token.lower() for token in TOKEN_PATTERN.findall(surface)]
+                if not tokens:
+                    continue
+                node = 0
+                for token in tokens:
+                    child = self._children[node].get(token)
+                    if child is None:
+                        child = len(self._children)
+                        self._children.append({})
+                        self._own.append([])
+                        self._fail.append(0)
+                        self._out.append([])
+                        self._children[node][token] = child
+                    node = child
+                if (concept, len(tokens)) not in self._own[node]:
+                    self._own[node].append((concept, len(tokens)))
+                    self._dirty = True
+
+    def remove(self, concepts: Iterable[str]):
+        """Forget concepts; their trie nodes stay, but no longer match anything"""
+        with self._lock:
+            removed = set(concepts) & self.concepts
+            if not removed:
+                return
+            self.concepts -= removed
+            for node, own in enumerate(self._own):
+                if any(concept in removed for concept, _ in own):
+                    self._own[node] = [(concept, length) for concept, length in own if concept not in removed]
+            self._dirty = True
+
+    def _build(self):
+        # Breadth-first so every node's failure target is finished before its children
+        self._out[0] = list(self._own[0])
+        queue = deque()
+        for child in self._children[0].values():
+            self._fail[child] = 0
+            self._out[child] = list(self._own[child])
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for token, child in self._children[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._children[fail]:
+                    fail = self._fail[fail]
+                fail = self._children[fail].get(token, 0)
+                self._fail[child] = fail
+                self._out[child] = self._own[child] + self._out[self._fail[child]]
+                queue.append(child)
+        self._dirty = False
+
+    def find(self, text: str) -> List[ConceptMatch]:
+        """Longest non-overlapping concept mentions in text, in order of appearance"""
+        with self._lock:
+            if self._dirty:
+                self._build()
+            tokens = [(m.group().lower(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+            candidates = []
+            node = 0
+            for i, (token, _, end) in enumerate(tokens):
+                while node and token not in self._children[node]:
+                    node = self._fail[node]
+                node = self._children[node].get(token, 0)
+                for concept, length in self._out[node]:
+                    candidates.append((tokens[i - length + 1][1], end, concept))
+
+        # Prefer the earliest, then longest, mention; keep every concept sharing that span
+        candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        matches: List[ConceptMatch] = []
+        covered_until = -1
+        for start, end, concept in candidates:
+            if matches and (start, end) == (matches[-1].start, matches[-1].end):
+                if concept != matches[-1].concept:
+                    matches.append(ConceptMatch(concept, start, end))
+            elif start >= covered_until:
+                matches.append(ConceptMatch(concept, start, end))
+                covered_until = end
+        return matches
+
+    def concepts_in(self, text: str) -> List[str]:
+        """Distinct concepts mentioned in text, in order of first mention"""
+        return list(dict.fromkeys(match.concept for match in self.find(text)))
+
+    def highlight(self, text: str, marker: str = "**") -> str:
+        """Wrap each concept mention in a Markdown marker for display"""
+        parts = []
+        last = 0
+        for match in self.find(text):
+            if match.start < last:
+                continue
+            parts.append(text[last:match.start])
+            parts.append(f"{marker}{text[match.start:match.end]}{marker}")
+            last = match.end
+        parts.append(text[last:])
+        return "".join(parts)
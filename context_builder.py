@@ -0,0 +1,113 @@
+import json
+import re
+from typing import Dict, List, Set, Tuple
+from tokens import DEFAULT_MODEL, count_tokens
+
+# Token budget for the retrieved information serialized into the answer prompt
+DEFAULT_CONTEXT_BUDGET = 3000
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _words(text: str) -> Set[str]:
+    return {word.lower() for word in WORD_PATTERN.findall(text)}
+
+
+def _triple(rel: Dict) -> Tuple[str, str, str]:
+    return rel["source"], rel["relation"], rel["target"]
+
+
+def rank_relationships(query: str, relationships: List[Dict], focus: List[str]) -> List[Tuple[str, str, str]]:
+    """
+    Distinct triples, most relevant first: triples joining two focus concepts, then triples
+    whose words overlap the query, then the rest in retrieval order.
+    """
+    query_words = _words(query)
+    focus_rank = {name: i for i, name in enumerate(focus)}
+    scored = {}
+    for position, rel in enumerate(relationships):
+        triple = _triple(rel)
+        if triple in scored:
+            continue
+        endpoints = sum(1 for name in (triple[0], triple[2]) if name in focus_rank)
+        overlap = len(query_words & _words(" ".join(triple)))
+        # Earlier focus concepts were linked more confidently
+        closeness = min(focus_rank.get(triple[0], len(focus)), focus_rank.get(triple[2], len(focus)))
+        scored[triple] = (-endpoints, -overlap, closeness, position)
+    return sorted(scored, key=scored.get)
+
+
+def build_context(
+    query: str,
+    retrieved_info: Dict,
+    max_tokens: int = DEFAULT_CONTEXT_BUDGET,
+    model: str = DEFAULT_MODEL,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Pack retrieved_info into compact JSON within max_tokens.
+    Concepts come first in retrieval order, then connecting paths, then deduplicated
+    relationship triples by relevance; packing stops at the budget. Returns the context
+    string and stats comparing it with the naive indented dump of everything.
+    """
+    concepts = retrieved_info.get("concepts", {})
+    focus = list(concepts)
+    naive_tokens = count_tokens(json.dumps(retrieved_info, indent=2), model)
+
+    packed: Dict = {key: value for key, value in retrieved_info.items()
+                    if key not in ("concepts", "relationships", "paths")}
+    packed["concepts"] = {}
+    # Per-item costs are summed (plus one for the separator) rather than re-encoding the whole
+    used = count_tokens(compact_json(packed), model) + 8
+    dropped = 0
+
+    for name in focus:
+        cost = count_tokens(compact_json({name: concepts[name]}), model) + 1
+        if used + cost > max_tokens:
+            dropped += 1
+            continue
+        packed["concepts"][name] = concepts[name]
+        used += cost
+
+    included: Set[Tuple[str, str, str]] = set()
+    for path in retrieved_info.get("paths", []):
+        triples = [list(_triple(rel)) for rel in path]
+        cost = count_tokens(compact_json(triples), model) + 1
+        if used + cost > max_tokens:
+            dropped += 1
+            continue
+        packed.setdefault("paths", []).append(triples)
+        included.update(_triple(rel) for rel in path)
+        used += cost
+
+    relationships = retrieved_info.get("relationships", [])
+    ranked = rank_relationships(query, relationships, focus)
+    duplicates = len(relationships) - len(ranked)
+    facts = []
+    for triple in ranked:
+        if triple in included:
+            duplicates += 1
+            continue
+        cost = count_tokens(compact_json(list(triple)), model) + 1
+        if used + cost > max_tokens:
+            # Smaller facts further down might still fit, so keep going
+            dropped += 1
+            continue
+        facts.append(list(triple))
+        used += cost
+    # Triples are [source, relation, target] arrays instead of keyed objects
+    packed["relationships"] = facts
+
+    context = compact_json(packed)
+    context_tokens = count_tokens(context, model)
+    stats = {
+        "context_tokens": context_tokens,
+        "naive_tokens": naive_tokens,
+        "tokens_saved": max(naive_tokens - context_tokens, 0),
+        "duplicates_removed": duplicates,
+        "facts_dropped": dropped,
+    }
+    return context, stats
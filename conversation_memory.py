@@ -0,0 +1,171 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+import streamlit as st
+from jobs import JobHandler, JobQueue, get_job_queue
+from llm_clients import ask_agent, chat_settings
+from tokens import DEFAULT_MODEL, count_tokens
+
+# Tokens of recent messages sent verbatim with every turn; older ones are summarized
+RECENT_TOKENS = 1500
+# The newest message is always sent, however long, so a turn never loses its question
+MIN_RECENT_MESSAGES = 1
+# Start a background summary once this many tokens have fallen out of the recent window
+SUMMARIZE_AFTER_TOKENS = 400
+# Length the rolling summary is asked to stay under
+SUMMARY_WORDS = 250
+
+SUMMARY_JOB = "summarize"
+
+SUMMARY_SYSTEM_MESSAGE = (
+    "You maintain a running summary of an interview with a domain expert. Fold the new"
+    " part of the conversation into the current summary, keeping every technical fact,"
+    " name, number and open question, and dropping small talk. Reply with the summary only."
+)
+
+
+def transcript(messages: List[Dict]) -> str:
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def summary_message(summary: str, text: str) -> str:
+    return (
+        f"Current summary:\n\n{summary or '(empty)'}\n\n"
+        f"New part of the conversation:\n\n{text}\n\n"
+        f"Return the updated summary in at most {SUMMARY_WORDS} words."
+    )
+
+
+def summary_handler(llm_config) -> JobHandler:
+    """Job handler folding a stretch of conversation into the summary"""
+    def handle(payload: Dict, progress) -> Dict:
+        summary = ask_agent(
+            "conversation_summarizer", SUMMARY_SYSTEM_MESSAGE,
+            summary_message(payload["summary"], payload["text"]), llm_config,
+            # Same summary and text give the same reply
+            cache=True,
+        )
+        return {"summary": summary.strip()}
+    return handle
+
+
+def memory_queue(llm_config) -> JobQueue:
+    """The shared job queue, ready to run summary jobs"""
+    queue = get_job_queue()
+    queue.register(SUMMARY_JOB, summary_handler(llm_config))
+    return queue
+
+
+class ConversationMemory:
+    """
+    What of a conversation goes into each prompt: the most recent messages verbatim,
+    within a token budget, and a rolling summary of everything before them. The summary
+    is extended in the background as messages fall out of the window, so the prompt
+    stays roughly the same size however long the conversation runs.
+    """
+
+    def __init__(self, recent_tokens: int = RECENT_TOKENS, model: str = DEFAULT_MODEL):
+        self.session = uuid.uuid4().hex
+        self.recent_tokens = recent_tokens
+        self.model = model
+        self.summary = ""
+        # Messages before this index are covered by the summary
+        self.summarized = 0
+        # Running summary job and the message index it summarizes up to
+        self.job: Optional[Tuple[str, int]] = None
+        # Token count per message, filled as messages arrive
+        self._tokens: List[int] = []
+        self.last_prompt_tokens = 0
+
+    def _message_tokens(self, messages: List[Dict]) -> List[int]:
+        # Messages are only ever appended, so counts are computed once each
+        del self._tokens[len(messages):]
+        for message in messages[len(self._tokens):]:
+            self._tokens.append(count_tokens(message["content"], self.model))
+        return self._tokens
+
+    def window_start(self, messages: List[Dict]) -> int:
+        """Index of the oldest message that still fits in the recent window"""
+        tokens = self._message_tokens(messages)
+        start, used = len(messages), 0
+        while start > 0:
+            cost = tokens[start - 1]
+            if len(messages) - start >= MIN_RECENT_MESSAGES and used + cost > self.recent_tokens:
+                break
+            start -= 1
+            used += cost
+        return start
+
+    def build_messages(self, system_message: str, messages: List[Dict]) -> List[Dict]:
+        """
+        The chat messages for the next reply: the system message, the summary of earlier
+        turns and the recent window. Turns that left the window but aren't in the summary
+        yet (too few to summarize, or their summary is pending or failed) stay verbatim.
+        """
+        start = min(self.window_start(messages), self.summarized, len(messages))
+        prompt = [{"role": "system", "content": system_message}]
+        if self.summary:
+            prompt.append({"role": "system", "content": f"Summary of the conversation so far:\n{self.summary}"})
+        prompt.extend({"role": message["role"], "content": message["content"]} for message in messages[start:])
+        self.last_prompt_tokens = sum(count_tokens(message["content"], self.model) for message in prompt)
+        return prompt
+
+    def maybe_summarize(self, queue: JobQueue, messages: List[Dict],
+                        after_tokens: int = SUMMARIZE_AFTER_TOKENS) -> bool:
+        """Queue a summary of the messages that left the window, once there are enough of them"""
+        if self.job is not None:
+            return False
+        end = self.window_start(messages)
+        if end <= self.summarized or sum(self._tokens[self.summarized:end]) < after_tokens:
+            return False
+        payload = {"summary": self.summary, "text": transcript(messages[self.summarized:end]), "end": end}
+        self.job = (queue.submit(SUMMARY_JOB, payload, self.session), end)
+        return True
+
+    def apply_finished(self, queue: JobQueue) -> bool:
+        """Take the new summary if its job is done, without waiting for it"""
+        if self.job is None:
+            return False
+        job_id, end = self.job
+        job = queue.get(job_id)
+        if job is None or job["status"] in ("failed", "cancelled"):
+            # Tried again with the next turn
+            self.job = None
+            return False
+        if job["status"] not in ("done", "applied"):
+            return False
+        if job["result"]["summary"]:
+            self.summary = job["result"]["summary"]
+            self.summarized = end
+        queue.mark_applied(job_id)
+        self.job = None
+        return True
+
+    def status(self) -> str:
+        summarizing = " · summarizing in the background" if self.job else ""
+        covered = f", {self.summarized} earlier messages summarized" if self.summarized else ""
+        return f"Context: {self.last_prompt_tokens} tokens{covered}{summarizing}"
+
+
+def get_memory(llm_config=None) -> ConversationMemory:
+    """This session's memory for st.session_state.messages"""
+    memory = st.session_state.get("conversation_memory")
+    if memory is None or memory.summarized > len(st.session_state.get("messages", [])):
+        memory = st.session_state.conversation_memory = ConversationMemory(model=chat_settings(llm_config)["model"])
+    return memory
+
+
+def reset_memory():
+    """Forget the summary for a new conversation"""
+    st.session_state.pop("conversation_memory", None)
+
+
+def conversation_prompt(system_message: str, llm_config) -> List[Dict]:
+    """Messages for the next reply in this session, taking in any summary finished meanwhile"""
+    memory = get_memory(llm_config)
+    memory.apply_finished(memory_queue(llm_config))
+    return memory.build_messages(system_message, st.session_state.messages)
+
+
+def update_memory(llm_config) -> bool:
+    """After a turn: summarize in the background whatever no longer fits the window"""
+    return get_memory(llm_config).maybe_summarize(memory_queue(llm_config), st.session_state.messages)
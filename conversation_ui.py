@@ -1,11 +1,25 @@
 import streamlit as st
-import autogen
-import time
+from typing import Optional
+from concept_matcher import ConceptMatcher
+from conversation_memory import conversation_prompt, get_memory, reset_memory, update_memory
+from incremental_extraction import ExtractionCheckpoint, extraction_status_ui, reset_checkpoint
 from knowledge_base import KnowledgeBase
-from utils import extract_knowledge, update_knowledge_base
+from llm_clients import ask_agent, stream_chat
+
+ASSISTANT_SYSTEM_MESSAGE = (
+    "You are an interface to communicate with domain experts. Your goal is to"
+    " ask relevant questions to extract their knowledge about a specific domain."
+    " Ask one question at a time, focusing on technical details, processes,"
+    " relationships between concepts, and key attributes."
+)
+
+AUTO_REPLY_SYSTEM_MESSAGE = (
+    "You are an assistant that acts as a user to reply to the assistant agent."
+    " Your goal is to provide relevant responses to the assistant's questions."
+)
 
 # Conversation Manager
-def conversation_ui(kb: KnowledgeBase, llm_config):
+def conversation_ui(kb: KnowledgeBase, llm_config, concept_matcher: Optional[ConceptMatcher] = None):
     """"
     Interface for managing knowledge extraction conversations.
     """
@@ -15,40 +29,12 @@ def conversation_ui(kb: KnowledgeBase, llm_config):
     # Button to start a new conversation (always show it, not just after ending)
     if st.button("Start New Conversation"):
         st.session_state.messages = []
+        reset_checkpoint()
+        reset_memory()
         if "domain" in st.session_state:
             del st.session_state.domain 
         st.rerun()
 
-    # Create the assistant agent
-    assistant = autogen.AssistantAgent(
-        name="domain_expert_interface",
-        llm_config=llm_config,
-        system_message=(
-            "You are an interface to communicate with domain experts. Your goal is to"
-            " ask relevant questions to extract their knowledge about a specific domain."
-            " Ask one question at a time, focusing on technical details, processes,"
-            " relationships between concepts, and key attributes."
-        ),
-        code_execution_config={"use_docker": False}
-    )
-    
-    user_proxy = autogen.UserProxyAgent(
-        name="user_proxy",
-        human_input_mode="NEVER",
-        code_execution_config={"use_docker": False},
-        
-    )
-
-    auto_reply_agent = autogen.AssistantAgent(
-        name="auto_reply_agent",
-        llm_config=llm_config,
-        system_message=(
-            "You are an assistant that acts as a user to reply to the assistant agent."
-            " Your goal is to provide relevant responses to the assistant's questions."
-        ),
-        code_execution_config={"use_docker": False}
-    )
-    
     # Initialize chat history in session state if it doesn't exist
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -67,11 +53,25 @@ def conversation_ui(kb: KnowledgeBase, llm_config):
             return
         # Initialize session state variables if they don't exist
 
+    # Merge finished background extractions into the KB; polls while jobs are running
+    checkpoint, job_queue = extraction_status_ui(kb, llm_config)
+    memory = get_memory(llm_config)
+    if memory.last_prompt_tokens:
+        st.caption(memory.status())
 
     # Display chat messages from history
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+            # Known concepts are highlighted in bold
+            content = message["content"]
+            st.markdown(concept_matcher.highlight(content) if concept_matcher else content)
+    
+    # Results of an ended conversation, once its extraction jobs have landed
+    if checkpoint.ending:
+        if checkpoint.jobs:
+            st.info("Extracting knowledge in the background. You can keep using the app meanwhile.")
+        else:
+            show_extraction_results(checkpoint)
     
     # Accept user input
     if prompt := st.chat_input("Your response (type 'end' to finish the conversation)"):
@@ -79,8 +79,11 @@ def conversation_ui(kb: KnowledgeBase, llm_config):
         if not prompt or prompt.strip() == "auto":
             # Generate a response using the auto_reply_agent
             with st.spinner("Generating response..."):
-                auto_reply_agent.run(f"Respond to the assistant's last message: {st.session_state.messages[-1]['content']}", max_turns=1)
-                prompt = auto_reply_agent.last_message()["content"]
+                prompt = ask_agent(
+                    "auto_reply_agent", AUTO_REPLY_SYSTEM_MESSAGE,
+                    f"Respond to the assistant's last message: {st.session_state.messages[-1]['content']}",
+                    llm_config,
+                )
 
             if not prompt:
                 st.warning("No response generated. Please try again.")
@@ -88,68 +91,54 @@ def conversation_ui(kb: KnowledgeBase, llm_config):
    
         # Check if user wants to end the conversation
         if prompt.lower() == "end":
-            st.success("Conversation ended. Extracting knowledge...")
-            
-            # Get the conversation text
-            conversation_text = "\n".join([m["content"] for m in st.session_state.messages])
-            
-            # Extract knowledge
-            with st.spinner("Extracting knowledge from the conversation..."):
-                extraction_result = extract_knowledge(conversation_text, llm_config)
-            
-            # Update knowledge base
-            update_knowledge_base(extraction_result, kb)
-            
-            # Show extraction results
-            st.subheader("Extracted Knowledge")
-            
-            # Display concepts
-            st.write(f"Extracted {len(extraction_result.get('concepts', {}))} concepts:")
-            for concept, attributes in extraction_result.get("concepts", {}).items():
-                with st.expander(f"Concept: {concept}"):
-                    st.json(attributes)
-            
-            # Display relationships
-            st.write(f"Extracted {len(extraction_result.get('relationships', []))} relationships:")
-            for rel in extraction_result.get("relationships", []):
-                if all(k in rel for k in ["source", "relation", "target"]):
-                    st.write(f"- {rel['source']} {rel['relation']} {rel['target']}")
-            
-            return
+            # Only the messages not yet extracted in the background go into the final job
+            checkpoint.end(job_queue, st.session_state.messages)
+            st.rerun()
                 
         # Add user message to chat history
         st.session_state.messages.append({"role": "user", "content": prompt})
+        checkpoint.ending = False
         
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Generate assistant response - use a container to show real-time updates
+        # Generate assistant response - tokens are rendered as they arrive from the API
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
-            
-
-            # Get response
-            with st.spinner("Assistant is thinking..."):
-                user_proxy.initiate_chat(
-                    assistant,
-                    message=prompt,
-                    max_turns=1
-                )
-                
-                response = assistant.last_message()["content"]
-            
-            # Simulate streaming for a more interactive feel
-            for word in response.split():
-                full_response += word + " "
-                message_placeholder.markdown(full_response + "▌")
-                time.sleep(0.01)
-                
-            message_placeholder.markdown(full_response)
+            # Recent turns verbatim plus a summary of the earlier ones, so the prompt stays bounded
+            messages = conversation_prompt(ASSISTANT_SYSTEM_MESSAGE, llm_config)
+            response = st.write_stream(stream_chat(messages, llm_config))
         
         # Add assistant response to chat history
         st.session_state.messages.append({"role": "assistant", "content": response})
+        
+        # Every few turns, extract the new messages in the background so ending is quick
+        checkpoint.maybe_submit(job_queue, st.session_state.messages)
+        update_memory(llm_config)
             
         # Force a rerun to properly display the updated chat
         st.rerun()
+
+def show_extraction_results(checkpoint: ExtractionCheckpoint):
+    """Everything extracted from the conversation, and how the KB changed"""
+    if checkpoint.error:
+        st.error(f"Conversation ended. {checkpoint.error}")
+    else:
+        st.success("Conversation ended. Knowledge extracted.")
+    st.caption(checkpoint.summary())
+    extraction_result = checkpoint.result
+    
+    # Show extraction results
+    st.subheader("Extracted Knowledge")
+    
+    # Display concepts
+    st.write(f"Extracted {len(extraction_result.get('concepts', {}))} concepts:")
+    for concept, attributes in extraction_result.get("concepts", {}).items():
+        with st.expander(f"Concept: {concept}"):
+            st.json(attributes)
+    
+    # Display relationships
+    st.write(f"Extracted {len(extraction_result.get('relationships', []))} relationships:")
+    for rel in extraction_result.get("relationships", []):
+        if all(k in rel for k in ["source", "relation", "target"]):
+            st.write(f"- {rel['source']} {rel['relation']} {rel['target']}")
@@ -0,0 +1,80 @@
+import time
+import pandas as pd
+import streamlit as st
+from tracing import METRICS_HOST, METRICS_PORT, tracer
+
+
+def _trace_frame(trace) -> pd.DataFrame:
+    # Spans finish innermost first; sorted by start they read top-down like a call tree
+    spans = sorted(trace["spans"], key=lambda span: (span[2], span[1]))
+    return pd.DataFrame(
+        [("· " * depth + name, offset * 1000, seconds * 1000) for name, depth, offset, seconds in spans],
+        columns=["span", "start_ms", "duration_ms"],
+    )
+
+
+# Hidden diagnostics page, opened with ?diagnostics=<DIAGNOSTICS_TOKEN>
+def diagnostics_ui():
+    """
+    Timing spans, counters and gauges collected by the tracer for the whole server
+    process, with the latest traces per root span and the Prometheus export.
+    """
+
+    st.header("Diagnostics")
+
+    enabled = st.toggle("Tracing enabled (for the whole server)", value=tracer.enabled)
+    if enabled != tracer.enabled:
+        tracer.enabled = enabled
+        st.rerun()
+    if st.button("Reset metrics"):
+        tracer.reset()
+        st.rerun()
+    if not tracer.enabled:
+        st.info("Tracing is off. Set TRACING=1 or METRICS_PORT to trace from startup; turning it on here lasts until the server restarts.")
+
+    # Recent traces, e.g. one per rerun of the other pages
+    roots = tracer.trace_roots()
+    if roots:
+        st.subheader("Recent traces")
+        root = st.selectbox("Root span", roots, index=roots.index("rerun") if "rerun" in roots else 0)
+        traces = tracer.recent_traces(root)
+        labels = [
+            f"{time.strftime('%H:%M:%S', time.localtime(trace['start']))} · {trace['seconds'] * 1000:.1f} ms"
+            f" · {len(trace['spans'])} spans"
+            for trace in traces
+        ]
+        picked = st.selectbox("Trace", range(len(traces)), format_func=labels.__getitem__)
+        st.dataframe(
+            _trace_frame(traces[picked]), hide_index=True, use_container_width=True,
+            column_config={
+                "start_ms": st.column_config.NumberColumn(format="%.1f"),
+                "duration_ms": st.column_config.NumberColumn(format="%.2f"),
+            },
+        )
+
+    st.subheader("Spans")
+    spans = tracer.span_table()
+    if spans:
+        st.dataframe(pd.DataFrame(spans), hide_index=True, use_container_width=True)
+    else:
+        st.caption("No spans recorded yet.")
+
+    st.subheader("Counters and gauges")
+    rows = tracer.metric_rows()
+    if rows:
+        st.dataframe(
+            pd.DataFrame([{**row, "labels": ", ".join(f"{k}={v}" for k, v in row["labels"].items())} for row in rows]),
+            hide_index=True, use_container_width=True,
+        )
+    else:
+        st.caption("No counters or gauges recorded yet.")
+
+    st.subheader("Prometheus export")
+    text = tracer.prometheus_text()
+    if METRICS_PORT:
+        st.caption(f"Scraped from http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    else:
+        st.caption("Set METRICS_PORT to serve these at /metrics for Prometheus.")
+    st.download_button("Download metrics", text, file_name="metrics.txt", mime="text/plain")
+    with st.expander("Metrics text"):
+        st.code(text, language=None)
@@ -0,0 +1,284 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# A persisted index is saved this many seconds after a write, together with any writes meanwhile
+PERSIST_DELAY_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider:
+    """Turns texts into L2-normalized float32 vectors"""
+
+    # Identifies the vector space; an index persisted under another signature is discarded
+    signature = "base"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Local, deterministic hashing vectorizer over word tokens and character trigrams.
+    Needs no network access, so it is the fallback and what offline tests use.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.signature = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            yield word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                # crc32 rather than hash() so vectors are stable across processes
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += weight if (h >> 31) & 1 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API, sent in batches"""
+
+    BATCH_SIZE = 256
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "text-embedding-3-small"):
+        from llm_clients import get_openai_client
+        self.client = get_openai_client(api_key)
+        self.model = model
+        self.signature = f"openai-{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            response = self.client.embeddings.create(model=self.model, input=texts[start:start + self.BATCH_SIZE])
+            rows.extend(item.embedding for item in response.data)
+        vectors = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def make_embedding_provider(api_key: Optional[str] = None) -> EmbeddingProvider:
+    """Pick the provider from EMBEDDING_PROVIDER ("openai" or "hashing"), falling back to hashing"""
+    choice = os.getenv("EMBEDDING_PROVIDER", "openai" if api_key else "hashing")
+    if choice == "openai" and api_key:
+        return OpenAIEmbeddingProvider(api_key)
+    return HashingEmbeddingProvider()
+
+
+def concept_text(name: str, attributes: Dict) -> str:
+    """Text embedded for a concept: its name followed by its attribute values"""
+    if not isinstance(attributes, dict) or not attributes:
+        return name
+    parts = [f"{key}: {value}" for key, value in attributes.items()]
+    return f"{name}. " + "; ".join(parts)
+
+
+class EmbeddingIndex:
+    """
+    Concept vectors in one NumPy matrix, updated incrementally as concepts are written.
+    Subscribe it to a KnowledgeBase with attach(); search() does batched cosine similarity.
+    Concepts whose embedding call failed are re-embedded on the next attach().
+    """
+
+    def __init__(self, provider: EmbeddingProvider, path: Optional[str] = None):
+        self.provider = provider
+        self.path = path
+        self.names: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix: Optional[np.ndarray] = None
+        # KB version the rows were last brought up to, and concepts left behind since
+        self.version: Optional[str] = None
+        self.stale: Set[str] = set()
+        self._kb = None
+        self._lock = threading.RLock()
+        # Changed since the last save, and the timer that will save it
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        # Serializes file writes, which happen outside _lock
+        self._save_lock = threading.Lock()
+        if path:
+            if os.path.exists(path):
+                self.load(path)
+            # Whatever the timer hasn't saved yet is saved on shutdown
+            atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def attach(self, kb):
+        """Keep this index in step with kb's concept writes, catching up if it has drifted"""
+        kb.subscribe(self.on_change)
+        self._kb = kb
+        try:
+            if self.version != kb.version:
+                self.sync(kb)
+            elif self.stale:
+                self.catch_up(kb)
+        except Exception:
+            # Left as it is; the next attach() tries again
+            logger.exception("Embedding index could not catch up with the knowledge base")
+
+    def on_change(self, event: str, concepts: Dict[str, Dict]):
+        try:
+            if event == "clear":
+                self.reset()
+            elif event == "upsert" and concepts:
+                self.upsert(concepts)
+            elif event == "remove" and concepts:
+                self.remove(concepts)
+        except Exception:
+            with self._lock:
+                self.stale.update(concepts)
+                self._persist()
+            logger.exception("Embedding %d concepts failed; they are retried on the next attach", len(concepts))
+        if self._kb is not None:
+            self.version = self._kb.version
+
+    def sync(self, kb):
+        """Embed concepts kb has and the index lacks, drop rows of concepts it no longer has"""
+        version = kb.version
+        names = set(kb.concept_names())
+        with self._lock:
+            missing = names.difference(self.rows)
+            extra = [name for name in self.names if name not in names]
+        if missing:
+            self.upsert({name: attributes for name, attributes in kb.iter_concepts() if name in missing})
+        self.remove(extra)
+        with self._lock:
+            self.stale.difference_update(missing)
+        self.catch_up(kb)
+        self.version = version
+
+    def catch_up(self, kb):
+        """Re-embed the concepts whose embedding failed, as they are stored now"""
+        with self._lock:
+            names = list(self.stale)
+        if not names:
+            return
+        current = {name: kb.backend.get_concept(name) for name in names}
+        self.upsert({name: attributes for name, attributes in current.items() if attributes is not None})
+        self.remove([name for name, attributes in current.items() if attributes is None])
+        with self._lock:
+            self.stale.difference_update(names)
+
+    def reset(self):
+        with self._lock:
+            self.names, self.rows, self.matrix = [], {}, None
+            self._persist()
+
+    def upsert(self, concepts: Dict[str, Dict]):
+        """Embed the given concepts in one provider call and write their rows"""
+        if not concepts:
+            return
+        names = list(concepts)
+        vectors = self.provider.embed([concept_text(name, concepts[name]) for name in names])
+        with self._lock:
+            new_names = [name for name in names if name not in self.rows]
+            needed = len(self.names) + len(new_names)
+            if self.matrix is None:
+                self.matrix = np.zeros((max(needed, 64), vectors.shape[1]), dtype=np.float32)
+            elif needed > self.matrix.shape[0]:
+                # Grow geometrically so repeated small upserts stay amortized O(1)
+                grown = np.zeros((max(needed, self.matrix.shape[0] * 2), self.matrix.shape[1]), dtype=np.float32)
+                grown[:len(self.names)] = self.matrix[:len(self.names)]
+                self.matrix = grown
+            for name in new_names:
+                self.rows[name] = len(self.names)
+                self.names.append(name)
+            self.matrix[[self.rows[name] for name in names]] = vectors
+            self._persist()
+
+    def remove(self, names: Iterable[str]):
+        """Drop the rows of concepts that no longer exist"""
+        with self._lock:
+            removed = {name for name in names if name in self.rows}
+            if not removed:
+                return
+            keep = [i for i, name in enumerate(self.names) if name not in removed]
+            self.matrix = self.matrix[keep]
+            self.names = [self.names[i] for i in keep]
+            self.rows = {name: row for row, name in enumerate(self.names)}
+            self._persist()
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Top-k concepts by cosine similarity to the query, best first"""
+        if not self.names:
+            return []
+        # Embedded before taking the lock, so other sessions aren't held up by the API call
+        vector = self.provider.embed([query])[0]
+        with self._lock:
+            if not self.names:
+                return []
+            scores = self.matrix[:len(self.names)] @ vector
+            k = min(k, len(self.names))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.names[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+    def _persist(self):
+        # Called with _lock held: rewriting the whole file on every write would be O(N) per concept
+        if not self.path:
+            return
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(PERSIST_DELAY_SECONDS, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Save the index to its path now if it changed since the last save"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.path or not self._dirty:
+                return
+            self._dirty = False
+        self.save(self.path)
+
+    def save(self, path: str):
+        # Copied under the lock, written outside it so writes and searches carry on meanwhile
+        with self._lock:
+            size = len(self.names)
+            matrix = self.matrix[:size].copy() if self.matrix is not None else np.zeros((0, 0), dtype=np.float32)
+            names = json.dumps(self.names)
+            stale = json.dumps(sorted(self.stale))
+        with self._save_lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, matrix=matrix, names=np.array(names), signature=np.array(self.provider.signature),
+                         version=np.array(self.version or ""), stale=np.array(stale))
+            os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            if str(data["signature"]) != self.provider.signature:
+                return
+            names = json.loads(str(data["names"]))
+            matrix = data["matrix"]
+            # Files saved before versions were kept are brought up to date by the first attach()
+            version = str(data["version"]) if "version" in data.files else ""
+            stale = json.loads(str(data["stale"])) if "stale" in data.files else []
+        with self._lock:
+            self.version = version or None
+            self.stale = set(stale)
+            self.names = names
+            self.rows = {name: i for i, name in enumerate(names)}
+            self.matrix = matrix.astype(np.float32) if names else None
@@ -0,0 +1,319 @@
+import re
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from concept_matcher import concept_aliases
+from jobs import JobHandler, JobQueue, get_job_queue
+
+# MinHash signature length and LSH banding: 12 bands of 3 rows make names whose 3-grams
+# overlap by 0.6 or more (one typo in a two- or three-word name) candidates 97% of the time
+MINHASH_PERMUTATIONS = 36
+LSH_BANDS = 12
+# Candidates are merged when they differ in a single word, by one typo. Shorter words are too easily another word after one edit ("seal" / "seat", "low" / "flow")
+MIN_TYPO_WORD = 5
+# Buckets bigger than this (very short, common names) are skipped to stay sub-quadratic
+MAX_BUCKET_SIZE = 50
+# Names hashed per numpy batch when computing signatures
+SIGNATURE_BATCH = 20000
+
+MERGE_JOB = "merge_duplicates"
+
+LEADING_ARTICLE = re.compile(r"^(?:the|a|an) ")
+# Word separators; every other symbol is kept, so "C++", "C#" and ".NET" stay apart
+SEPARATORS = re.compile(r"[\s\-_]+")
+# Sentence punctuation and quotes around a name, as in 'the "Pump".'
+ENCLOSING_PUNCTUATION = re.compile(r"^[\s\"'(\[]+|[\s\"')\].,;:!?]+$")
+# Keys shorter than this aren't enough to merge a written name into a stored concept:
+# "IT" and "it", or "PRs" and "pr", are too often different things
+MIN_WRITE_KEY = 4
+DIGITS = re.compile(r"\d+")
+# "NN", "CNC", "HVAC": short all-caps names are looked up as acronyms
+ACRONYM = re.compile(r"^[A-Z]{2,6}s?$")
+ACRONYM_PREFIX = "acronym:"
+
+# Fixed coefficients so signatures are the same in every process; with a 31-bit prime
+# a * h stays within 64 bits
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0)
+_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _singular(word: str) -> str:
+    # Just enough stemming to fold English plurals of the head noun. Words ending in
+    # "-ies" or "-ews" are left alone: too many are singular ("series", "news")
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    # Stems of three letters or fewer are too often a different word ("lens" / "len")
+    if len(word) > 4 and word.endswith("s") and not word.endswith(("ss", "us", "is", "ies", "ews")):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name: str) -> str:
+    """
+    Key under which spelling variants of a concept name coincide: case, whitespace,
+    hyphens and underscores, a leading article and the plural of the last word are
+    folded away ("The Neural-Networks" -> "neural network"). Other symbols are kept.
+    """
+    key = ENCLOSING_PUNCTUATION.sub("", str(name).casefold())
+    key = LEADING_ARTICLE.sub("", SEPARATORS.sub(" ", key).strip())
+    words = key.split(" ")
+    words[-1] = _singular(words[-1])
+    return " ".join(words)
+
+
+def _initials(key: str) -> Optional[str]:
+    words = [word for word in key.split(" ") if word.isalpha()]
+    return "".join(word[0] for word in words) if 2 <= len(words) <= 6 else None
+
+
+def exact_key(name: str) -> str:
+    # Spaces are dropped too, so "Gear box" and "gearbox" coincide
+    return normalize_name(name).replace(" ", "")
+
+
+def lookup_keys(name: str) -> List[str]:
+    """Alias keys an incoming name is resolved by when reading"""
+    keys = [exact_key(name)]
+    stripped = str(name).strip()
+    if ACRONYM.match(stripped):
+        keys.append(ACRONYM_PREFIX + stripped.rstrip("s").lower())
+    return keys
+
+
+def write_keys(name: str) -> List[str]:
+    """
+    Alias keys a written name is merged into a stored concept by: only its exact key, and
+    only if that is long enough to be sure. An acronym matching some concept's initials
+    is a guess, left to the merge-duplicates job.
+    """
+    key = exact_key(name)
+    return [key] if len(key) >= MIN_WRITE_KEY else []
+
+
+def alias_keys(name: str, attributes: Optional[Dict] = None) -> List[str]:
+    """
+    Alias keys a stored concept is registered under: the normalized form of its name
+    and of each alias in its attributes, plus the initials of multi-word names so an
+    acronym like "NN" finds "Neural Network".
+    """
+    keys = []
+    for surface in [name, *concept_aliases(attributes or {})]:
+        for key in lookup_keys(surface):
+            if key not in keys:
+                keys.append(key)
+        initials = _initials(normalize_name(surface))
+        if initials and ACRONYM_PREFIX + initials not in keys:
+            keys.append(ACRONYM_PREFIX + initials)
+    return keys
+
+
+def with_alias(attributes: Dict, alias: str) -> Dict:
+    """A copy of attributes with alias added to its "aliases" list"""
+    merged = dict(attributes)
+    aliases = concept_aliases(merged)
+    if alias not in aliases:
+        merged["aliases"] = aliases + [alias]
+    return merged
+
+
+def shingles(key: str) -> Set[str]:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(max(len(padded) - 2, 1))}
+
+
+def minhash_signatures(keys: List[str]) -> np.ndarray:
+    """MinHash signature of each key's 3-gram set, one row per key"""
+    signatures = np.empty((len(keys), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    for start in range(0, len(keys), SIGNATURE_BATCH):
+        batch = keys[start:start + SIGNATURE_BATCH]
+        hashes, counts = [], []
+        for key in batch:
+            grams = shingles(key)
+            hashes.extend(zlib.crc32(gram.encode("utf-8")) for gram in grams)
+            counts.append(len(grams))
+        values = np.array(hashes, dtype=np.uint64) % np.uint64(_PRIME)
+        # (a * h + b) mod p for every permutation and 3-gram at once
+        permuted = (_A[:, None] * values[None, :] + _B[:, None]) % np.uint64(_PRIME)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        signatures[start:start + len(batch)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+    return signatures
+
+
+def candidate_pairs(keys: List[str]) -> np.ndarray:
+    """Index pairs (a < b) of keys sharing at least one LSH band bucket, one row per pair"""
+    signatures = minhash_signatures(keys)
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    found = []
+    for band in range(LSH_BANDS):
+        # One bucket id per key: the band's rows folded into a single 64-bit value
+        buckets = np.zeros(len(keys), dtype=np.uint64)
+        for row in signatures[:, band * rows:(band + 1) * rows].T:
+            buckets = buckets * np.uint64(_PRIME) + row
+        order = np.argsort(buckets, kind="stable")
+        starts = np.flatnonzero(np.diff(buckets[order], prepend=np.uint64(0)) != 0)
+        if len(order) and (not len(starts) or starts[0] != 0):
+            starts = np.concatenate(([0], starts))
+        sizes = np.diff(np.append(starts, len(order)))
+        # Buckets of the same size expand to pairs together
+        for size in np.unique(sizes[(sizes > 1) & (sizes <= MAX_BUCKET_SIZE)]):
+            members = order[starts[sizes == size][:, None] + np.arange(size)]
+            first, second = np.triu_indices(size, 1)
+            found.append(np.stack([members[:, first].ravel(), members[:, second].ravel()], axis=1))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(found), axis=1).astype(np.int64)
+    # Deduplicated as one integer per pair, much faster than rows
+    codes = np.unique(pairs[:, 0] * len(keys) + pairs[:, 1])
+    return np.stack([codes // len(keys), codes % len(keys)], axis=1)
+
+
+def _one_edit(a: str, b: str) -> bool:
+    # One substituted, inserted, deleted or transposed letter after the first, which
+    # typos rarely touch ("motor" / "rotor" are different parts)
+    if abs(len(a) - len(b)) > 1 or max(len(a), len(b)) < MIN_TYPO_WORD or a[0] != b[0]:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+
+
+def _similar(words_a: List[str], words_b: List[str]) -> bool:
+    differing = [(a, b) for a, b in zip(words_a, words_b) if a != b]
+    # Names differing in a number ("Pump 1" / "Pump 2") or in more than one word are different things
+    return (
+        len(words_a) == len(words_b) and len(differing) == 1
+        and _one_edit(*differing[0]) and not DIGITS.search(differing[0][0] + differing[0][1])
+    )
+
+
+def find_duplicate_groups(
+    names: List[str],
+    degrees: Optional[Dict[str, int]] = None,
+    progress=None,
+) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """
+    Group concept names that refer to the same thing: names sharing an alias key, plus
+    near-duplicates found by MinHash/LSH blocking on 3-grams and confirmed when they
+    differ by one typo, so only a small fraction of all pairs is ever compared. Each group is
+    keyed by its canonical name, the member with the most relationships (then the
+    first one). Returns the groups and stats.
+    """
+    start = time.perf_counter()
+    degrees = degrees or {}
+    parent = list(range(len(names)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(a: int, b: int):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    # Exact blocking on alias keys. An acronym joins the first multi-word name with those
+    # initials, but two multi-word names with the same initials are not joined
+    owners: Dict[str, int] = {}
+    acronyms: Dict[str, int] = {}
+    initials: Dict[str, int] = {}
+    for i, name in enumerate(names):
+        key = exact_key(name)
+        if key in owners:
+            union(owners[key], i)
+        else:
+            owners[key] = i
+        stripped = str(name).strip()
+        if ACRONYM.match(stripped):
+            acronym = stripped.rstrip("s").lower()
+            for known in (acronyms, initials):
+                if acronym in known:
+                    union(known[acronym], i)
+            acronyms.setdefault(acronym, i)
+        else:
+            acronym = _initials(normalize_name(name))
+            if acronym and acronym not in initials:
+                initials[acronym] = i
+                if acronym in acronyms:
+                    union(acronyms[acronym], i)
+    if progress is not None:
+        progress(0.3, "grouped exact variants")
+
+    # Fuzzy blocking on the normalized names
+    keys = [normalize_name(name) for name in names]
+    pairs = candidate_pairs(keys)
+    if progress is not None:
+        progress(0.8, f"checking {len(pairs)} candidate pairs")
+    # One typo changes the length by at most one and keeps the word count
+    lengths = np.array([len(key) for key in keys])
+    word_counts = np.array([key.count(" ") for key in keys])
+    a, b = pairs[:, 0], pairs[:, 1]
+    close = pairs[(np.abs(lengths[a] - lengths[b]) <= 1) & (word_counts[a] == word_counts[b])]
+    words = [key.split(" ") for key in keys]
+    matched = 0
+    for a, b in close.tolist():
+        if find(a) != find(b) and _similar(words[a], words[b]):
+            union(a, b)
+            matched += 1
+
+    members: Dict[int, List[int]] = {}
+    for i in range(len(names)):
+        members.setdefault(find(i), []).append(i)
+    groups = {}
+    for indexes in members.values():
+        if len(indexes) < 2:
+            continue
+        # Earliest wins ties, since indexes are in insertion order
+        best = max(indexes, key=lambda i: (degrees.get(names[i], 0), -i))
+        groups[names[best]] = [names[i] for i in indexes if i != best]
+    stats = {
+        "concepts": len(names),
+        "candidate_pairs": len(pairs),
+        "fuzzy_matches": matched,
+        "groups": len(groups),
+        "duplicates": sum(len(duplicates) for duplicates in groups.values()),
+        "seconds": time.perf_counter() - start,
+    }
+    return groups, stats
+
+
+def merge_handler() -> JobHandler:
+    """Job handler finding duplicate groups; the KB is rewritten later, on the script thread"""
+    def handle(payload: Dict, progress) -> Dict:
+        groups, stats = find_duplicate_groups(payload["names"], payload["degrees"], progress=progress)
+        return {"groups": groups, "stats": stats}
+    return handle
+
+
+def merge_queue() -> JobQueue:
+    """The shared job queue, ready to run merge-duplicates jobs"""
+    queue = get_job_queue()
+    queue.register(MERGE_JOB, merge_handler())
+    return queue
+
+
+def submit_merge(kb, queue: JobQueue, session: str = "") -> str:
+    """Queue a search for duplicate concepts across the whole KB"""
+    degrees: Dict[str, int] = {}
+    for rel in kb.iter_relationships():
+        degrees[rel["source"]] = degrees.get(rel["source"], 0) + 1
+        degrees[rel["target"]] = degrees.get(rel["target"], 0) + 1
+    return queue.submit(MERGE_JOB, {"names": kb.concept_names(), "degrees": degrees}, session)
+
+
+def iter_alias_keys(concepts: Iterable[Tuple[str, Dict]]) -> Iterable[Tuple[str, str]]:
+    """(alias key, concept) for every key of every concept"""
+    for name, attributes in concepts:
+        for key in alias_keys(name, attributes):
+            yield key, name
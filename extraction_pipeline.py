@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from tokens import DEFAULT_MODEL, count_tokens, get_encoding
+
+# Transcripts up to this many tokens go out in one extraction call
+CHUNK_TOKENS = 2000
+# Tokens repeated at the start of the next chunk, so facts spanning a boundary are seen whole
+CHUNK_OVERLAP_TOKENS = 200
+# Concurrent extraction calls
+EXTRACTION_WORKERS = 4
+
+# Chunk text -> parsed {"concepts", "relationships"} object, or None if the reply had none
+ExtractFn = Callable[[str], Optional[Dict]]
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def canonical_name(name: str) -> str:
+    """
+    Case- and whitespace-insensitive key for a concept or relation name. Punctuation is
+    kept: "C++" and "C#" are different concepts.
+    """
+    return WHITESPACE.sub(" ", str(name).casefold()).strip()
+
+
+def _split_long_line(line: str, max_tokens: int, model: str) -> List[str]:
+    encoding = get_encoding(model)
+    if encoding is None:
+        # ~4 characters per token, matching count_tokens' estimate
+        width = max_tokens * 4
+        return [line[i:i + width] for i in range(0, len(line), width)]
+    tokens = encoding.encode(line, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def split_transcript(
+    text: str,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    model: str = DEFAULT_MODEL,
+) -> List[str]:
+    """
+    Split a transcript into chunks of at most max_tokens on line (message) boundaries.
+    Each chunk starts with the trailing lines of the previous one, up to overlap_tokens.
+    """
+    lines = []
+    for line in text.splitlines():
+        cost = count_tokens(line, model)
+        if cost > max_tokens:
+            lines.extend((piece, count_tokens(piece, model)) for piece in _split_long_line(line, max_tokens, model))
+        elif line.strip():
+            lines.append((line, cost))
+
+    chunks = []
+    current: List[Tuple[str, int]] = []
+    used = 0
+    for line, cost in lines:
+        if current and used + cost > max_tokens:
+            chunks.append("\n".join(part for part, _ in current))
+            # Carry the tail of this chunk over, leaving room for the new line
+            carried: List[Tuple[str, int]] = []
+            carried_tokens = 0
+            for part, part_cost in reversed(current):
+                if carried_tokens + part_cost > min(overlap_tokens, max_tokens - cost):
+                    break
+                carried.insert(0, (part, part_cost))
+                carried_tokens += part_cost
+            current, used = carried, carried_tokens
+        current.append((line, cost))
+        used += cost
+    if current:
+        chunks.append("\n".join(part for part, _ in current))
+    return chunks
+
+
+def merge_extractions(results: List[Optional[Dict]]) -> Dict:
+    """
+    Merge per-chunk extractions in chunk order, so the outcome doesn't depend on which
+    call finished first. Concepts are deduplicated by canonical name and shown under
+    their most frequent spelling; attributes from later chunks override earlier ones.
+    Relationships are mapped onto the merged names and deduplicated.
+    """
+    spellings: Dict[str, Dict[str, int]] = {}
+    attributes: Dict[str, Dict] = {}
+
+    def register(name: str) -> str:
+        key = canonical_name(name)
+        counts = spellings.setdefault(key, {})
+        counts[name] = counts.get(name, 0) + 1
+        return key
+
+    triples: Dict[Tuple[str, str, str], str] = {}
+    for result in results:
+        if not result:
+            continue
+        concepts = result.get("concepts", {})
+        if isinstance(concepts, dict):
+            for name, attrs in concepts.items():
+                key = register(name)
+                merged = attributes.setdefault(key, {})
+                if isinstance(attrs, dict):
+                    merged.update(attrs)
+                elif isinstance(attrs, str) and attrs:
+                    merged["description"] = attrs
+        for rel in result.get("relationships", []) or []:
+            if isinstance(rel, (list, tuple)) and len(rel) == 3:
+                rel = dict(zip(("source", "relation", "target"), rel))
+            if not isinstance(rel, dict) or not all(rel.get(k) for k in ("source", "relation", "target")):
+                continue
+            key = (register(rel["source"]), canonical_name(rel["relation"]), register(rel["target"]))
+            # The first spelling of a relation label wins
+            triples.setdefault(key, str(rel["relation"]))
+
+    # Most frequent spelling, ties going to the first one seen
+    display = {key: max(counts, key=counts.get) for key, counts in spellings.items()}
+    # Names that only appear in relationships are not added as concepts
+    concepts = {display[key]: merged for key, merged in attributes.items()}
+    relationships = [
+        {"source": display[source], "relation": relation, "target": display[target]}
+        for (source, _, target), relation in triples.items()
+    ]
+    return {"concepts": concepts, "relationships": relationships}
+
+
+def run_chunked_extraction(
+    text: str,
+    extract: ExtractFn,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    max_workers: int = EXTRACTION_WORKERS,
+    model: str = DEFAULT_MODEL,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[Dict, Dict]:
+    """
+    Map-reduce extraction: extract from each chunk concurrently, then merge.
+    progress(done, total) is called from the worker threads as chunks finish.
+    Returns the merged result and stats including input throughput in tokens per second.
+    """
+    start = time.perf_counter()
+    chunks = split_transcript(text, max_tokens, overlap_tokens, model)
+    failures = []
+    done = []
+    done_lock = threading.Lock()
+
+    def safe_extract(chunk: str) -> Optional[Dict]:
+        try:
+            return extract(chunk)
+        except Exception as e:
+            failures.append(str(e))
+            return None
+        finally:
+            if progress is not None:
+                with done_lock:
+                    done.append(chunk)
+                    progress(len(done), len(chunks))
+
+    if len(chunks) <= 1:
+        results = [safe_extract(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # map() yields in submission order, whatever order the calls finish in
+            results = list(pool.map(safe_extract, chunks))
+
+    merged = merge_extractions(results)
+    seconds = time.perf_counter() - start
+    input_tokens = count_tokens(text, model)
+    stats = {
+        "chunks": len(chunks),
+        "failed_chunks": sum(1 for result in results if result is None),
+        "errors": failures,
+        "input_tokens": input_tokens,
+        "seconds": seconds,
+        "tokens_per_second": input_tokens / seconds if seconds > 0 else 0.0,
+    }
+    return merged, stats
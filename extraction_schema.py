@@ -0,0 +1,106 @@
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator, model_validator
+
+# Chat completions JSON mode: the reply is always a single JSON object. Concepts are keyed
+# by free-form names, which strict json_schema outputs can't express
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+RELATIONSHIP_FIELDS = ("source", "relation", "target")
+# Depth of a concept's attributes and of each relationship in the reply object; a streamed
+# reply is only parsed up to the items that have closed at this depth
+ITEM_DEPTH = 3
+
+
+class Relationship(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    source: str
+    relation: str
+    target: str
+
+    @model_validator(mode="before")
+    @classmethod
+    def from_triple(cls, value: Any) -> Any:
+        # ["Pump", "has", "Seal"] is as good as the object form
+        if isinstance(value, (list, tuple)) and len(value) == 3:
+            return dict(zip(RELATIONSHIP_FIELDS, value))
+        return value
+
+    @field_validator("source", "relation", "target")
+    @classmethod
+    def not_empty(cls, value: str) -> str:
+        if not value:
+            raise ValueError("must not be empty")
+        return value
+
+
+class Extraction(BaseModel):
+    """
+    Validated extraction reply. Anything malformed is dropped item by item rather than
+    failing the whole reply: a concept given as a bare string becomes its description,
+    a list of names becomes concepts without attributes, and invalid relationships are
+    skipped and counted in `dropped`.
+    """
+
+    concepts: Dict[str, Dict[str, Any]] = {}
+    relationships: List[Relationship] = []
+    dropped: int = 0
+
+    @model_validator(mode="before")
+    @classmethod
+    def tolerate(cls, value: Any) -> Any:
+        if not isinstance(value, dict):
+            return value
+        dropped = 0
+        concepts = value.get("concepts") or {}
+        if isinstance(concepts, list):
+            # ["Pump", {"name": "Seal", ...}] -> {"Pump": {}, "Seal": {...}}
+            as_dict = {}
+            for item in concepts:
+                if isinstance(item, str) and item.strip():
+                    as_dict[item] = {}
+                elif isinstance(item, dict) and isinstance(item.get("name"), str) and item["name"].strip():
+                    as_dict[item["name"]] = {k: v for k, v in item.items() if k != "name"}
+                else:
+                    dropped += 1
+            concepts = as_dict
+        elif not isinstance(concepts, dict):
+            dropped += 1
+            concepts = {}
+        cleaned = {}
+        for name, attrs in concepts.items():
+            name = str(name).strip()
+            if not name:
+                dropped += 1
+            elif isinstance(attrs, dict):
+                cleaned[name] = attrs
+            elif attrs in (None, ""):
+                cleaned[name] = {}
+            else:
+                cleaned[name] = {"description": attrs if isinstance(attrs, str) else str(attrs)}
+
+        relationships = []
+        raw = value.get("relationships") or []
+        for item in raw if isinstance(raw, list) else []:
+            try:
+                relationships.append(Relationship.model_validate(item))
+            except ValidationError:
+                dropped += 1
+        return {"concepts": cleaned, "relationships": relationships, "dropped": dropped}
+
+    def to_result(self) -> Dict:
+        """The plain {"concepts", "relationships"} dict the rest of the pipeline works with"""
+        return {
+            "concepts": self.concepts,
+            "relationships": [rel.model_dump() for rel in self.relationships],
+        }
+
+
+def validate_extraction(value: Any) -> Optional[Extraction]:
+    """The validated extraction, or None if value is not an extraction-shaped JSON object"""
+    if not isinstance(value, dict):
+        return None
+    try:
+        return Extraction.model_validate(value)
+    except ValidationError:
+        return None
@@ -0,0 +1,201 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+import streamlit as st
+from extraction_pipeline import merge_extractions
+from jobs import JobHandler, JobQueue, get_job_queue
+from knowledge_base import KnowledgeBase
+from utils import run_extraction, update_knowledge_base
+
+# Already-extracted messages shown to the extractor so references in the new ones resolve
+CONTEXT_MESSAGES = 4
+# Extract in the background once this many messages (user + assistant) are unprocessed
+BACKGROUND_EVERY_MESSAGES = 6
+# How often the page checks on running extraction jobs
+POLL_SECONDS = 1.0
+
+EXTRACTION_JOB = "extract"
+
+
+def conversation_text(messages: List[Dict]) -> str:
+    return "\n".join(message["content"] for message in messages)
+
+
+def _add_counts(total: Dict[str, int], counts: Dict[str, int]):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+
+def extraction_handler(llm_config) -> JobHandler:
+    """Job handler running the chunked extraction; the KB is written later, on the script thread"""
+    def handle(payload: Dict, progress) -> Dict:
+        return run_extraction(
+            payload["text"], llm_config, payload.get("context", ""),
+            progress=lambda done, total: progress(done / total, f"{done} of {total} chunks"),
+        )
+    return handle
+
+
+def extraction_queue(llm_config) -> JobQueue:
+    """The shared job queue, ready to run extraction jobs"""
+    queue = get_job_queue()
+    queue.register(EXTRACTION_JOB, extraction_handler(llm_config))
+    return queue
+
+
+class ExtractionCheckpoint:
+    """
+    Extraction progress through one conversation: messages before `index` are already
+    in the KB, and `result` is everything extracted from them so far. Extraction runs
+    as background jobs, which are applied to the KB in the order they were submitted.
+    """
+
+    def __init__(self, session: Optional[str] = None):
+        self.session = session or uuid.uuid4().hex
+        self.index = 0
+        self.result: Dict = {"concepts": {}, "relationships": []}
+        self.counts: Dict[str, int] = {}
+        self.stats: Optional[Dict] = None
+        self.errors: List[str] = []
+        # Why the last job failed, until a later job extracts the messages it was given
+        self.error: Optional[str] = None
+        # Submitted jobs not applied yet, oldest first, with the message index each one extracts up to
+        self.jobs: List[Tuple[str, int]] = []
+        # Set when the conversation is ended; the final job's size is shown in the summary
+        self.ending = False
+        self.final_messages = 0
+
+    @property
+    def submitted(self) -> int:
+        return self.jobs[-1][1] if self.jobs else self.index
+
+    def submit(self, queue: JobQueue, messages: List[Dict]) -> bool:
+        """Queue extraction of the messages no job covers yet"""
+        start = self.submitted
+        if len(messages) <= start:
+            return False
+        payload = {
+            "text": conversation_text(messages[start:]),
+            "context": conversation_text(messages[max(start - CONTEXT_MESSAGES, 0):start]),
+            "start": start,
+            "end": len(messages),
+        }
+        self.jobs.append((queue.submit(EXTRACTION_JOB, payload, self.session), len(messages)))
+        return True
+
+    def maybe_submit(self, queue: JobQueue, messages: List[Dict], every: int = BACKGROUND_EVERY_MESSAGES) -> bool:
+        """Queue a background extraction once `every` messages are unprocessed and none is running"""
+        if self.jobs or len(messages) - self.index < every:
+            return False
+        return self.submit(queue, messages)
+
+    def end(self, queue: JobQueue, messages: List[Dict]):
+        """Queue extraction of whatever is left; the page shows the results once it lands"""
+        self.final_messages = len(messages) - self.submitted
+        self.submit(queue, messages)
+        self.ending = True
+
+    def apply_finished(self, queue: JobQueue, kb: KnowledgeBase) -> bool:
+        """Merge finished jobs into kb in submission order, without waiting for running ones"""
+        applied = False
+        while self.jobs:
+            job_id, end = self.jobs[0]
+            job = queue.get(job_id)
+            if job is None or job["status"] in ("failed", "cancelled"):
+                self.error = f"Knowledge extraction failed: {job['error'] if job else 'job lost'}"
+                # Later jobs would skip these messages, so drop them; the next submission covers the gap
+                for later_id, _ in self.jobs[1:]:
+                    queue.cancel(later_id)
+                self.jobs = []
+                break
+            if job["status"] not in ("done", "applied"):
+                break
+            result = job["result"]
+            if result["stats"].get("unparsed_chunks"):
+                self.errors.append("Error parsing JSON from extraction agent")
+            if result["stats"].get("partial_chunks"):
+                self.errors.append(
+                    f"{result['stats']['partial_chunks']} extraction replies were cut off; kept their complete items"
+                )
+            _add_counts(self.counts, update_knowledge_base(result, kb))
+            self.result = merge_extractions([self.result, result])
+            self.stats = result["stats"]
+            self.index = end
+            self.error = None
+            queue.mark_applied(job_id)
+            self.jobs.pop(0)
+            applied = True
+        return applied
+
+    def progress(self, queue: JobQueue) -> Tuple[float, str]:
+        """Progress of the oldest unfinished job"""
+        job = queue.get(self.jobs[0][0]) if self.jobs else None
+        if job is None:
+            return 1.0, ""
+        if job["status"] == "queued":
+            return 0.0, "waiting for a worker"
+        return job["progress"], job["message"]
+
+    def summary(self) -> str:
+        """KB changes over the whole conversation and the cost of the final step"""
+        counts = self.counts
+        text = (
+            f"Knowledge base: {counts.get('concepts_inserted', 0)} new / {counts.get('concepts_updated', 0)}"
+            f" updated concepts, {counts.get('relationships_inserted', 0)} new relationships ·"
+            f" {self.final_messages} messages left to extract at the end"
+        )
+        if self.final_messages and self.stats:
+            text += f" ({self.stats['chunks']} chunks at {self.stats['tokens_per_second']:.0f} tokens/s)"
+        return text
+
+    def status(self, total: int) -> str:
+        running = " · extracting in the background" if self.jobs else ""
+        return f"Knowledge extracted from {self.index} of {total} messages{running}"
+
+
+def apply_extraction_jobs(kb: KnowledgeBase, llm_config):
+    """Merge this session's finished extraction jobs into kb, whichever page is shown"""
+    checkpoint = st.session_state.get("extraction_checkpoint")
+    if checkpoint is not None and checkpoint.jobs:
+        checkpoint.apply_finished(extraction_queue(llm_config), kb)
+
+
+def get_checkpoint() -> ExtractionCheckpoint:
+    """This session's checkpoint for st.session_state.messages"""
+    checkpoint = st.session_state.get("extraction_checkpoint")
+    if checkpoint is None or checkpoint.index > len(st.session_state.get("messages", [])):
+        checkpoint = st.session_state.extraction_checkpoint = ExtractionCheckpoint()
+    return checkpoint
+
+
+def reset_checkpoint():
+    """Start over for a new conversation; jobs for the old one finish but are never applied"""
+    st.session_state.extraction_checkpoint = ExtractionCheckpoint()
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def _poll_extraction(kb: KnowledgeBase, queue: JobQueue):
+    # Reruns on its own every POLL_SECONDS, so the page never blocks on a job
+    checkpoint = get_checkpoint()
+    if checkpoint.apply_finished(queue, kb) and not checkpoint.jobs:
+        # Everything has landed: rerun the page to show it and stop polling
+        st.rerun()
+    fraction, message = checkpoint.progress(queue)
+    st.progress(fraction, text=f"{checkpoint.status(len(st.session_state.messages))} ({message})")
+
+
+def extraction_status_ui(kb: KnowledgeBase, llm_config) -> Tuple[ExtractionCheckpoint, JobQueue]:
+    """Apply finished extraction jobs and show progress; polls in a fragment while jobs run"""
+    queue = extraction_queue(llm_config)
+    checkpoint = get_checkpoint()
+    checkpoint.apply_finished(queue, kb)
+    for error in checkpoint.errors:
+        st.error(error)
+    checkpoint.errors.clear()
+    if checkpoint.error and not checkpoint.ending:
+        # An ended conversation shows it with its results instead
+        st.error(checkpoint.error)
+    if checkpoint.jobs:
+        _poll_extraction(kb, queue)
+    else:
+        st.caption(checkpoint.status(len(st.session_state.messages)))
+    return checkpoint, queue
@@ -0,0 +1,186 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Set
+
+# Job table location and how many jobs run at once across all sessions
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs older than this are deleted when the queue starts
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Lifecycle: queued -> running -> done -> applied, or failed/cancelled
+ACTIVE_STATUSES = ("queued", "running")
+# Error of jobs a restart cut off
+INTERRUPTED_ERROR = "Interrupted by a server restart"
+
+# (payload, progress) -> JSON-serializable result; progress(fraction, message) reports how far it got
+ProgressFn = Callable[[float, str], None]
+JobHandler = Callable[[Dict, ProgressFn], Dict]
+
+
+class JobQueue:
+    """
+    Background jobs on a bounded thread pool. Every job's state lives in a SQLite table,
+    so it outlives reruns and page changes and can be polled without blocking. Results are
+    applied by the session that submitted the job, which a restart ends, so jobs a restart
+    cut off are marked failed rather than run again.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            session TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT NOT NULL DEFAULT '',
+            payload TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session, created);
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, max_workers: int = JOB_WORKERS):
+        self.path = path
+        self.max_workers = max_workers
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._handlers: Dict[str, JobHandler] = {}
+        # Jobs handed to the pool by this process
+        self._scheduled: Set[str] = set()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+            # No session is left to apply whatever was queued or running when the last process stopped
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE status IN (?, ?)",
+                (INTERRUPTED_ERROR, time.time(), *ACTIVE_STATUSES),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated < ?",
+                (*ACTIVE_STATUSES, time.time() - JOB_RETENTION_SECONDS),
+            )
+
+    def register(self, kind: str, handler: JobHandler):
+        """Set the handler for a kind of job and start any jobs of that kind submitted before it"""
+        with self._lock:
+            self._handlers[kind] = handler
+            queued = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND status = 'queued' ORDER BY created", (kind,)
+            )]
+        for job_id in queued:
+            self._schedule(job_id)
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+        self._pool.submit(self._run, job_id)
+
+    def submit(self, kind: str, payload: Dict, session: str = "") -> str:
+        """Queue a job and return its id; it starts as soon as a worker is free"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, session, status, payload, created, updated)"
+                " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, session, json.dumps(payload), now, now),
+            )
+            registered = kind in self._handlers
+        if registered:
+            self._schedule(job_id)
+        return job_id
+
+    def _update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _run(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, payload FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+            ).fetchone()
+            if row is None:
+                # Cancelled (or deleted) while waiting for a worker
+                self._scheduled.discard(job_id)
+                return
+            kind, payload = row
+            handler = self._handlers[kind]
+            self._update(job_id, status="running")
+
+        def progress(fraction: float, message: str = ""):
+            self._update(job_id, progress=min(max(fraction, 0.0), 1.0), message=message)
+
+        try:
+            result = handler(json.loads(payload), progress)
+            self._update(job_id, status="done", progress=1.0, result=json.dumps(result, default=str))
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
+
+    @staticmethod
+    def _row(row) -> Dict:
+        job_id, kind, session, status, progress, message, result, error, created, updated = row
+        return {
+            "id": job_id, "kind": kind, "session": session, "status": status, "progress": progress,
+            "message": message, "result": json.loads(result) if result else None, "error": error,
+            "created": created, "updated": updated,
+        }
+
+    _COLUMNS = "id, kind, session, status, progress, message, result, error, created, updated"
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def jobs(self, session: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Most recent jobs first, optionally only one session's"""
+        query = f"SELECT {self._COLUMNS} FROM jobs"
+        params: tuple = ()
+        if session is not None:
+            query += " WHERE session = ?"
+            params = (session,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def mark_applied(self, job_id: str):
+        """Record that a finished job's result has been written where it belongs"""
+        self._update(job_id, status="applied")
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount > 0
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+@lru_cache(maxsize=None)
+def get_job_queue(path: str = JOBS_DB_PATH, max_workers: int = JOB_WORKERS) -> JobQueue:
+    """Process-wide queue per table and worker count, shared by every session"""
+    return JobQueue(path, max_workers)
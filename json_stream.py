@@ -0,0 +1,134 @@
+import json
+from typing import Any, List, Optional
+
+# Characters that can make up a number or a true/false/null literal
+SCALAR_CHARS = frozenset("0123456789+-.eEtrufalsn")
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONStreamParser:
+    """
+    Incremental parser for the first JSON object in a (possibly streamed) LLM reply.
+    feed() scans each delta once, tracking nesting and the last point where the text
+    could be cut and closed into valid JSON, so snapshot() can return everything
+    complete so far before the reply ends, or after it was cut off. Text before the
+    opening "{" (prose, a ```json fence) and after the closing "}" is ignored; a "{"
+    in prose that turns out not to start JSON is skipped and the scan resumes after it.
+
+    Containers nested atomic_depth deep or deeper (the root is depth 1) only show up in
+    snapshots once closed, so a half-streamed item is left out rather than returned
+    with its attributes missing.
+    """
+
+    def __init__(self, atomic_depth: Optional[int] = None):
+        self.atomic_depth = atomic_depth
+        self._parts: List[str] = []
+        self._length = 0
+        self._reset()
+
+    def _reset(self):
+        # Offset of the root "{" in the full text, once seen
+        self._root: Optional[int] = None
+        # Open containers as [opener, state]; state is "key", "colon", "value" or "comma"
+        self._stack: List[List[str]] = []
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._in_scalar = False
+        # Cutting the text here and appending the closers gives valid JSON
+        self._safe_end = 0
+        self._safe_closers = ""
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _mark_safe(self, end: int):
+        if self.atomic_depth is not None and len(self._stack) >= self.atomic_depth:
+            # Inside an item that is taken whole or not at all
+            return
+        self._safe_end = end
+        self._safe_closers = "".join(CLOSERS[opener] for opener, _ in reversed(self._stack))
+
+    def _value_done(self, end: int):
+        # A value ended at `end`: its container now expects a separator
+        if self._stack:
+            self._stack[-1][1] = "comma"
+            self._mark_safe(end)
+        else:
+            self.complete = True
+            self._mark_safe(end)
+
+    def feed(self, delta: str) -> "JSONStreamParser":
+        offset = self._length
+        self._parts.append(delta)
+        self._length += len(delta)
+        while not self.complete and not self._scan(delta, offset):
+            # Not JSON after all: look for the next "{" after the one we took for the root
+            offset = self._root + 1
+            delta = self.text[offset:]
+            self._reset()
+        return self
+
+    def _scan(self, delta: str, offset: int) -> bool:
+        """Advance over delta, which starts at offset; False if the text since the root is not JSON"""
+        for i, char in enumerate(delta, offset):
+            if self._root is None:
+                if char == "{":
+                    self._root = i
+                    self._stack.append(["{", "key"])
+                    self._mark_safe(i + 1)
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1][1] = "colon"
+                    else:
+                        self._value_done(i + 1)
+                continue
+            if self._in_scalar:
+                if char in SCALAR_CHARS:
+                    continue
+                self._in_scalar = False
+                self._value_done(i)
+            if char in " \t\r\n":
+                continue
+            state = self._stack[-1][1]
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = state == "key"
+            elif char in "{[":
+                self._stack.append([char, "key" if char == "{" else "value"])
+                self._mark_safe(i + 1)
+            elif char in "}]":
+                if CLOSERS[self._stack[-1][0]] != char:
+                    return False
+                self._stack.pop()
+                self._value_done(i + 1)
+            elif char == ",":
+                self._stack[-1][1] = "key" if self._stack[-1][0] == "{" else "value"
+            elif char == ":":
+                self._stack[-1][1] = "value"
+            elif char in SCALAR_CHARS and state == "value":
+                self._in_scalar = True
+            else:
+                return False
+            if self.complete:
+                break
+        return True
+
+    def snapshot(self) -> Optional[Any]:
+        """The JSON value parsed so far, with unfinished trailing items dropped; None if there is none"""
+        if self._root is None:
+            return None
+        text = self.text[self._root:self._safe_end] + self._safe_closers
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
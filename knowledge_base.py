@@ -1,54 +1,434 @@
-import json
-import streamlit as st
-from typing import Dict, List, Optional
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from concept_matcher import concept_aliases
+from entity_resolution import alias_keys, lookup_keys, with_alias, write_keys
+from storage import StorageBackend, SessionStateBackend
+from tracing import traced
 
-# Knowledge Base Storage using Streamlit's session_state for browser storage
+# Traversal limits so hub concepts can't blow up a result
+DEFAULT_MAX_DEGREE = 50
+DEFAULT_MAX_RELATIONSHIPS = 200
+DEFAULT_MAX_DEPTH = 6
+
+logger = logging.getLogger(__name__)
+
+
+# Called with ("upsert", {name: attributes}) after concept writes, ("remove", {name: attributes})
+# when duplicates are merged away and ("clear", {}) on import
+ChangeListener = Callable[[str, Dict[str, Dict]], None]
+
+
+def _as_dict(attributes) -> Dict:
+    # Legacy imports may hold other values than attribute dicts; those have nothing to merge
+    return attributes if isinstance(attributes, dict) else {}
+
+
+# Knowledge Base facade over a pluggable storage backend (session_state by default)
 class KnowledgeBase:
-    def __init__(self):
-        # Initialize knowledge base in session state if it doesn't exist
-        if "knowledge_base" not in st.session_state:
-            st.session_state.knowledge_base = {"concepts": {}, "relationships": []}
-        self.data = st.session_state.knowledge_base
-    
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend if backend is not None else SessionStateBackend()
+        self._listeners: List[ChangeListener] = []
+        # Notifications held back while this thread is inside batch()
+        self._local = threading.local()
+
+    def subscribe(self, listener: ChangeListener):
+        """Register a callback for concept changes, e.g. to keep a derived index up to date"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _notify(self, event: str, concepts: Dict[str, Dict]):
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            # Listeners may call APIs or write files; not while the transaction holds the store
+            pending.append((event, concepts))
+            return
+        for listener in self._listeners:
+            # The write is already committed: a failing derived index must catch up on its
+            # own rather than fail the write, or callers would retry work that succeeded
+            try:
+                listener(event, concepts)
+            except Exception:
+                logger.exception("Knowledge base listener failed on %s of %d concepts", event, len(concepts))
+
+    @property
+    def data(self) -> Dict:
+        """The knowledge base in the export JSON shape (materialized for non-session backends)"""
+        return self.backend.export()
+
     def save_data(self):
-        # Data is already stored in session_state, no need to write to file
-        st.session_state.knowledge_base = self.data
-    
+        # Writes are applied incrementally by the backend; this only flushes anything pending
+        self.backend.flush()
+
+    @property
+    def version(self) -> str:
+        """Changes whenever the contents do; cached answers derived from the KB are keyed on it"""
+        store_id, counter = self.backend.version()
+        return f"{store_id}:{counter}"
+
+    def _resolve_stored(self, name: str, keys: Callable[[str], List[str]] = lookup_keys) -> Optional[str]:
+        if self.backend.get_concept(name) is not None:
+            return name
+        for key in keys(name):
+            concept = self.backend.concept_for_alias(key)
+            if concept is not None:
+                return concept
+        return None
+
+    def resolve(self, name: str) -> str:
+        """
+        The stored concept a name refers to: the name itself if it is stored, otherwise
+        the concept it is a spelling variant, plural, alias or acronym of. Unknown
+        names come back unchanged.
+        """
+        return self._resolve_stored(name) or name
+
+    def _resolve_write(self, name: str) -> str:
+        # Writes only follow exact normalized names and explicit aliases, never acronyms
+        return self._resolve_stored(name, write_keys) or name
+
+    @traced("kb.add_concept")
     def add_concept(self, name: str, attributes: Dict):
-        """Add or update a concept in the knowledge base"""
-        self.data["concepts"][name] = attributes
-        self.save_data()
-    
+        """Add or update a concept in the knowledge base; a variant of a stored concept updates that one"""
+        with self.batch():
+            # Anything but an attribute dict is stored as given, under the name given
+            canonical = self._resolve_write(name) if isinstance(attributes, dict) else name
+            if canonical != name:
+                attributes = with_alias({**_as_dict(self.backend.get_concept(canonical)), **attributes}, name)
+            self.backend.put_concept(canonical, attributes)
+            self.backend.bump_version()
+        self._notify("upsert", {canonical: attributes})
+
+    # Not traced: it runs once per edge, where even a disabled span adds up
     def add_relationship(self, source: str, relation: str, target: str):
         """Add a relationship between concepts"""
-        rel = {"source": source, "relation": relation, "target": target}
-        if rel not in self.data["relationships"]:
-            self.data["relationships"].append(rel)
-            self.save_data()
-    
+        with self.batch():
+            if self.backend.add_relationship(self._resolve_write(source), relation, self._resolve_write(target)):
+                self.backend.bump_version()
+
+    @contextmanager
+    def batch(self):
+        """
+        Apply every write inside the block as one backend transaction. Listeners hear
+        of the changes once it has committed, and not at all if it rolls back.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            with self.backend.transaction():
+                yield self
+            return
+        pending = self._local.pending = []
+        try:
+            with self.backend.transaction():
+                yield self
+        finally:
+            self._local.pending = None
+        for event, concepts in pending:
+            self._notify(event, concepts)
+
+    @traced("kb.bulk_upsert")
+    def bulk_upsert(self, concepts: Dict[str, Dict], relationships: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Upsert concepts and relationships in one transaction.
+        Names are resolved to stored concepts first, and variants of one new name within
+        the batch are folded into the first, keeping the others as its aliases.
+        Returns counts of inserted, updated and unchanged concepts and relationships.
+        """
+        counts = {
+            "concepts_inserted": 0, "concepts_updated": 0, "concepts_unchanged": 0,
+            "relationships_inserted": 0, "relationships_unchanged": 0,
+        }
+        resolved: Dict[str, str] = {}
+        # Alias keys of names first seen in this batch
+        pending: Dict[str, str] = {}
+
+        def resolve(name: str) -> str:
+            if name not in resolved:
+                canonical = self._resolve_stored(name, write_keys)
+                if canonical is None:
+                    canonical = next((pending[key] for key in write_keys(name) if key in pending), name)
+                    if canonical == name:
+                        for key in alias_keys(name):
+                            pending.setdefault(key, name)
+                resolved[name] = canonical
+            return resolved[name]
+
+        with self.batch():
+            incoming: Dict[str, Dict] = {}
+            for name, attributes in concepts.items():
+                canonical = resolve(name) if isinstance(attributes, dict) else name
+                if canonical != name:
+                    base = incoming.get(canonical) or self.backend.get_concept(canonical)
+                    attributes = with_alias({**_as_dict(base), **attributes}, name)
+                elif isinstance(attributes, dict) and isinstance(incoming.get(canonical), dict):
+                    # A variant seen earlier in the batch was merged in already
+                    attributes = {**incoming[canonical], **attributes}
+                incoming[canonical] = attributes
+
+            # Dedup the incoming triples as a set before touching the store
+            triples = list(dict.fromkeys(
+                (resolve(rel["source"]), rel["relation"], resolve(rel["target"]))
+                for rel in relationships
+                if isinstance(rel, dict) and all(k in rel for k in ["source", "relation", "target"])
+                # "NN is a Neural Network" says nothing once both are one concept
+                and (rel["source"] == rel["target"] or resolve(rel["source"]) != resolve(rel["target"]))
+            ))
+
+            changed = []
+            for name, attributes in incoming.items():
+                previous = self.backend.get_concept(name)
+                if previous is None:
+                    counts["concepts_inserted"] += 1
+                elif previous == attributes:
+                    counts["concepts_unchanged"] += 1
+                    continue
+                else:
+                    counts["concepts_updated"] += 1
+                changed.append((name, attributes))
+            self.backend.put_concepts(changed)
+
+            inserted = self.backend.add_relationships(triples)
+            counts["relationships_inserted"] = inserted
+            counts["relationships_unchanged"] = len(triples) - inserted
+            if changed or inserted:
+                self.backend.bump_version()
+        if changed:
+            self._notify("upsert", dict(changed))
+        return counts
+
+    @traced("kb.query_concept")
     def query_concept(self, name: str) -> Optional[Dict]:
-        """Query information about a specific concept"""
-        return self.data["concepts"].get(name)
-    
+        """Query information about a specific concept, by its name or any variant of it"""
+        return self.backend.get_concept(self.resolve(name))
+
+    @traced("kb.query_relationships")
     def query_relationships(self, concept: str) -> List[Dict]:
         """Find all relationships involving a concept"""
-        return [
-            rel for rel in self.data["relationships"] 
-            if rel["source"] == concept or rel["target"] == concept
-        ]
-    
+        concept = self.resolve(concept)
+        outgoing = self.backend.outgoing(concept)
+        # Self-loops are already in the outgoing list
+        incoming = [rel for rel in self.backend.incoming(concept) if rel["source"] != concept]
+        return outgoing + incoming
+
+    @traced("kb.query_by_attribute")
     def query_by_attribute(self, attribute: str, value: str) -> List[str]:
         """Find concepts that have a specific attribute value"""
-        return [
-            name for name, attrs in self.data["concepts"].items()
-            if attrs.get(attribute) == value
-        ]
-    
+        return sorted(self.backend.concepts_by_attribute(attribute, value))
+
+    @traced("kb.query_by_attribute_prefix")
+    def query_by_attribute_prefix(self, attribute: str, prefix: str) -> List[str]:
+        """Find concepts whose string value for an attribute starts with a prefix"""
+        return sorted(self.backend.concepts_by_attribute_prefix(attribute, prefix))
+
+    @traced("kb.query_by_attributes")
+    def query_by_attributes(self, equals: Optional[Dict] = None, prefixes: Optional[Dict[str, str]] = None) -> List[str]:
+        """Find concepts matching every exact value in `equals` and every value prefix in `prefixes`"""
+        candidates = [self.backend.concepts_by_attribute(a, v) for a, v in (equals or {}).items()]
+        candidates += [self.backend.concepts_by_attribute_prefix(a, p) for a, p in (prefixes or {}).items()]
+        if not candidates:
+            return []
+        # Intersect starting from the most selective filter
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for names in candidates[1:]:
+            result &= names
+            if not result:
+                break
+        return sorted(result)
+
+    def _edges(self, concept: str, relations: Optional[Set[str]], max_degree: int) -> List[Tuple[Dict, str]]:
+        """Up to max_degree (relationship, neighbour) pairs around a concept, in either direction"""
+        # Stored names, so the concept itself isn't taken for a neighbour
+        concept = self.resolve(concept)
+        edges = []
+        for rel in self.query_relationships(concept):
+            if relations is not None and rel["relation"] not in relations:
+                continue
+            edges.append((rel, rel["target"] if rel["source"] == concept else rel["source"]))
+            if len(edges) >= max_degree:
+                break
+        return edges
+
+    @traced("kb.neighborhood")
+    def neighborhood(
+        self,
+        concept: str,
+        hops: int = 1,
+        relations: Optional[Iterable[str]] = None,
+        max_degree: int = DEFAULT_MAX_DEGREE,
+        max_relationships: int = DEFAULT_MAX_RELATIONSHIPS,
+    ) -> Dict:
+        """
+        Breadth-first k-hop neighbourhood of a concept, optionally restricted to some relations.
+        At most max_degree edges are followed per concept and max_relationships returned;
+        "truncated" tells whether either limit was hit.
+        """
+        concept = self.resolve(concept)
+        relations = set(relations) if relations is not None else None
+        seen = {concept}
+        seen_triples = set()
+        found: List[Dict] = []
+        truncated = False
+        frontier = [concept]
+        for _ in range(hops):
+            next_frontier = []
+            for node in frontier:
+                edges = self._edges(node, relations, max_degree + 1)
+                if len(edges) > max_degree:
+                    truncated = True
+                    edges = edges[:max_degree]
+                for rel, other in edges:
+                    triple = (rel["source"], rel["relation"], rel["target"])
+                    if triple in seen_triples:
+                        continue
+                    if len(found) >= max_relationships:
+                        return {"concepts": list(seen), "relationships": found, "truncated": True}
+                    seen_triples.add(triple)
+                    found.append(rel)
+                    if other not in seen:
+                        seen.add(other)
+                        next_frontier.append(other)
+            frontier = next_frontier
+        return {"concepts": list(seen), "relationships": found, "truncated": truncated}
+
+    @traced("kb.shortest_path")
+    def shortest_path(
+        self,
+        source: str,
+        target: str,
+        relations: Optional[Iterable[str]] = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        max_degree: int = DEFAULT_MAX_DEGREE,
+    ) -> Optional[List[Dict]]:
+        """
+        Relationships along a shortest path between two concepts, ignoring edge direction.
+        Bidirectional BFS expanding the smaller frontier; None if no path within max_depth.
+        """
+        source, target = self.resolve(source), self.resolve(target)
+        if source == target:
+            return []
+        relations = set(relations) if relations is not None else None
+        # node -> (previous node, relationship) on each side
+        parents = ({source: None}, {target: None})
+        frontiers = (deque([source]), deque([target]))
+        for _ in range(max_depth):
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            if not frontiers[side]:
+                return None
+            mine, theirs = parents[side], parents[1 - side]
+            for _ in range(len(frontiers[side])):
+                node = frontiers[side].popleft()
+                for rel, other in self._edges(node, relations, max_degree):
+                    if other in mine:
+                        continue
+                    mine[other] = (node, rel)
+                    if other in theirs:
+                        return self._join_path(parents, other)
+                    frontiers[side].append(other)
+        return None
+
+    @staticmethod
+    def _join_path(parents, meeting: str) -> List[Dict]:
+        path = []
+        node = meeting
+        while parents[0][node] is not None:
+            node, rel = parents[0][node]
+            path.append(rel)
+        path.reverse()
+        node = meeting
+        while parents[1][node] is not None:
+            node, rel = parents[1][node]
+            path.append(rel)
+        return path
+
+    @traced("kb.merge_concepts")
+    def merge_concepts(self, groups: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Merge each list of duplicates into its canonical concept: attributes are combined
+        (the canonical concept's win), the duplicates' names become its aliases, their
+        relationships are rewritten onto it and the duplicates are removed. Names that
+        no longer exist are skipped, so a plan computed earlier is safe to apply.
+        """
+        mapping: Dict[str, str] = {}
+        removed: Dict[str, Dict] = {}
+        merged: Dict[str, Dict] = {}
+        with self.batch():
+            for canonical, duplicates in groups.items():
+                attributes = self.backend.get_concept(canonical)
+                if attributes is None:
+                    continue
+                combined: Dict = {}
+                aliases = concept_aliases(attributes)
+                for duplicate in duplicates:
+                    duplicate_attributes = self.backend.get_concept(duplicate)
+                    if duplicate == canonical or duplicate_attributes is None:
+                        continue
+                    combined.update(duplicate_attributes)
+                    aliases += [a for a in [duplicate, *concept_aliases(duplicate_attributes)] if a not in aliases]
+                    mapping[duplicate] = canonical
+                    removed[duplicate] = duplicate_attributes
+                if combined:
+                    combined.update(attributes)
+                    combined["aliases"] = aliases
+                    merged[canonical] = combined
+
+            old, new = [], []
+            seen = set()
+            for duplicate in mapping:
+                for rel in self.backend.outgoing(duplicate) + self.backend.incoming(duplicate):
+                    triple = (rel["source"], rel["relation"], rel["target"])
+                    if triple in seen:
+                        continue
+                    seen.add(triple)
+                    old.append(triple)
+                    source, target = mapping.get(triple[0], triple[0]), mapping.get(triple[2], triple[2])
+                    # Edges between two merged names would become self-loops
+                    if source != target or triple[0] == triple[2]:
+                        new.append((source, triple[1], target))
+            self.backend.remove_relationships(old)
+            self.backend.remove_concepts(list(removed))
+            self.backend.put_concepts(merged.items())
+            inserted = self.backend.add_relationships(new)
+            if removed:
+                self.backend.bump_version()
+        if removed:
+            self._notify("remove", removed)
+            self._notify("upsert", merged)
+        return {
+            "groups": len(merged),
+            "concepts_merged": len(removed),
+            "relationships_rewritten": len(old),
+            "relationships_removed": len(old) - inserted,
+        }
+
+    @traced("kb.concept_names")
+    def concept_names(self) -> List[str]:
+        """Names of all concepts, in insertion order"""
+        return self.backend.concept_names()
+
+    def concept_count(self) -> int:
+        return self.backend.concept_count()
+
+    def relationship_count(self) -> int:
+        return self.backend.relationship_count()
+
+    def iter_concepts(self) -> Iterator[Tuple[str, Dict]]:
+        return self.backend.iter_concepts()
+
+    def iter_relationships(self) -> Iterator[Dict]:
+        return self.backend.iter_relationships()
+
+    @traced("kb.export_data")
     def export_data(self) -> Dict:
         """Export the knowledge base as a dictionary"""
-        return self.data
-    
-    def import_data(self, data: Dict):
-        """Import data into the knowledge base"""
-        self.data = data
-        self.save_data()
\ No newline at end of file
+        return self.backend.export()
+
+    @traced("kb.import_data")
+    def import_data(self, data: Dict) -> Dict[str, int]:
+        """Import data into the knowledge base, replacing its current contents"""
+        with self.batch():
+            self.backend.clear()
+            self.backend.bump_version()
+            self._notify("clear", {})
+            return self.bulk_upsert(data.get("concepts", {}), data.get("relationships", []))
@@ -0,0 +1,157 @@
+import gzip
+import io
+import json
+from typing import IO, Callable, Dict, Iterator, Optional
+from knowledge_base import KnowledgeBase
+from tracing import traced
+
+# Streaming NDJSON format: a header line, then one concept or relationship per line
+NDJSON_FORMAT = "kb-ndjson"
+NDJSON_VERSION = 1
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Records applied per bulk_upsert transaction during import
+IMPORT_CHUNK_SIZE = 5000
+
+ProgressCallback = Callable[[int, Optional[float]], None]
+
+
+def _zstd():
+    # zstandard is optional; gzip works out of the box
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+    return zstandard
+
+
+def iter_export_records(kb: KnowledgeBase) -> Iterator[Dict]:
+    """Yield the header, every concept and every relationship as NDJSON records"""
+    yield {"type": "header", "format": NDJSON_FORMAT, "version": NDJSON_VERSION}
+    for name, attributes in kb.iter_concepts():
+        yield {"type": "concept", "name": name, "attributes": attributes}
+    for rel in kb.iter_relationships():
+        yield {"type": "relationship", "source": rel["source"], "relation": rel["relation"], "target": rel["target"]}
+
+
+@traced("kb_io.export")
+def write_ndjson(kb: KnowledgeBase, fileobj: IO[bytes], compression: Optional[str] = "gzip") -> int:
+    """
+    Write the knowledge base to a binary file object one record per line.
+    compression is None, "gzip" or "zstd". Returns the number of records written.
+    """
+    if compression == "gzip":
+        stream = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6)
+    elif compression == "zstd":
+        stream = _zstd().ZstdCompressor().stream_writer(fileobj, closefd=False)
+    elif compression is None:
+        stream = fileobj
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+    count = 0
+    for record in iter_export_records(kb):
+        stream.write(json.dumps(record, separators=(",", ":"), default=str).encode("utf-8"))
+        stream.write(b"\n")
+        count += 1
+    if stream is not fileobj:
+        # Closing the compressor writes its trailer without closing fileobj
+        stream.close()
+    return count
+
+
+def _open_text(fileobj: IO[bytes]) -> IO[str]:
+    """Wrap a binary upload in a text stream, decompressing gzip/zstd by their magic bytes"""
+    if fileobj.seekable():
+        position = fileobj.tell()
+        magic = fileobj.read(4)
+        fileobj.seek(position)
+        raw = fileobj
+    else:
+        raw = io.BufferedReader(fileobj)
+        magic = raw.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    elif magic == ZSTD_MAGIC:
+        raw = _zstd().ZstdDecompressor().stream_reader(raw)
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def _size_of(fileobj: IO[bytes]) -> Optional[int]:
+    size = getattr(fileobj, "size", None)
+    if size is None and fileobj.seekable():
+        position = fileobj.tell()
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(position)
+    return size
+
+
+@traced("kb_io.import")
+def import_stream(
+    kb: KnowledgeBase,
+    fileobj: IO[bytes],
+    progress: Optional[ProgressCallback] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Merge an NDJSON (optionally gzip/zstd) or legacy JSON export into the knowledge base.
+    Records are applied in chunks through bulk_upsert; progress is called with the
+    number of records applied and the fraction of input consumed (None if unknown).
+    Returns the summed bulk_upsert counts.
+    """
+    size = _size_of(fileobj)
+    text = _open_text(fileobj)
+    try:
+        return _import_records(kb, text, fileobj, size, progress, chunk_size)
+    finally:
+        # Detach so the wrapper does not close the caller's file when it is collected
+        text.detach()
+
+
+def _import_records(kb, text, fileobj, size, progress, chunk_size) -> Dict[str, int]:
+    first_line = text.readline()
+
+    totals: Dict[str, int] = {}
+
+    def apply(concepts: Dict, relationships: list):
+        for key, value in kb.bulk_upsert(concepts, relationships).items():
+            totals[key] = totals.get(key, 0) + value
+
+    def report(records: int):
+        if progress is not None:
+            fraction = min(fileobj.tell() / size, 1.0) if size else None
+            progress(records, fraction)
+
+    try:
+        header = json.loads(first_line)
+    except json.JSONDecodeError:
+        header = None
+
+    if not (isinstance(header, dict) and header.get("format") == NDJSON_FORMAT):
+        # Legacy export: a single JSON document in the import_data shape
+        data = json.loads(first_line + text.read())
+        apply(data.get("concepts", {}), data.get("relationships", []))
+        report(len(data.get("concepts", {})) + len(data.get("relationships", [])))
+        return totals
+
+    concepts: Dict[str, Dict] = {}
+    relationships = []
+    records = 0
+    for line in text:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("type") == "concept":
+            concepts[record["name"]] = record.get("attributes", {})
+        elif record.get("type") == "relationship":
+            relationships.append(record)
+        records += 1
+        if len(concepts) + len(relationships) >= chunk_size:
+            apply(concepts, relationships)
+            concepts, relationships = {}, []
+            report(records)
+    apply(concepts, relationships)
+    report(records)
+    return totals
@@ -1,28 +1,244 @@
+import json
+from collections import Counter
+from typing import Any, Dict, List
+import pandas as pd
 import streamlit as st
+from entity_resolution import merge_queue, submit_merge
 from knowledge_base import KnowledgeBase
+from tracing import traced
+
+PAGE_SIZES = [25, 50, 100, 250]
+# How often the page checks on a running merge-duplicates job
+MERGE_POLL_SECONDS = 1.0
+# Aggregates list at most this many relations and attributes
+TOP_N = 20
+
+
+@traced("kb_stats.build_frames")
+def build_stats_frames(kb: KnowledgeBase) -> Dict[str, Any]:
+    """
+    Tables and aggregates for the statistics page, in one pass over the KB:
+    concepts with their degree and attributes, relationships, the degree distribution,
+    the most common relations and how many concepts have each attribute.
+    """
+    names, attribute_counts, attribute_json = [], [], []
+    # Row numbers of the concepts having each attribute, for the attribute filter
+    attribute_rows: Dict[str, List[int]] = {}
+    for row, (name, attributes) in enumerate(kb.iter_concepts()):
+        names.append(name)
+        attribute_json.append(json.dumps(attributes, ensure_ascii=False, default=str))
+        # Legacy imports may hold a string or list instead of an attribute dict: shown, not counted
+        if not isinstance(attributes, dict):
+            attribute_counts.append(0)
+            continue
+        attribute_counts.append(len(attributes))
+        for attribute in attributes:
+            attribute_rows.setdefault(attribute, []).append(row)
+
+    relationships = pd.DataFrame(
+        list(kb.iter_relationships()), columns=["source", "relation", "target"], dtype="string"
+    )
+    out_degree = relationships["source"].value_counts()
+    in_degree = relationships["target"].value_counts()
+
+    concepts = pd.DataFrame({"concept": pd.Series(names, dtype="string"), "attributes": attribute_counts})
+    concepts["out"] = concepts["concept"].map(out_degree).fillna(0).astype("int64")
+    concepts["in"] = concepts["concept"].map(in_degree).fillna(0).astype("int64")
+    concepts["degree"] = concepts["out"] + concepts["in"]
+    concepts["details"] = pd.Series(attribute_json, dtype="string")
+    # Lower-cased copies so searches don't re-fold every row on each rerun
+    concepts["_search"] = concepts["concept"].str.casefold()
+    relationships["_search"] = (relationships["source"] + " " + relationships["target"]).str.casefold()
+
+    degrees = concepts["degree"].value_counts().sort_index()
+    total = len(concepts)
+    coverage = Counter({attribute: len(rows) for attribute, rows in attribute_rows.items()})
+    return {
+        "concepts": concepts,
+        "relationships": relationships,
+        "degree_distribution": pd.DataFrame({"degree": degrees.index, "concepts": degrees.values}),
+        "top_relations": relationships["relation"].value_counts().head(TOP_N).rename_axis("relation")
+        .reset_index(name="count"),
+        "attribute_coverage": pd.DataFrame(
+            [(attribute, count, count / total) for attribute, count in coverage.most_common(TOP_N)],
+            columns=["attribute", "concepts", "coverage"],
+        ),
+        "attribute_rows": attribute_rows,
+        # Filter choices, most common first
+        "relations": relationships["relation"].value_counts().index.tolist(),
+        "attributes": [attribute for attribute, _ in coverage.most_common()],
+    }
+
+
+@st.cache_resource(max_entries=8)
+def _stats_frames(version: str, _kb: KnowledgeBase) -> Dict[str, Any]:
+    # Keyed on the KB version, so the frames are built once per change rather than per rerun
+    return build_stats_frames(_kb)
+
+
+def filter_concepts(frames: Dict[str, Any], search: str = "", attribute: str = "", min_degree: int = 0) -> pd.DataFrame:
+    concepts = frames["concepts"]
+    mask = pd.Series(True, index=concepts.index)
+    if search:
+        mask &= concepts["_search"].str.contains(search.casefold(), regex=False)
+    if attribute:
+        mask &= concepts.index.isin(frames["attribute_rows"].get(attribute, []))
+    if min_degree:
+        mask &= concepts["degree"] >= min_degree
+    return concepts[mask]
+
+
+def filter_relationships(relationships: pd.DataFrame, search: str = "", relation: str = "") -> pd.DataFrame:
+    mask = pd.Series(True, index=relationships.index)
+    if search:
+        mask &= relationships["_search"].str.contains(search.casefold(), regex=False)
+    if relation:
+        mask &= relationships["relation"] == relation
+    return relationships[mask]
+
+
+def paginate(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    """The rows of frame on the page picked with this table's controls"""
+    size_col, page_col, count_col = st.columns([1, 1, 2])
+    size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    pages = max((len(frame) - 1) // size + 1, 1)
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        # The filter shrank the table past the page being shown
+        st.session_state[f"{key}_page"] = 1
+    page = page_col.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    count_col.caption(f"{len(frame)} matching rows · page {page} of {pages}")
+    start = (page - 1) * size
+    return frame.iloc[start:start + size]
+
+
+@st.fragment
+def _concepts_table(frames: Dict[str, Any]):
+    # A fragment, so searching and paging rerun only this table
+    search_col, attribute_col, degree_col = st.columns([2, 1, 1])
+    search = search_col.text_input("Search concepts", key="stats_concept_search")
+    attribute = attribute_col.selectbox(
+        "Has attribute", [""] + frames["attributes"], key="stats_attribute"
+    )
+    min_degree = degree_col.number_input("Min. relationships", min_value=0, value=0, key="stats_min_degree")
+    page = paginate(filter_concepts(frames, search, attribute, min_degree), "stats_concepts")
+    st.dataframe(
+        page[["concept", "attributes", "out", "in", "degree", "details"]],
+        hide_index=True, use_container_width=True,
+    )
+    if not page.empty:
+        selected = st.selectbox("Show attributes of", page["concept"].tolist(), key="stats_concept_detail")
+        st.json(page.loc[page["concept"] == selected, "details"].iloc[0])
+
+
+@st.fragment
+def _relationships_table(frames: Dict[str, Any]):
+    search_col, relation_col = st.columns([2, 1])
+    search = search_col.text_input("Search by source or target", key="stats_relationship_search")
+    relation = relation_col.selectbox(
+        "Relation", [""] + frames["relations"], key="stats_relation"
+    )
+    page = paginate(filter_relationships(frames["relationships"], search, relation), "stats_relationships")
+    st.dataframe(page[["source", "relation", "target"]], hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=MERGE_POLL_SECONDS)
+def _poll_merge(job_id: str):
+    job = merge_queue().get(job_id)
+    if job is None or job["status"] not in ("queued", "running"):
+        # Finished: rerun the page to show the proposed merges
+        st.rerun()
+    st.progress(job["progress"], text=f"Looking for duplicate concepts ({job['message'] or 'waiting for a worker'})")
+
+
+def merge_duplicates_ui(kb: KnowledgeBase):
+    """Find near-duplicate concepts in the background, then merge them once confirmed"""
+    queue = merge_queue()
+    result = st.session_state.pop("merge_result", None)
+    if result:
+        st.success(
+            f"Merged {result['concepts_merged']} duplicate concepts into {result['groups']};"
+            f" rewrote {result['relationships_rewritten']} relationships"
+            f" ({result['relationships_removed']} became duplicates and were dropped)"
+        )
+    job_id = st.session_state.get("merge_job")
+    if job_id is None:
+        if st.button("Find duplicate concepts"):
+            st.session_state.merge_job = submit_merge(kb, queue)
+            st.rerun()
+        return
+    job = queue.get(job_id)
+    if job is None or job["status"] in ("failed", "cancelled"):
+        st.error(f"Finding duplicates failed: {job['error'] if job else 'job lost'}")
+        del st.session_state.merge_job
+        return
+    if job["status"] in ("queued", "running"):
+        _poll_merge(job_id)
+        return
+
+    groups, stats = job["result"]["groups"], job["result"]["stats"]
+    st.caption(
+        f"Compared {stats['candidate_pairs']} candidate pairs out of"
+        f" {stats['concepts'] * (stats['concepts'] - 1) // 2} in {stats['seconds']:.2f}s"
+    )
+    if not groups:
+        st.info("No duplicate concepts found.")
+    else:
+        st.write(f"{stats['duplicates']} concepts look like duplicates of {stats['groups']} others:")
+        st.dataframe(
+            pd.DataFrame([(canonical, ", ".join(duplicates)) for canonical, duplicates in groups.items()],
+                         columns=["keep", "merge into it"]),
+            hide_index=True, use_container_width=True,
+        )
+    merge_col, discard_col = st.columns(2)
+    if groups and merge_col.button("Merge duplicates"):
+        st.session_state.merge_result = kb.merge_concepts(groups)
+        queue.mark_applied(job_id)
+        del st.session_state.merge_job
+        st.rerun()
+    if discard_col.button("Discard" if groups else "Close"):
+        queue.mark_applied(job_id)
+        del st.session_state.merge_job
+        st.rerun()
+
 
 # Knowledge base statistics
 def knowledge_base_stats(kb: KnowledgeBase):
     """
-    Display statistics and contents of the knowledge base.
+    Display statistics and contents of the knowledge base. Tables are built once per
+    KB version and shown a page at a time, so rendering doesn't grow with the KB.
     """
-    
+
     st.header("Knowledge Base Statistics")
-    
-    concept_count = len(kb.data["concepts"])
-    relationship_count = len(kb.data["relationships"])
-    
+
+    concept_count = kb.concept_count()
+    relationship_count = kb.relationship_count()
+
     st.write(f"Total concepts: {concept_count}")
     st.write(f"Total relationships: {relationship_count}")
-    
+
     if concept_count > 0:
+        merge_duplicates_ui(kb)
+        frames = _stats_frames(kb.version, kb)
+
+        # Aggregates
+        degree_col, relations_col, coverage_col = st.columns(3)
+        with degree_col:
+            st.subheader("Degree distribution")
+            st.bar_chart(frames["degree_distribution"], x="degree", y="concepts")
+        with relations_col:
+            st.subheader("Top relations")
+            st.dataframe(frames["top_relations"], hide_index=True, use_container_width=True)
+        with coverage_col:
+            st.subheader("Attribute coverage")
+            st.dataframe(
+                frames["attribute_coverage"], hide_index=True, use_container_width=True,
+                column_config={"coverage": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0)},
+            )
+
         # Display concepts
         st.subheader("Concepts")
-        for concept, attributes in kb.data["concepts"].items():
-            with st.expander(f"{concept}"):
-                st.json(attributes)
-        
+        _concepts_table(frames)
+
         # Display relationships
         st.subheader("Relationships")
-        for rel in kb.data["relationships"]:
-            st.write(f"- {rel['source']} {rel['relation']} {rel['target']}")
+        _relationships_table(frames)
@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import autogen
+import httpx
+import openai
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from response_cache import get_response_cache
+from tokens import count_tokens
+from tracing import count, observe, span, tracing_enabled
+
+# Keep-alive pool shared by every request through a cached OpenAI client
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+DEFAULT_CHAT_MODEL = "gpt-4o"
+
+# Transient failures worth retrying; APITimeoutError is an APIConnectionError. The SDK only
+# wraps transport errors while sending a request, so a streamed body that breaks off
+# mid-read raises httpx's own error
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, httpx.TransportError,
+)
+API_ATTEMPTS = 4
+
+
+class ConstructionStats:
+    """Counts cache hits and misses and the construction time the hits avoided"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+        self.seconds_saved = 0.0
+        # Average build time per cache key, used to price each reuse
+        self._build_seconds: Dict[Tuple, float] = {}
+
+    def record_build(self, key: Tuple, seconds: float):
+        with self._lock:
+            self.built += 1
+            self._build_seconds[key] = seconds
+
+    def record_reuse(self, key: Tuple):
+        with self._lock:
+            self.reused += 1
+            self.seconds_saved += self._build_seconds.get(key, 0.0)
+
+
+client_stats = ConstructionStats()
+agent_stats = ConstructionStats()
+
+_clients: Dict[Tuple, openai.OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> openai.OpenAI:
+    """
+    Process-wide OpenAI client per API key and base URL, so calls reuse one keep-alive
+    connection pool. base_url (or OPENAI_BASE_URL) points it at a compatible server.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    key = ("openai", api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            client_stats.record_reuse(key)
+            return client
+        start = time.perf_counter()
+        with span("llm.client_build"):
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+            )
+        _clients[key] = client
+        client_stats.record_build(key, time.perf_counter() - start)
+        return client
+
+
+def get_retrying_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> openai.OpenAI:
+    """
+    The shared client with the SDK's own retries turned off, for calls wrapped in
+    api_retry so a failure is retried by exactly one layer
+    """
+    return get_openai_client(api_key, base_url).with_options(max_retries=0)
+
+
+# Decorator for API calls: retry transient errors with jittered exponential backoff
+api_retry = retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=wait_random_exponential(multiplier=0.5, max=8),
+    stop=stop_after_attempt(API_ATTEMPTS),
+    reraise=True,
+)
+
+
+def chat_settings(llm_config) -> Dict[str, Optional[str]]:
+    """Model, API key and base URL of the first entry in an autogen llm_config"""
+    config = (llm_config or {}).get("config_list", [{}])[0]
+    return {
+        "model": config.get("model", DEFAULT_CHAT_MODEL),
+        "api_key": config.get("api_key"),
+        "base_url": config.get("base_url"),
+    }
+
+
+def count_llm_tokens(model: str, prompt: List[Dict], reply: str):
+    """Token counters for one chat call; counting costs a tokenizer pass, so only when tracing"""
+    if not tracing_enabled():
+        return
+    count("llm_calls", model=model)
+    count("llm_tokens", sum(count_tokens(m.get("content") or "", model) for m in prompt), direction="in", model=model)
+    count("llm_tokens", count_tokens(reply, model), direction="out", model=model)
+
+
+def stream_chat(messages: List[Dict], llm_config=None, **kwargs) -> Iterator[str]:
+    """Yield the reply's text deltas as the chat completion streams in"""
+    settings = chat_settings(llm_config)
+    client = get_openai_client(settings["api_key"], settings["base_url"])
+    # Timed by hand rather than with a span, which can't stay open across yields
+    start = time.perf_counter()
+    parts = []
+    stream = client.chat.completions.create(model=settings["model"], messages=messages, stream=True, **kwargs)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not parts:
+                observe("llm.stream_chat.first_token", time.perf_counter() - start)
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    observe("llm.stream_chat", time.perf_counter() - start)
+    count_llm_tokens(settings["model"], messages, "".join(parts))
+
+
+class StreamInterrupted(Exception):
+    """A streamed reply that failed after some of it arrived; `text` is what came through"""
+
+    def __init__(self, text: str):
+        super().__init__("reply stream interrupted")
+        self.text = text
+
+
+@api_retry
+def complete_streaming(messages: List[Dict], llm_config=None, on_delta=None, **kwargs) -> str:
+    """
+    Stream a chat completion, passing each text delta to on_delta as it arrives, and
+    return the whole reply. Transient errors before any text are retried; once text has
+    arrived StreamInterrupted is raised instead, so the caller can use what it got.
+    """
+    settings = chat_settings(llm_config)
+    client = get_retrying_client(settings["api_key"], settings["base_url"])
+    parts = []
+    try:
+        with span("llm.complete_streaming"):
+            stream = client.chat.completions.create(model=settings["model"], messages=messages, stream=True, **kwargs)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+    except RETRYABLE_ERRORS as e:
+        if not parts:
+            raise
+        raise StreamInterrupted("".join(parts)) from e
+    count_llm_tokens(settings["model"], messages, "".join(parts))
+    return "".join(parts)
+
+
+class AgentPool:
+    """
+    Reusable autogen agents keyed by kind, name, system message and llm_config.
+    Agents are leased exclusively, so concurrent callers (other sessions, or the
+    query pipeline's worker threads) never share one mid-chat; a new agent is only
+    built when every cached one for that key is busy.
+    """
+
+    def __init__(self):
+        self._idle: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, name: str, system_message: Optional[str], llm_config) -> Tuple:
+        return kind, name, system_message, json.dumps(llm_config, sort_keys=True, default=str)
+
+    @staticmethod
+    def _build(kind: str, name: str, system_message: Optional[str], llm_config):
+        if kind == "assistant":
+            return autogen.AssistantAgent(
+                name=name,
+                llm_config=llm_config,
+                system_message=system_message,
+                code_execution_config={"use_docker": False}
+            )
+        return autogen.UserProxyAgent(
+            name=name,
+            human_input_mode="NEVER",
+            code_execution_config={"use_docker": False},
+        )
+
+    @contextmanager
+    def lease(self, kind: str, name: str, system_message: Optional[str] = None, llm_config=None) -> Iterator:
+        """Borrow an "assistant" or "proxy" agent for the duration of the block"""
+        key = self._key(kind, name, system_message, llm_config)
+        with self._lock:
+            idle = self._idle.get(key)
+            agent = idle.pop() if idle else None
+        if agent is not None:
+            agent_stats.record_reuse(key)
+        else:
+            start = time.perf_counter()
+            with span("llm.agent_build"):
+                agent = self._build(kind, name, system_message, llm_config)
+            agent_stats.record_build(key, time.perf_counter() - start)
+        try:
+            yield agent
+        finally:
+            with self._lock:
+                self._idle.setdefault(key, []).append(agent)
+
+
+agent_pool = AgentPool()
+
+
+class NoCache:
+    """
+    Passed to initiate_chat in place of autogen's legacy disk cache, which it falls back
+    to even with cache_seed=None and which never evicts; replies are cached by
+    ResponseCache instead, and only for the calls that opt in
+    """
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def ask_agent(name: str, system_message: str, message: str, llm_config,
+              cache: bool = False, kb_version: Optional[str] = None) -> str:
+    """
+    Run a single-turn chat with a pooled assistant agent and return its reply.
+    With cache=True the reply comes from the response cache when this model, system
+    message, message and kb_version (for prompts built from the KB) were seen before.
+    """
+    model = chat_settings(llm_config)["model"]
+
+    def call() -> str:
+        with span(f"llm.{name}"), \
+                agent_pool.lease("assistant", name, system_message, llm_config) as assistant, \
+                agent_pool.lease("proxy", f"{name}_proxy") as proxy:
+            # clear_history keeps a reused agent from carrying over the previous chat
+            proxy.initiate_chat(assistant, message=message, max_turns=1, clear_history=True, cache=NoCache())
+            reply = assistant.last_message(proxy).get("content", "") or ""
+        count_llm_tokens(model, [{"content": system_message}, {"content": message}], reply)
+        return reply
+
+    if not cache:
+        return call()
+    return get_response_cache().get_or_call(model, system_message, message, call, kb_version)
+
+
+def cache_stats() -> Dict[str, float]:
+    """Cache hits/misses for OpenAI clients and agents, and construction time avoided"""
+    return {
+        "clients_built": client_stats.built,
+        "clients_reused": client_stats.reused,
+        "agents_built": agent_stats.built,
+        "agents_reused": agent_stats.reused,
+        "seconds_saved": client_stats.seconds_saved + agent_stats.seconds_saved,
+    }
@@ -1,12 +1,25 @@
 import streamlit as st
+import hmac
+import io
 import json
 import os
 from dotenv import load_dotenv
 from knowledge_base import KnowledgeBase
+from storage import SQLiteBackend
+from knowledge_io import import_stream, write_ndjson
+from embeddings import EmbeddingIndex, make_embedding_provider
+from concept_matcher import ConceptMatcher
+from audio_cache import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AudioCache
+from llm_clients import cache_stats
+from response_cache import get_response_cache
+from jobs import get_job_queue
+from incremental_extraction import apply_extraction_jobs
 from conversation_ui import conversation_ui
 from audio_conversation_ui import audio_conversation_ui
 from query_ui import query_ui
 from knowledge_stats import knowledge_base_stats
+from diagnostics_ui import diagnostics_ui
+from tracing import METRICS_PORT, count, gauge, span, start_exporter, tracer, tracing_enabled
 
 # Load environment variables
 load_dotenv()
@@ -17,40 +30,152 @@ if not api_key:
     st.warning("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
 
 config_list = [{"model": "gpt-4o", "api_key": api_key}]
+# Optional OpenAI-compatible endpoint, e.g. a local fake server for testing
+if os.getenv("OPENAI_BASE_URL"):
+    config_list[0]["base_url"] = os.getenv("OPENAI_BASE_URL")
 llm_config = {"config_list": config_list}
 
+# Storage backend: "session" keeps the KB in each browser session, "sqlite" shares one on-disk KB
+storage_backend = os.getenv("KB_STORAGE", "session")
+sqlite_path = os.getenv("KB_SQLITE_PATH", "knowledge_base.db")
+
+# The diagnostics page controls tracing for the whole server: only reachable with ?diagnostics=<token>
+diagnostics_token = os.getenv("DIAGNOSTICS_TOKEN", "")
+
+def diagnostics_requested() -> bool:
+    given = st.query_params.get("diagnostics", "")
+    return bool(diagnostics_token) and hmac.compare_digest(given.encode("utf-8"), diagnostics_token.encode("utf-8"))
+
+# No spinner: these run before st.set_page_config, which must be the first Streamlit command
+@st.cache_resource(show_spinner=False)
+def get_sqlite_backend(path: str) -> SQLiteBackend:
+    # Cached as a resource so every session shares one connection instead of copying the KB
+    return SQLiteBackend(path)
+
+@st.cache_resource(show_spinner=False)
+def get_shared_embedding_index(path: str) -> EmbeddingIndex:
+    # Shared by every session and saved next to the SQLite file so restarts don't re-embed
+    return EmbeddingIndex(make_embedding_provider(api_key), path=path)
+
+def get_embedding_index() -> EmbeddingIndex:
+    if storage_backend == "sqlite":
+        return get_shared_embedding_index(f"{sqlite_path}.embeddings.npz")
+    # Session KBs keep their index in session_state so reruns reuse it
+    if "embedding_index" not in st.session_state:
+        st.session_state.embedding_index = EmbeddingIndex(make_embedding_provider(api_key))
+    return st.session_state.embedding_index
+
+@st.cache_resource(show_spinner=False)
+def get_shared_concept_matcher(path: str) -> ConceptMatcher:
+    return ConceptMatcher()
+
+def get_concept_matcher() -> ConceptMatcher:
+    if storage_backend == "sqlite":
+        return get_shared_concept_matcher(sqlite_path)
+    if "concept_matcher" not in st.session_state:
+        st.session_state.concept_matcher = ConceptMatcher()
+    return st.session_state.concept_matcher
+
 # Initialize Knowledge Base
-kb = KnowledgeBase()
+if storage_backend == "sqlite":
+    kb = KnowledgeBase(get_sqlite_backend(sqlite_path))
+else:
+    kb = KnowledgeBase()
+
+# Concept retrieval index, updated by the KB on every concept write
+embedding_index = get_embedding_index()
+embedding_index.attach(kb)
+
+# Lexical entity linker over concept names, also used to highlight concepts in transcripts
+concept_matcher = get_concept_matcher()
+concept_matcher.attach(kb)
+
+@st.cache_resource
+def get_audio_cache(root: str, max_bytes: int) -> AudioCache:
+    # One cache per server so every session shares synthesized speech and transcripts
+    return AudioCache(root, max_bytes)
+
+@st.cache_resource(show_spinner=False)
+def setup_metrics(port: int):
+    """
+    Register the process-wide caches and queues as metric collectors, read only when
+    metrics are exported, and serve /metrics on port when it is set. Once per server.
+    """
+    responses = get_response_cache()
+    audio = get_audio_cache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+    jobs = get_job_queue()
+    tracer.register_collector("response_cache", responses.stats)
+    tracer.register_collector("audio_cache", audio.stats)
+    tracer.register_collector("llm_reuse", cache_stats)
+    tracer.register_collector("jobs", jobs.counts)
+    return start_exporter(port) if port else None
 
 # Add export/import functionality
 def export_import_ui():
     st.sidebar.header("Export/Import")
     
     # Export functionality
+    export_format = st.sidebar.selectbox("Export format", ["NDJSON (gzip)", "NDJSON", "JSON (legacy)"])
     if st.sidebar.button("Export Knowledge Base"):
-        export_data = kb.export_data()
-        st.sidebar.download_button(
-            label="Download JSON",
-            data=json.dumps(export_data, indent=2),
-            file_name="knowledge_base_export.json",
-            mime="application/json"
-        )
+        if export_format == "JSON (legacy)":
+            st.sidebar.download_button(
+                label="Download JSON",
+                data=json.dumps(kb.export_data(), separators=(",", ":")),
+                file_name="knowledge_base_export.json",
+                mime="application/json"
+            )
+        else:
+            # Records are streamed (and compressed) into one buffer rather than joined into a
+            # string; download_button holds the whole payload in memory either way
+            compression = "gzip" if export_format == "NDJSON (gzip)" else None
+            export_file = io.BytesIO()
+            write_ndjson(kb, export_file, compression=compression)
+            st.sidebar.download_button(
+                label="Download NDJSON",
+                data=export_file.getvalue(),
+                file_name="knowledge_base_export.ndjson" + (".gz" if compression else ""),
+                mime="application/gzip" if compression else "application/x-ndjson"
+            )
     
     # Import functionality
-    uploaded_file = st.sidebar.file_uploader("Import Knowledge Base", type=["json"])
+    uploaded_file = st.sidebar.file_uploader("Import Knowledge Base", type=["json", "ndjson", "gz", "zst"])
     if uploaded_file is not None:
-        try:
-            import_data = json.load(uploaded_file)
-            if st.sidebar.button("Load Imported Data"):
-                kb.import_data(import_data)
-                st.sidebar.success("Knowledge base imported successfully!")
-        except Exception as e:
-            st.sidebar.error(f"Error importing file: {str(e)}")
+        if st.sidebar.button("Load Imported Data"):
+            progress_bar = st.sidebar.progress(0.0, text="Importing...")
+
+            def on_progress(records, fraction):
+                progress_bar.progress(fraction or 0.0, text=f"Imported {records} records")
+
+            try:
+                counts = import_stream(kb, uploaded_file, progress=on_progress)
+                st.sidebar.success(
+                    f"Knowledge base imported successfully! ({counts.get('concepts_inserted', 0)} new concepts,"
+                    f" {counts.get('relationships_inserted', 0)} new relationships merged)"
+                )
+            except Exception as e:
+                st.sidebar.error(f"Error importing file: {str(e)}")
+
+def sidebar_metrics():
+    # Reused agents/clients since the server started, and the construction time that saved
+    stats = cache_stats()
+    st.sidebar.caption(
+        f"Reused {stats['agents_reused']} agents and {stats['clients_reused']} API clients"
+        f" ({stats['seconds_saved'] * 1000:.0f} ms of setup avoided)"
+    )
+    responses = get_response_cache().stats()
+    st.sidebar.caption(
+        f"Response cache: {responses['hits']} hits / {responses['misses']} misses"
+        f" ({responses['hit_rate']:.0%}), {responses['entries']} entries, {responses['bytes'] / 1e6:.1f} MB,"
+        f" {responses['invalidated']} invalidated by KB changes"
+    )
+    jobs = get_job_queue().counts()
+    st.sidebar.caption(f"Background jobs: {jobs.get('running', 0)} running, {jobs.get('queued', 0)} queued")
 
 # Main app
 def main():
     # Set up Streamlit page
     st.set_page_config(page_title="Knowledge Management System", layout="wide")
+    setup_metrics(METRICS_PORT)
     
     st.title("Knowledge Management System")
     
@@ -72,6 +197,11 @@ def main():
         ```
         """)
         return
+
+    # Not in the navigation, and off unless DIAGNOSTICS_TOKEN is set
+    if diagnostics_requested():
+        diagnostics_ui()
+        return
     
     # Sidebar navigation
     st.sidebar.title("Navigation")
@@ -79,15 +209,28 @@ def main():
     
     # Add export/import UI to sidebar
     export_import_ui()
-    
+
+    # Background extractions land in the KB on every rerun, not only on the conversation pages
+    apply_extraction_jobs(kb, llm_config)
+
     if page == "Text Conversation":
-        conversation_ui(kb, llm_config)
+        conversation_ui(kb, llm_config, concept_matcher)
     elif page == "Audio Conversation":
-        audio_conversation_ui(kb, llm_config)
+        audio_conversation_ui(kb, llm_config, concept_matcher, get_audio_cache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES))
     elif page == "Query":
-        query_ui(kb, llm_config)
+        query_ui(kb, llm_config, embedding_index, concept_matcher)
     elif page == "Knowledge Base":
         knowledge_base_stats(kb)
+    
+    # After the page, so the numbers include what it just did
+    sidebar_metrics()
+    count("reruns", page=page)
+    if tracing_enabled():
+        # Read here rather than by a collector, since the KB may live in this session's state
+        gauge("kb_concepts", kb.concept_count(), storage=storage_backend)
+        gauge("kb_relationships", kb.relationship_count(), storage=storage_backend)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Every rerun is one trace, with the spans of whatever the page did under it
+    with span("rerun"):
+        main()
\ No newline at end of file
@@ -0,0 +1,236 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from concept_matcher import ConceptMatcher
+from embeddings import EmbeddingIndex
+from knowledge_base import KnowledgeBase
+from context_builder import DEFAULT_CONTEXT_BUDGET, build_context
+from tracing import span
+from utils import parse_json_object
+
+# Number of concepts retrieved per query and the minimum cosine similarity to keep one
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_MIN_SCORE = 0.25
+# Embedding score above which local linking is trusted without the analysis LLM call
+CONFIDENT_SCORE = 0.6
+# Graph retrieval limits: edges followed per concept, hops for relation-filtered traversal,
+# and how many retrieved concepts are paired up when looking for connecting paths
+MAX_DEGREE_PER_CONCEPT = 25
+RELATION_HOPS = 2
+MAX_PATH_CONCEPTS = 4
+
+ANALYSIS_SYSTEM_MESSAGE = (
+    "You analyze user queries to determine what information to retrieve from a knowledge base."
+    " For a given query, identify: 1) specific concepts to look up, 2) relationships to find,"
+    " or 3) attributes to search for."
+    ' Reply with only a JSON object: {"concepts": [concept names], "relations": [relation names],'
+    ' "attributes": {attribute: value}}.'
+)
+
+ANSWER_SYSTEM_MESSAGE = (
+    "You are an assistant that helps users query a knowledge base."
+    " You have access to information about concepts and their relationships."
+    " When responding to queries, use only the information provided by the knowledge base."
+)
+
+# (query) -> raw analysis reply, and (answer prompt message) -> answer text
+AnalyzeFn = Callable[[str], str]
+AnswerFn = Callable[[str], str]
+
+
+class StageTimer:
+    """Wall-clock duration of each named pipeline stage, in seconds; each is also a "query.<name>" span"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            with span(f"query.{name}"):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def answer_message(query: str, context: str) -> str:
+    """User message for the answer step"""
+    return (
+        f"Based on the following information from our knowledge base, please answer this query: '{query}'\n\n"
+        f"Retrieved information: {context}"
+    )
+
+
+def parse_analysis(reply: str) -> Dict:
+    """Normalize the analysis reply into concepts/relations/attributes, tolerating junk"""
+    parsed = parse_json_object(reply) or {}
+    concepts = parsed.get("concepts", [])
+    relations = parsed.get("relations", [])
+    attributes = parsed.get("attributes", {})
+    return {
+        "concepts": [c for c in concepts if isinstance(c, str)] if isinstance(concepts, list) else [],
+        "relations": [r for r in relations if isinstance(r, str)] if isinstance(relations, list) else [],
+        "attributes": attributes if isinstance(attributes, dict) else {},
+    }
+
+
+def link_locally(
+    query: str, concept_matcher: ConceptMatcher, embedding_index: EmbeddingIndex
+) -> Tuple[List[str], bool]:
+    """
+    Concepts found in the query without an LLM: exact mentions first, then embedding neighbours.
+    Confident when a concept is named outright or the best embedding score is high.
+    """
+    matched = concept_matcher.concepts_in(query)
+    scored = embedding_index.search(query, k=RETRIEVAL_TOP_K, min_score=RETRIEVAL_MIN_SCORE)
+    concepts = list(dict.fromkeys(matched + [c for c, _ in scored]))
+    confident = bool(matched) or bool(scored and scored[0][1] >= CONFIDENT_SCORE)
+    return concepts, confident
+
+
+def resolve_concepts(
+    names: List[str], kb: KnowledgeBase, concept_matcher: ConceptMatcher, embedding_index: EmbeddingIndex
+) -> List[str]:
+    """Map concept names from the analysis onto names that exist in the KB"""
+    resolved = []
+    for name in names:
+        if kb.query_concept(name) is not None:
+            # The stored name, not the variant the analysis used
+            resolved.append(kb.resolve(name))
+            continue
+        linked = concept_matcher.concepts_in(name)
+        if not linked:
+            linked = [c for c, _ in embedding_index.search(name, k=1, min_score=CONFIDENT_SCORE)]
+        resolved.extend(linked)
+    return list(dict.fromkeys(resolved))
+
+
+def retrieve(
+    kb: KnowledgeBase,
+    concepts: List[str],
+    relations: Optional[List[str]] = None,
+    attributes: Optional[Dict] = None,
+) -> Dict:
+    """Collect concepts, their relationships and attribute matches into retrieved_info"""
+    retrieved_info = {
+        "concepts": {},
+        "relationships": []
+    }
+
+    if attributes:
+        concepts = concepts + kb.query_by_attributes(equals=attributes)
+
+    wanted_relations = {r.lower() for r in relations or []}
+    for concept in dict.fromkeys(concepts):
+        concept_attributes = kb.query_concept(concept)
+        if concept_attributes is None:
+            continue
+        retrieved_info["concepts"][concept] = concept_attributes
+        # Direct relationships, capped so a hub concept can't flood the prompt
+        relationships = kb.neighborhood(concept, hops=1, max_degree=MAX_DEGREE_PER_CONCEPT)["relationships"]
+        # Follow the relations the analysis asked about further out, unless none of them are present
+        if wanted_relations:
+            matching = {rel["relation"] for rel in relationships if rel["relation"].lower() in wanted_relations}
+            if matching:
+                relationships = kb.neighborhood(
+                    concept, hops=RELATION_HOPS, relations=matching, max_degree=MAX_DEGREE_PER_CONCEPT
+                )["relationships"]
+        retrieved_info["relationships"].extend(relationships)
+
+    # How the retrieved concepts connect to each other, for "how is X related to Y" questions
+    paths = []
+    for source, target in combinations(list(retrieved_info["concepts"])[:MAX_PATH_CONCEPTS], 2):
+        path = kb.shortest_path(source, target, max_degree=MAX_DEGREE_PER_CONCEPT)
+        if path and len(path) > 1:
+            paths.append(path)
+    if paths:
+        retrieved_info["paths"] = paths
+
+    # If no specific concepts found, provide a summary
+    if not retrieved_info["concepts"]:
+        concept_count = kb.concept_count()
+        relationship_count = kb.relationship_count()
+        retrieved_info["summary"] = f"Knowledge base contains {concept_count} concepts and {relationship_count} relationships."
+        # Include a sample of concepts
+        sample_size = min(5, concept_count)
+        retrieved_info["sample_concepts"] = kb.concept_names()[:sample_size]
+
+    return retrieved_info
+
+
+def run_query(
+    query: str,
+    kb: KnowledgeBase,
+    concept_matcher: ConceptMatcher,
+    embedding_index: EmbeddingIndex,
+    analyze: AnalyzeFn,
+    answer: AnswerFn,
+    context_budget: int = DEFAULT_CONTEXT_BUDGET,
+) -> Dict:
+    """
+    Answer a query against the KB. Returns a dict with the answer, retrieved_info,
+    per-stage timings and the context builder's token stats.
+
+    If local entity linking is confident the analysis LLM call is skipped. Otherwise, when
+    linking found some concepts, the analysis runs concurrently with a speculative answer
+    over the locally retrieved facts; that answer is kept when the analysis adds no new
+    concepts, and the answer step is re-run on the merged retrieval when it does. With
+    nothing linked locally the analysis would almost surely add concepts, so the
+    speculative call, a third LLM call in that case, isn't made.
+    """
+    timer = StageTimer()
+    result = {"timings": timer.timings}
+
+    def pack(retrieved_info):
+        with timer.stage("context"):
+            context, stats = build_context(query, retrieved_info, context_budget)
+        return answer_message(query, context), stats
+
+    def finish(response, retrieved_info, stats):
+        result.update(answer=response, retrieved_info=retrieved_info, context=stats)
+        return result
+
+    with timer.stage("total"):
+        with timer.stage("local_linking"):
+            local_concepts, confident = link_locally(query, concept_matcher, embedding_index)
+        with timer.stage("retrieval"):
+            local_info = retrieve(kb, local_concepts)
+        local_message, local_stats = pack(local_info)
+
+        if confident:
+            with timer.stage("answer"):
+                return finish(answer(local_message), local_info, local_stats)
+
+        def timed(name, fn, *args):
+            with timer.stage(name):
+                return fn(*args)
+
+        pool = ThreadPoolExecutor(max_workers=2)
+        speculative_future = None
+        try:
+            analysis_future = pool.submit(timed, "analysis", analyze, query)
+            if local_concepts:
+                speculative_future = pool.submit(timed, "answer_speculative", answer, local_message)
+            analysis = parse_analysis(analysis_future.result())
+
+            with timer.stage("retrieval"):
+                analysed_concepts = resolve_concepts(analysis["concepts"], kb, concept_matcher, embedding_index)
+                merged_info = retrieve(
+                    kb, local_concepts + analysed_concepts, analysis["relations"], analysis["attributes"]
+                )
+
+            if speculative_future is not None and merged_info["concepts"].keys() <= local_info["concepts"].keys():
+                return finish(speculative_future.result(), local_info, local_stats)
+        finally:
+            if speculative_future is not None and not speculative_future.done():
+                # The speculative answer lost: cancelled if it hasn't started yet, otherwise
+                # left to finish on its worker and its result ignored
+                speculative_future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        merged_message, merged_stats = pack(merged_info)
+        with timer.stage("answer"):
+            return finish(answer(merged_message), merged_info, merged_stats)
@@ -1,10 +1,14 @@
 import streamlit as st
-import autogen
-import json
+from concept_matcher import ConceptMatcher
+from context_builder import DEFAULT_CONTEXT_BUDGET
+from embeddings import EmbeddingIndex
 from knowledge_base import KnowledgeBase
+from llm_clients import ask_agent
+from query_pipeline import ANALYSIS_SYSTEM_MESSAGE, ANSWER_SYSTEM_MESSAGE, run_query
+
 
 # Query interface
-def query_ui(kb: KnowledgeBase, llm_config):
+def query_ui(kb: KnowledgeBase, llm_config, embedding_index: EmbeddingIndex, concept_matcher: ConceptMatcher):
     """"
     Interface for querying the knowledge base.
     """
@@ -13,97 +17,49 @@ def query_ui(kb: KnowledgeBase, llm_config):
     
     # Get query from user
     query = st.text_input("Enter your query:")
+    context_budget = st.number_input(
+        "Context token budget", min_value=250, max_value=64000, value=DEFAULT_CONTEXT_BUDGET, step=250
+    )
     
     if st.button("Submit Query"):
         if not query:
             st.warning("Please enter a query.")
             return
         
-        # Get relevant information from the knowledge base
-        with st.spinner("Processing query..."):
-            # Analyze the query to determine what information to retrieve
-            analysis_agent = autogen.AssistantAgent(
-                name="query_analyzer",
-                llm_config=llm_config,
-                system_message=(
-                    "You analyze user queries to determine what information to retrieve from a knowledge base."
-                    " For a given query, identify: 1) specific concepts to look up, 2) relationships to find,"
-                    " or 3) attributes to search for."
-                ),
-                code_execution_config={"use_docker": False}
-            )
-            
-            analysis_proxy = autogen.UserProxyAgent(
-                name="analysis_proxy",
-                human_input_mode="NEVER",
-                code_execution_config={"use_docker": False},
+        def analyze(q):
+            return ask_agent(
+                "query_analyzer", ANALYSIS_SYSTEM_MESSAGE,
+                f"Analyze this query: '{q}'. What information should I retrieve from the knowledge base?",
+                llm_config,
+                cache=True,
             )
-            
-            analysis_proxy.initiate_chat(
-                analysis_agent,
-                message=f"Analyze this query: '{query}'. What information should I retrieve from the knowledge base?",
-                max_turns=1
-            )
-            
-            # Get relevant information from the knowledge base
-            retrieved_info = {
-                "concepts": {},
-                "relationships": []
-            }
-            
-            # Extract concepts mentioned in the query
-            for concept in kb.data["concepts"].keys():
-                if concept.lower() in query.lower():
-                    retrieved_info["concepts"][concept] = kb.query_concept(concept)
-                    # Get relationships for this concept
-                    retrieved_info["relationships"].extend(kb.query_relationships(concept))
-            
-            # If no specific concepts found, provide a summary
-            if not retrieved_info["concepts"]:
-                concept_count = len(kb.data["concepts"])
-                relationship_count = len(kb.data["relationships"])
-                retrieved_info["summary"] = f"Knowledge base contains {concept_count} concepts and {relationship_count} relationships."
-                # Include a sample of concepts
-                sample_size = min(5, concept_count)
-                retrieved_info["sample_concepts"] = list(kb.data["concepts"].keys())[:sample_size]
-            
-            # Now answer the query with the retrieved information
-            info_json = json.dumps(retrieved_info, indent=2)
-            
-            # Create the query assistant
-            query_assistant = autogen.AssistantAgent(
-                name="query_assistant",
-                llm_config=llm_config,
-                system_message=(
-                    "You are an assistant that helps users query a knowledge base."
-                    " You have access to information about concepts and their relationships."
-                    " When responding to queries, use only the information provided by the knowledge base."
-                ),
-                code_execution_config={"use_docker": False}
-            )
-            
-            query_proxy = autogen.UserProxyAgent(
-                name="query_proxy",
-                human_input_mode="NEVER",
-                code_execution_config={"use_docker": False},
 
-            )
-            
-            query_proxy.initiate_chat(
-                query_assistant,
-                message=(
-                    f"Based on the following information from our knowledge base, please answer this query: '{query}'\n\n"
-                    f"Retrieved information: {info_json}"
-                ),
-                max_turns=1
-            )
-            
-            response = query_assistant.last_message()["content"]
+        # Answers are built from KB facts, so a KB change invalidates them
+        kb_version = kb.version
+
+        def answer(message):
+            return ask_agent("query_assistant", ANSWER_SYSTEM_MESSAGE, message, llm_config,
+                             cache=True, kb_version=kb_version)
+
+        # Local entity linking first; the analysis call only runs when linking is unsure
+        with st.spinner("Processing query..."):
+            result = run_query(query, kb, concept_matcher, embedding_index, analyze, answer, int(context_budget))
+        response, retrieved_info, timings = result["answer"], result["retrieved_info"], result["timings"]
         
         # Display the response
         st.subheader("Answer")
         st.write(response)
         
+        context = result["context"]
+        st.caption(
+            f"Context: {context['context_tokens']} tokens, {context['tokens_saved']} saved"
+            f" ({context['duplicates_removed']} duplicate and {context['facts_dropped']} over-budget facts left out)"
+        )
+        
         # Display the retrieved information
         with st.expander("Retrieved Information"):
             st.json(retrieved_info)
+
+        # Per-stage latency; the analysis and speculative answer stages overlap in time
+        with st.expander("Timing"):
+            st.table({stage: f"{seconds * 1000:.0f} ms" for stage, seconds in timings.items()})
@@ -0,0 +1,84 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+import diskcache
+from audio_cache import content_key
+
+# Location, size budget and lifetime of cached LLM replies
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", ".response_cache")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+class ResponseCache:
+    """
+    LLM replies on disk, keyed on model, system prompt, message and (for calls whose
+    prompt is built from the KB) the KB version. Entries expire after ttl seconds and
+    the least recently used go once the cache outgrows max_bytes. When a KB's version
+    moves on, entries for its previous version are evicted.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: int = RESPONSE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._cache = diskcache.Cache(
+            directory, size_limit=max_bytes, eviction_policy="least-recently-used", tag_index=True
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        # Latest version seen per KB id, e.g. {"<uuid>": "<uuid>:12"}
+        self._versions: Dict[str, str] = {}
+
+    def _observe_version(self, kb_version: str):
+        # KB versions look like "<store id>:<counter>"; a new counter retires the old entries
+        store_id = kb_version.rsplit(":", 1)[0]
+        with self._lock:
+            previous = self._versions.get(store_id)
+            self._versions[store_id] = kb_version
+        if previous is not None and previous != kb_version:
+            evicted = self._cache.evict(previous)
+            with self._lock:
+                self.invalidated += evicted
+
+    def get_or_call(self, model: str, system_message: str, message: str, call: Callable[[], str],
+                    kb_version: Optional[str] = None) -> str:
+        """The cached reply for this prompt, or call() and cache its reply if it is not empty"""
+        if kb_version is not None:
+            self._observe_version(kb_version)
+        key = content_key("chat", model, system_message or "", message, kb_version or "")
+        reply = self._cache.get(key)
+        if reply is not None:
+            with self._lock:
+                self.hits += 1
+            return reply
+        with self._lock:
+            self.misses += 1
+        reply = call()
+        if reply:
+            # Tagged with the KB version so it can be dropped as soon as the KB changes
+            self._cache.set(key, reply, expire=self.ttl, tag=kb_version)
+        return reply
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidated": self.invalidated,
+                "entries": len(self._cache),
+                "bytes": self._cache.volume(),
+            }
+
+
+@lru_cache(maxsize=None)
+def get_response_cache(directory: str = RESPONSE_CACHE_DIR) -> ResponseCache:
+    """Process-wide response cache per directory, shared by every session and worker thread"""
+    return ResponseCache(directory)
@@ -0,0 +1,98 @@
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from tracing import traced
+
+# A sentence ends at terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*(?=\s)")
+# Short sentences are merged with the next so each TTS request carries enough text
+MIN_SEGMENT_CHARS = 40
+# Concurrent TTS requests per turn
+TTS_WORKERS = 3
+
+SynthesizeFn = Callable[[str], bytes]
+
+
+def split_sentences(deltas: Iterable[str], min_chars: int = MIN_SEGMENT_CHARS) -> Iterator[str]:
+    """Regroup streamed text deltas into sentence-sized segments as soon as each one is complete"""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        while True:
+            cut = next((m.end() for m in SENTENCE_END.finditer(buffer) if m.end() >= min_chars), None)
+            if cut is None:
+                break
+            segment, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+            if segment:
+                yield segment
+    if buffer.strip():
+        yield buffer.strip()
+
+
+@traced("audio.voice_turn")
+def run_voice_turn(
+    deltas: Iterable[str],
+    synthesize: SynthesizeFn,
+    on_text: Optional[Callable[[str], None]] = None,
+    on_audio: Optional[Callable[[int, bytes], None]] = None,
+    max_workers: int = TTS_WORKERS,
+) -> Dict:
+    """
+    Synthesize a streamed reply sentence by sentence on a bounded worker pool.
+
+    on_text gets the accumulated text after every delta and on_audio gets each segment's
+    audio in order as soon as it and all earlier segments are ready; both are called on
+    the caller's thread, so they may update Streamlit elements. Returns the full text,
+    the audio segments and per-turn latency metrics in seconds.
+    """
+    start = time.perf_counter()
+    metrics: Dict[str, float] = {}
+    text_parts: List[str] = []
+    futures: List[Future] = []
+    segments: List[bytes] = []
+    errors: List[str] = []
+
+    def deliver(block: bool):
+        # Hand over finished segments strictly in order
+        while len(segments) < len(futures):
+            future = futures[len(segments)]
+            if not block and not future.done():
+                return
+            try:
+                audio = future.result()
+            except Exception as e:
+                errors.append(str(e))
+                audio = b""
+            segments.append(audio)
+            if audio:
+                if "first_audio_s" not in metrics:
+                    metrics["first_audio_s"] = time.perf_counter() - start
+                if on_audio is not None:
+                    on_audio(len(segments) - 1, audio)
+
+    def tracked(stream):
+        for delta in stream:
+            if "first_token_s" not in metrics:
+                metrics["first_token_s"] = time.perf_counter() - start
+            text_parts.append(delta)
+            if on_text is not None:
+                on_text("".join(text_parts))
+            # Earlier segments may have finished while this one was still being generated
+            deliver(block=False)
+            yield delta
+        metrics["llm_done_s"] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for sentence in split_sentences(tracked(deltas)):
+            futures.append(pool.submit(synthesize, sentence))
+        deliver(block=True)
+
+    metrics["total_s"] = time.perf_counter() - start
+    metrics["segments"] = len(futures)
+    return {
+        "text": "".join(text_parts),
+        "segments": segments,
+        "metrics": metrics,
+        "errors": errors,
+    }
@@ -0,0 +1,590 @@
+import bisect
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+import streamlit as st
+from entity_resolution import alias_keys
+
+Triple = Tuple[str, str, str]
+
+
+def attribute_key(value: Any) -> Hashable:
+    """Hashable form of an attribute value; lists and dicts from the LLM are keyed by their JSON"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class RelationshipIndex:
+    """Hash set of triples plus source/target adjacency lists over the relationship list"""
+
+    def __init__(self, relationships: List[Dict]):
+        self.relationships = relationships
+        self.triples: Set[Triple] = set()
+        self.outgoing: Dict[str, List[Dict]] = {}
+        self.incoming: Dict[str, List[Dict]] = {}
+        self.size = 0
+        for rel in relationships:
+            self.add(rel)
+
+    def add(self, rel: Dict):
+        self.triples.add((rel["source"], rel["relation"], rel["target"]))
+        self.outgoing.setdefault(rel["source"], []).append(rel)
+        self.incoming.setdefault(rel["target"], []).append(rel)
+        self.size += 1
+
+    def is_current(self, relationships: List[Dict]) -> bool:
+        """Whether the index was built for this list and nothing was appended behind its back"""
+        return self.relationships is relationships and self.size == len(relationships)
+
+
+class AttributeIndex:
+    """Inverted (attribute, value) -> concept names index over the concepts dict"""
+
+    def __init__(self, concepts: Dict[str, Dict]):
+        self.concepts = concepts
+        self.values: Dict[str, Dict[Hashable, Set[str]]] = {}
+        # Sorted string values per attribute for prefix lookups, rebuilt lazily after changes
+        self._sorted: Dict[str, List[str]] = {}
+        self.names: Set[str] = set()
+        for name, attrs in concepts.items():
+            self.add(name, attrs)
+
+    def add(self, name: str, attributes: Dict):
+        self.names.add(name)
+        if not isinstance(attributes, dict):
+            return
+        for attribute, value in attributes.items():
+            self.values.setdefault(attribute, {}).setdefault(attribute_key(value), set()).add(name)
+            self._sorted.pop(attribute, None)
+
+    def remove(self, name: str, attributes: Dict):
+        self.names.discard(name)
+        if not isinstance(attributes, dict):
+            return
+        for attribute, value in attributes.items():
+            by_value = self.values.get(attribute, {})
+            key = attribute_key(value)
+            names = by_value.get(key)
+            if names is None:
+                continue
+            names.discard(name)
+            if not names:
+                del by_value[key]
+                self._sorted.pop(attribute, None)
+                if not by_value:
+                    del self.values[attribute]
+
+    def lookup(self, attribute: str, value: Any) -> Set[str]:
+        return self.values.get(attribute, {}).get(attribute_key(value), set())
+
+    def lookup_prefix(self, attribute: str, prefix: str) -> Set[str]:
+        by_value = self.values.get(attribute)
+        if not by_value:
+            return set()
+        keys = self._sorted.get(attribute)
+        if keys is None:
+            keys = sorted(k for k in by_value if isinstance(k, str))
+            self._sorted[attribute] = keys
+        result: Set[str] = set()
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            result |= by_value[keys[i]]
+        return result
+
+    def is_current(self, concepts: Dict[str, Dict]) -> bool:
+        return self.concepts is concepts and len(self.names) == len(concepts)
+
+
+class AliasIndex:
+    """Alias key -> concept name over the concepts dict; the first concept registered under a key keeps it"""
+
+    def __init__(self, concepts: Dict[str, Dict]):
+        self.concepts = concepts
+        self.keys: Dict[str, str] = {}
+        # Keys owned by each concept, so a removed concept gives its keys up
+        self.owned: Dict[str, List[str]] = {}
+        for name, attrs in concepts.items():
+            self.add(name, attrs)
+
+    def add(self, name: str, attributes: Dict):
+        owned = self.owned.setdefault(name, [])
+        for key in alias_keys(name, attributes):
+            if key not in self.keys:
+                self.keys[key] = name
+                owned.append(key)
+
+    def remove(self, name: str):
+        for key in self.owned.pop(name, []):
+            if self.keys.get(key) == name:
+                del self.keys[key]
+
+    def is_current(self, concepts: Dict[str, Dict]) -> bool:
+        return self.concepts is concepts and len(self.owned) == len(concepts)
+
+
+class StorageBackend:
+    """Interface for where a KnowledgeBase keeps its concepts and relationships"""
+
+    def get_concept(self, name: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put_concept(self, name: str, attributes: Dict):
+        raise NotImplementedError
+
+    def put_concepts(self, items: Iterable[Tuple[str, Dict]]):
+        for name, attributes in items:
+            self.put_concept(name, attributes)
+
+    def remove_concepts(self, names: Iterable[str]):
+        raise NotImplementedError
+
+    def concept_for_alias(self, key: str) -> Optional[str]:
+        """The concept registered under an alias key (see entity_resolution.alias_keys)"""
+        raise NotImplementedError
+
+    def concept_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def iter_concepts(self) -> Iterator[Tuple[str, Dict]]:
+        raise NotImplementedError
+
+    def concept_count(self) -> int:
+        raise NotImplementedError
+
+    def has_relationship(self, source: str, relation: str, target: str) -> bool:
+        raise NotImplementedError
+
+    def add_relationship(self, source: str, relation: str, target: str) -> bool:
+        """Store a triple; returns False if it was already present"""
+        raise NotImplementedError
+
+    def add_relationships(self, triples: Iterable[Triple]) -> int:
+        """Store several triples; returns how many were new"""
+        return sum(self.add_relationship(*triple) for triple in triples)
+
+    def remove_relationships(self, triples: Iterable[Triple]) -> int:
+        """Delete triples; returns how many were present"""
+        raise NotImplementedError
+
+    def outgoing(self, concept: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def incoming(self, concept: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def iter_relationships(self) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def relationship_count(self) -> int:
+        raise NotImplementedError
+
+    def concepts_by_attribute(self, attribute: str, value: Any) -> Set[str]:
+        raise NotImplementedError
+
+    def concepts_by_attribute_prefix(self, attribute: str, prefix: str) -> Set[str]:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def export(self) -> Dict:
+        raise NotImplementedError
+
+    def version(self) -> Tuple[str, int]:
+        """(store id, change counter); the counter goes up whenever the contents change"""
+        raise NotImplementedError
+
+    def bump_version(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes; backends without transactions just run the block"""
+        yield
+
+    def flush(self):
+        pass
+
+
+# Default backend: a plain dict in Streamlit's session_state, private to the browser session
+class SessionStateBackend(StorageBackend):
+    def __init__(self, key: str = "knowledge_base"):
+        # Initialize knowledge base in session state if it doesn't exist
+        if key not in st.session_state:
+            st.session_state[key] = {"concepts": {}, "relationships": []}
+        self.key = key
+        self.data = st.session_state[key]
+        # Each session's KB gets its own id, so equal counters in two sessions never collide.
+        # A list bumped in place, so writes don't go through the session_state proxy
+        version_key = f"{key}_version"
+        version = st.session_state.get(version_key)
+        if not isinstance(version, list):
+            version = st.session_state[version_key] = list(version or (uuid.uuid4().hex, 0))
+        self._version = version
+        self._load_indexes()
+
+    def _load_indexes(self):
+        # Indexes are kept in session_state too so they are not rebuilt on every rerun
+        rel_key, attr_key = f"{self.key}_relationship_index", f"{self.key}_attribute_index"
+        alias_key = f"{self.key}_alias_index"
+        index = st.session_state.get(rel_key)
+        if index is None or not index.is_current(self.data["relationships"]):
+            index = RelationshipIndex(self.data["relationships"])
+            st.session_state[rel_key] = index
+        self._index = index
+
+        attribute_index = st.session_state.get(attr_key)
+        if attribute_index is None or not attribute_index.is_current(self.data["concepts"]):
+            attribute_index = AttributeIndex(self.data["concepts"])
+            st.session_state[attr_key] = attribute_index
+        self._attribute_index = attribute_index
+
+        alias_index = st.session_state.get(alias_key)
+        if alias_index is None or not alias_index.is_current(self.data["concepts"]):
+            alias_index = AliasIndex(self.data["concepts"])
+            st.session_state[alias_key] = alias_index
+        self._alias_index = alias_index
+
+    def get_concept(self, name: str) -> Optional[Dict]:
+        return self.data["concepts"].get(name)
+
+    def put_concept(self, name: str, attributes: Dict):
+        previous = self.data["concepts"].get(name)
+        if previous is not None:
+            self._attribute_index.remove(name, previous)
+        self.data["concepts"][name] = attributes
+        self._attribute_index.add(name, attributes)
+        self._alias_index.add(name, attributes)
+
+    def remove_concepts(self, names: Iterable[str]):
+        for name in names:
+            attributes = self.data["concepts"].pop(name, None)
+            if attributes is None:
+                continue
+            self._attribute_index.remove(name, attributes)
+            self._alias_index.remove(name)
+
+    def concept_for_alias(self, key: str) -> Optional[str]:
+        return self._alias_index.keys.get(key)
+
+    def concept_names(self) -> List[str]:
+        return list(self.data["concepts"])
+
+    def iter_concepts(self) -> Iterator[Tuple[str, Dict]]:
+        return iter(list(self.data["concepts"].items()))
+
+    def concept_count(self) -> int:
+        return len(self.data["concepts"])
+
+    def has_relationship(self, source: str, relation: str, target: str) -> bool:
+        return (source, relation, target) in self._index.triples
+
+    def add_relationship(self, source: str, relation: str, target: str) -> bool:
+        if (source, relation, target) in self._index.triples:
+            return False
+        rel = {"source": source, "relation": relation, "target": target}
+        self.data["relationships"].append(rel)
+        self._index.add(rel)
+        return True
+
+    def remove_relationships(self, triples: Iterable[Triple]) -> int:
+        drop = set(triples) & self._index.triples
+        if not drop:
+            return 0
+        relationships = self.data["relationships"]
+        # In place, so the list stays the one in session_state; the index is rebuilt once
+        relationships[:] = [rel for rel in relationships if (rel["source"], rel["relation"], rel["target"]) not in drop]
+        self._index = RelationshipIndex(relationships)
+        st.session_state[f"{self.key}_relationship_index"] = self._index
+        return len(drop)
+
+    def outgoing(self, concept: str) -> List[Dict]:
+        return self._index.outgoing.get(concept, [])
+
+    def incoming(self, concept: str) -> List[Dict]:
+        return self._index.incoming.get(concept, [])
+
+    def iter_relationships(self) -> Iterator[Dict]:
+        return iter(list(self.data["relationships"]))
+
+    def relationship_count(self) -> int:
+        return len(self.data["relationships"])
+
+    def concepts_by_attribute(self, attribute: str, value: Any) -> Set[str]:
+        return self._attribute_index.lookup(attribute, value)
+
+    def concepts_by_attribute_prefix(self, attribute: str, prefix: str) -> Set[str]:
+        return self._attribute_index.lookup_prefix(attribute, prefix)
+
+    def clear(self):
+        self.data = {"concepts": {}, "relationships": []}
+        self.flush()
+        self._load_indexes()
+
+    def export(self) -> Dict:
+        return self.data
+
+    def version(self) -> Tuple[str, int]:
+        return self._version[0], self._version[1]
+
+    def bump_version(self):
+        self._version[1] += 1
+
+    def flush(self):
+        st.session_state[self.key] = self.data
+
+
+# SQLite backend in WAL mode, meant to be shared by every session through st.cache_resource
+class SQLiteBackend(StorageBackend):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS concepts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            attributes TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS concept_attributes (
+            concept TEXT NOT NULL,
+            attribute TEXT NOT NULL,
+            value TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_concept_attributes_lookup ON concept_attributes (attribute, value);
+        CREATE INDEX IF NOT EXISTS idx_concept_attributes_concept ON concept_attributes (concept);
+        CREATE TABLE IF NOT EXISTS relationships (
+            id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            relation TEXT NOT NULL,
+            target TEXT NOT NULL,
+            UNIQUE (source, relation, target)
+        );
+        CREATE INDEX IF NOT EXISTS idx_relationships_target ON relationships (target);
+        CREATE TABLE IF NOT EXISTS concept_aliases (
+            key TEXT PRIMARY KEY,
+            concept TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_concept_aliases_concept ON concept_aliases (concept);
+        CREATE TABLE IF NOT EXISTS kb_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+    # Rows fetched per query when iterating the whole store
+    PAGE_SIZE = 1000
+
+    def __init__(self, path: str = "knowledge_base.db"):
+        self.path = path
+        # One connection guarded by a lock; Streamlit runs each session's script on its own thread
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._depth = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO kb_meta (key, value) VALUES ('id', ?), ('version', '0')", (uuid.uuid4().hex,)
+            )
+        if self._query("SELECT EXISTS (SELECT 1 FROM concepts)")[0][0] and \
+                not self._query("SELECT EXISTS (SELECT 1 FROM concept_aliases)")[0][0]:
+            # Database from before the alias table: register every existing concept once
+            with self.transaction():
+                self._put_aliases(list(self.iter_concepts()))
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        # Values are stored as JSON so "1" and 1 stay distinct, matching attribute_key
+        return json.dumps(value, sort_keys=True, default=str)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_concept(self, name: str) -> Optional[Dict]:
+        rows = self._query("SELECT attributes FROM concepts WHERE name = ?", (name,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def _put_aliases(self, items: List[Tuple[str, Dict]]):
+        # The first concept registered under a key keeps it
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO concept_aliases (key, concept) VALUES (?, ?)",
+            [(key, name) for name, attributes in items for key in alias_keys(name, attributes)],
+        )
+
+    def put_concept(self, name: str, attributes: Dict):
+        with self.transaction():
+            self._put_aliases([(name, attributes)])
+            self._conn.execute(
+                "INSERT INTO concepts (name, attributes) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET attributes = excluded.attributes",
+                (name, json.dumps(attributes, default=str)),
+            )
+            self._conn.execute("DELETE FROM concept_attributes WHERE concept = ?", (name,))
+            if isinstance(attributes, dict):
+                self._conn.executemany(
+                    "INSERT INTO concept_attributes (concept, attribute, value) VALUES (?, ?, ?)",
+                    [(name, attribute, self._value(value)) for attribute, value in attributes.items()],
+                )
+
+    def put_concepts(self, items: Iterable[Tuple[str, Dict]]):
+        items = list(items)
+        with self.transaction():
+            self._put_aliases(items)
+            self._conn.executemany(
+                "INSERT INTO concepts (name, attributes) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET attributes = excluded.attributes",
+                [(name, json.dumps(attributes, default=str)) for name, attributes in items],
+            )
+            self._conn.executemany("DELETE FROM concept_attributes WHERE concept = ?", [(name,) for name, _ in items])
+            self._conn.executemany(
+                "INSERT INTO concept_attributes (concept, attribute, value) VALUES (?, ?, ?)",
+                [
+                    (name, attribute, self._value(value))
+                    for name, attributes in items if isinstance(attributes, dict)
+                    for attribute, value in attributes.items()
+                ],
+            )
+
+    def remove_concepts(self, names: Iterable[str]):
+        rows = [(name,) for name in names]
+        with self.transaction():
+            self._conn.executemany("DELETE FROM concepts WHERE name = ?", rows)
+            self._conn.executemany("DELETE FROM concept_attributes WHERE concept = ?", rows)
+            self._conn.executemany("DELETE FROM concept_aliases WHERE concept = ?", rows)
+
+    def concept_for_alias(self, key: str) -> Optional[str]:
+        rows = self._query("SELECT concept FROM concept_aliases WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def concept_names(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT name FROM concepts ORDER BY id")]
+
+    def iter_concepts(self) -> Iterator[Tuple[str, Dict]]:
+        # Keyset pagination keeps memory bounded and never holds the lock across a yield
+        last_id = 0
+        while True:
+            rows = self._query(
+                "SELECT id, name, attributes FROM concepts WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.PAGE_SIZE),
+            )
+            for last_id, name, attributes in rows:
+                yield name, json.loads(attributes)
+            if len(rows) < self.PAGE_SIZE:
+                return
+
+    def concept_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM concepts")[0][0]
+
+    def has_relationship(self, source: str, relation: str, target: str) -> bool:
+        return bool(self._query(
+            "SELECT 1 FROM relationships WHERE source = ? AND relation = ? AND target = ?",
+            (source, relation, target),
+        ))
+
+    def add_relationship(self, source: str, relation: str, target: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO relationships (source, relation, target) VALUES (?, ?, ?)",
+                (source, relation, target),
+            )
+            return cursor.rowcount == 1
+
+    def add_relationships(self, triples: Iterable[Triple]) -> int:
+        with self.transaction():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO relationships (source, relation, target) VALUES (?, ?, ?)", list(triples)
+            )
+            return self._conn.total_changes - before
+
+    def remove_relationships(self, triples: Iterable[Triple]) -> int:
+        with self.transaction():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "DELETE FROM relationships WHERE source = ? AND relation = ? AND target = ?", list(triples)
+            )
+            return self._conn.total_changes - before
+
+    def _relationships(self, where: str, params: tuple) -> List[Dict]:
+        rows = self._query(f"SELECT source, relation, target FROM relationships WHERE {where} ORDER BY id", params)
+        return [{"source": s, "relation": r, "target": t} for s, r, t in rows]
+
+    def outgoing(self, concept: str) -> List[Dict]:
+        return self._relationships("source = ?", (concept,))
+
+    def incoming(self, concept: str) -> List[Dict]:
+        return self._relationships("target = ?", (concept,))
+
+    def iter_relationships(self) -> Iterator[Dict]:
+        last_id = 0
+        while True:
+            rows = self._query(
+                "SELECT id, source, relation, target FROM relationships WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.PAGE_SIZE),
+            )
+            for last_id, s, r, t in rows:
+                yield {"source": s, "relation": r, "target": t}
+            if len(rows) < self.PAGE_SIZE:
+                return
+
+    def relationship_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM relationships")[0][0]
+
+    def concepts_by_attribute(self, attribute: str, value: Any) -> Set[str]:
+        rows = self._query(
+            "SELECT concept FROM concept_attributes WHERE attribute = ? AND value = ?",
+            (attribute, self._value(value)),
+        )
+        return {row[0] for row in rows}
+
+    def concepts_by_attribute_prefix(self, attribute: str, prefix: str) -> Set[str]:
+        # JSON-encoded strings all start with a quote, so a prefix is a range scan on the index
+        low = self._value(prefix)[:-1]
+        rows = self._query(
+            "SELECT concept FROM concept_attributes WHERE attribute = ? AND value >= ? AND value < ?",
+            (attribute, low, low + "\U0010ffff"),
+        )
+        return {row[0] for row in rows}
+
+    def clear(self):
+        with self.transaction():
+            self._conn.execute("DELETE FROM concepts")
+            self._conn.execute("DELETE FROM concept_attributes")
+            self._conn.execute("DELETE FROM concept_aliases")
+            self._conn.execute("DELETE FROM relationships")
+
+    def version(self) -> Tuple[str, int]:
+        # Kept in the database, so every session and process sees the same counter
+        meta = dict(self._query("SELECT key, value FROM kb_meta WHERE key IN ('id', 'version')"))
+        return meta["id"], int(meta["version"])
+
+    def bump_version(self):
+        with self.transaction():
+            self._conn.execute("UPDATE kb_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def export(self) -> Dict:
+        return {
+            "concepts": dict(self.iter_concepts()),
+            "relationships": list(self.iter_relationships()),
+        }
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# The app reads these when it is imported: keep caches and the job database out of the tree
+WORKDIR = tempfile.mkdtemp(prefix="kb-tests-")
+os.environ.setdefault("RESPONSE_CACHE_DIR", os.path.join(WORKDIR, "response_cache"))
+os.environ.setdefault("AUDIO_CACHE_DIR", os.path.join(WORKDIR, "audio_cache"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(WORKDIR, "jobs.db"))
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
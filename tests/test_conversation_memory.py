@@ -0,0 +1,30 @@
+from conversation_memory import ConversationMemory
+
+SYSTEM_MESSAGE = "You are an interface to communicate with domain experts."
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["bearing"] * words)}
+
+
+def test_turn_below_summary_threshold_stays_verbatim():
+    memory = ConversationMemory(recent_tokens=100)
+    messages = [message("user", 60), message("assistant", 60), message("user", 60)]
+    # The first message no longer fits the window, but too little has left it to summarize
+    assert memory.window_start(messages) > 0
+    assert memory.summarized == 0 and memory.job is None
+
+    prompt = memory.build_messages(SYSTEM_MESSAGE, messages)
+
+    assert [m["content"] for m in prompt[1:]] == [m["content"] for m in messages]
+
+
+def test_summarized_turns_are_replaced_by_the_summary():
+    memory = ConversationMemory(recent_tokens=100)
+    messages = [message("user", 60), message("assistant", 60), message("user", 60)]
+    memory.summary, memory.summarized = "The expert described the bearing.", 2
+
+    prompt = memory.build_messages(SYSTEM_MESSAGE, messages)
+
+    assert prompt[1]["content"].endswith(memory.summary)
+    assert [m["content"] for m in prompt[2:]] == [messages[2]["content"]]
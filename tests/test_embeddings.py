@@ -0,0 +1,89 @@
+import streamlit as st
+from embeddings import EmbeddingIndex, HashingEmbeddingProvider
+from knowledge_base import KnowledgeBase
+
+
+class FlakyProvider(HashingEmbeddingProvider):
+    """Hashing embeddings that fail while `failing` is set, counting the texts embedded"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+        self.embedded = 0
+
+    def embed(self, texts):
+        if self.failing:
+            raise ConnectionError("embedding API unavailable")
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+def session_kb() -> KnowledgeBase:
+    st.session_state.clear()
+    return KnowledgeBase()
+
+
+def test_failing_listener_does_not_fail_the_write():
+    kb = session_kb()
+    calls = []
+
+    def broken(event, concepts):
+        raise RuntimeError("listener bug")
+
+    kb.subscribe(broken)
+    kb.subscribe(lambda event, concepts: calls.append((event, list(concepts))))
+    kb.bulk_upsert({"Pump": {"type": "component"}}, [])
+
+    assert kb.query_concept("Pump") == {"type": "component"}
+    assert calls == [("upsert", ["Pump"])]
+
+
+def test_failed_embeddings_are_caught_up_on_attach():
+    kb = session_kb()
+    provider = FlakyProvider()
+    index = EmbeddingIndex(provider)
+    index.attach(kb)
+
+    provider.failing = True
+    kb.add_concept("Centrifugal Pump", {"type": "component"})
+    assert index.stale == {"Centrifugal Pump"} and len(index) == 0
+
+    provider.failing = False
+    kb.add_concept("Centrifugal Pump", {"type": "component", "stages": "2"})
+    kb.add_concept("Mechanical Seal", {"type": "component"})
+    index.attach(kb)
+
+    assert index.stale == set()
+    assert sorted(index.names) == ["Centrifugal Pump", "Mechanical Seal"]
+    assert index.search("centrifugal pump", k=1)[0][0] == "Centrifugal Pump"
+
+
+def test_attach_detects_drift_at_equal_concept_count():
+    kb = session_kb()
+    index = EmbeddingIndex(HashingEmbeddingProvider())
+    kb.add_concept("Pump", {})
+    index.attach(kb)
+
+    # Written through another KnowledgeBase the index isn't subscribed to
+    other = KnowledgeBase()
+    other.backend.remove_concepts(["Pump"])
+    other.backend.put_concept("Valve", {})
+    other.backend.bump_version()
+    index.attach(other)
+
+    assert index.names == ["Valve"]
+
+
+def test_persisted_index_is_not_re_embedded(tmp_path):
+    kb = session_kb()
+    kb.bulk_upsert({"Pump": {}, "Valve": {}}, [])
+    path = str(tmp_path / "index.npz")
+    index = EmbeddingIndex(HashingEmbeddingProvider(), path=path)
+    index.attach(kb)
+    index.flush()
+
+    provider = FlakyProvider()
+    restored = EmbeddingIndex(provider, path=path)
+    restored.attach(kb)
+
+    assert restored.names == ["Pump", "Valve"] and provider.embedded == 0
@@ -0,0 +1,50 @@
+import pytest
+import streamlit as st
+from entity_resolution import exact_key, find_duplicate_groups, normalize_name
+from knowledge_base import KnowledgeBase
+
+
+def session_kb() -> KnowledgeBase:
+    st.session_state.clear()
+    return KnowledgeBase()
+
+
+@pytest.mark.parametrize(
+    "variant, name",
+    [("The Neural-Networks", "neural network"), ("neural_network", "neural network"), ("Pumps", "pump"), ('"Heat Pump".', "heat pump")],
+)
+def test_spelling_variants_normalize_alike(variant, name):
+    assert normalize_name(variant) == name
+
+
+@pytest.mark.parametrize("first, second", [("C++", "C#"), ("Len", "Lens"), ("News", "New"), (".NET", "NET")])
+def test_distinct_names_keep_distinct_keys(first, second):
+    assert exact_key(first) != exact_key(second)
+
+
+def test_write_merges_spelling_variants():
+    kb = session_kb()
+    kb.add_concept("Neural Networks", {"type": "model"})
+    kb.add_concept("neural-network", {"layers": "3"})
+
+    assert kb.concept_names() == ["Neural Networks"]
+    assert kb.query_concept("neural-network") == {"type": "model", "layers": "3", "aliases": ["neural-network"]}
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [("C++", "C#"), ("Len", "Lens"), ("PR", "Pressure Relief"), ("IT", "it")],
+)
+def test_write_keeps_distinct_names_apart(first, second):
+    kb = session_kb()
+    kb.bulk_upsert({first: {"a": "1"}, second: {"b": "2"}}, [])
+    kb.add_relationship(first, "relates_to", second)
+
+    assert sorted(kb.concept_names()) == sorted([first, second])
+    assert kb.query_concept(first) == {"a": "1"}
+    assert kb.query_relationships(first) == [{"source": first, "relation": "relates_to", "target": second}]
+
+
+def test_symbol_names_are_not_grouped():
+    groups, _ = find_duplicate_groups(["C++", "C#", "C", "Lens", "Len"])
+    assert groups == {}
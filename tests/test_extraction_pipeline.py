@@ -0,0 +1,71 @@
+import re
+import time
+
+from extraction_pipeline import merge_extractions, run_chunked_extraction, split_transcript
+
+CONCEPT = re.compile(r"Concept\d+")
+
+
+def test_merge_keeps_names_that_differ_only_in_symbols():
+    merged = merge_extractions([{"concepts": {"C++": {"a": 1}, "C#": {"b": 2}}}])
+    assert merged["concepts"] == {"C++": {"a": 1}, "C#": {"b": 2}}
+
+
+def test_merge_folds_case_and_whitespace_to_the_most_frequent_spelling():
+    merged = merge_extractions([
+        {"concepts": {"Heat  Pump": {"a": 1}}, "relationships": [["Heat Pump", "Uses", "Compressor"]]},
+        None,
+        {"concepts": {"heat pump": {"b": 2}, "Heat Pump": {"a": 3}},
+         "relationships": [{"source": "Heat Pump", "relation": "uses", "target": "compressor"}]},
+    ])
+
+    assert merged["concepts"] == {"Heat Pump": {"a": 3, "b": 2}}
+    # The first spelling of a relation label wins; names only seen in relationships aren't concepts
+    assert merged["relationships"] == [{"source": "Heat Pump", "relation": "Uses", "target": "Compressor"}]
+
+
+def test_split_transcript_overlaps_chunks_on_line_boundaries():
+    lines = [f"user: line {i} " + "word " * 20 for i in range(20)]
+    chunks = split_transcript("\n".join(lines), max_tokens=100, overlap_tokens=30)
+
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.splitlines()[0] in previous.splitlines()
+    assert {line for chunk in chunks for line in chunk.splitlines()} == set(lines)
+
+
+def test_chunked_extraction_merges_in_chunk_order_despite_completion_order():
+    text = "\n".join(f"user: Concept{i} is connected to Concept{i + 1} " + "word " * 20 for i in range(30))
+
+    def extract(chunk):
+        names = CONCEPT.findall(chunk)
+        # Later chunks finish first
+        time.sleep(0.05 / (1 + int(names[0][7:])))
+        return {"concepts": {name: {"first_seen": chunk.splitlines()[0]} for name in names}}
+
+    merged, stats = run_chunked_extraction(text, extract, max_tokens=120, overlap_tokens=40, max_workers=4)
+    again, _ = run_chunked_extraction(text, extract, max_tokens=120, overlap_tokens=40, max_workers=4)
+
+    assert stats["chunks"] > 1 and stats["failed_chunks"] == 0
+    assert merged == again
+    assert sorted(merged["concepts"], key=lambda name: int(name[7:])) == [f"Concept{i}" for i in range(31)]
+
+
+def test_chunked_extraction_reports_failed_chunks():
+    text = "\n".join(f"user: Concept{i} " + "word " * 30 for i in range(10))
+    calls = []
+
+    def extract(chunk):
+        calls.append(chunk)
+        if "Concept0 " in chunk:
+            raise RuntimeError("rate limited")
+        return {"concepts": {name: {} for name in CONCEPT.findall(chunk)}}
+
+    progress = []
+    merged, stats = run_chunked_extraction(
+        text, extract, max_tokens=80, overlap_tokens=0, max_workers=2, progress=lambda done, total: progress.append((done, total)),
+    )
+
+    assert stats["failed_chunks"] == 1 and stats["errors"] == ["rate limited"]
+    assert "Concept0" not in merged["concepts"] and "Concept9" in merged["concepts"]
+    assert progress[-1] == (len(calls), stats["chunks"])
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+import streamlit as st
+from incremental_extraction import ExtractionCheckpoint, apply_extraction_jobs
+from jobs import INTERRUPTED_ERROR, JobQueue, get_job_queue
+from knowledge_base import KnowledgeBase
+
+RESULT = {
+    "concepts": {"Pump": {"type": "component"}},
+    "relationships": [{"source": "Pump", "relation": "has", "target": "Seal"}],
+    "stats": {"chunks": 1, "tokens_per_second": 100.0},
+}
+
+
+def wait_for(queue: JobQueue, job_id: str) -> dict:
+    deadline = time.monotonic() + 5
+    while queue.get(job_id)["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return queue.get(job_id)
+
+
+def session_kb() -> KnowledgeBase:
+    st.session_state.clear()
+    return KnowledgeBase()
+
+
+def test_jobs_cut_off_by_a_restart_are_failed_not_rerun(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    # No handler registered yet, so the job stays queued
+    job_id = JobQueue(path).submit("extract", {"text": "..."}, "session")
+
+    calls = []
+    restarted = JobQueue(path)
+    restarted.register("extract", lambda payload, progress: calls.append(payload) or {})
+
+    job = restarted.get(job_id)
+    assert job["status"] == "failed" and job["error"] == INTERRUPTED_ERROR
+    assert calls == []
+
+
+@pytest.fixture
+def queue():
+    queue = get_job_queue()
+    queue.register("test_extract", lambda payload, progress: RESULT)
+    queue.register("test_fail", lambda payload, progress: 1 / 0)
+    return queue
+
+
+def test_finished_jobs_are_applied_from_any_page(queue):
+    kb = session_kb()
+    checkpoint = st.session_state.extraction_checkpoint = ExtractionCheckpoint()
+    checkpoint.jobs.append((queue.submit("test_extract", {}), 2))
+    job_id = checkpoint.jobs[0][0]
+    wait_for(queue, job_id)
+
+    apply_extraction_jobs(kb, {})
+
+    assert kb.query_concept("Pump") == {"type": "component"}
+    assert checkpoint.index == 2 and checkpoint.jobs == []
+    assert queue.get(job_id)["status"] == "applied"
+
+
+def test_failed_job_is_reported_until_a_later_job_lands(queue):
+    kb = session_kb()
+    checkpoint = ExtractionCheckpoint()
+    checkpoint.jobs.append((queue.submit("test_fail", {}), 2))
+    wait_for(queue, checkpoint.jobs[0][0])
+
+    checkpoint.apply_finished(queue, kb)
+    assert checkpoint.error == "Knowledge extraction failed: division by zero"
+    assert checkpoint.index == 0 and checkpoint.jobs == []
+
+    checkpoint.jobs.append((queue.submit("test_extract", {}), 4))
+    wait_for(queue, checkpoint.jobs[0][0])
+    checkpoint.apply_finished(queue, kb)
+    assert checkpoint.error is None and checkpoint.index == 4
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+from extraction_schema import ITEM_DEPTH, validate_extraction
+from json_stream import JSONStreamParser
+
+REPLY = {
+    "concepts": {
+        "Pump": {"type": "component", "specs": {"flow": 12.5, "stages": [1, 2]}, "active": True},
+        'Seal "mechanical"': {"note": "keeps {water} in\\out, 50% of été faults", "spare": None},
+        "Shaft": "a rotating rod",
+    },
+    "relationships": [
+        {"source": "Pump", "relation": "has", "target": "Shaft"},
+        ["Shaft", "drives", "Pump"],
+    ],
+}
+TEXT = json.dumps(REPLY, ensure_ascii=False)
+
+
+def parse(text, size=None, **kwargs):
+    parser = JSONStreamParser(**kwargs)
+    for i in range(0, len(text), size or len(text) or 1):
+        parser.feed(text[i:i + (size or len(text))])
+    return parser
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64])
+def test_tokens_split_anywhere_parse_to_the_whole_object(size):
+    parser = parse(TEXT, size)
+    assert parser.complete
+    assert parser.snapshot() == REPLY
+
+
+def test_prose_and_fences_around_the_object_are_ignored():
+    text = 'Sure {not json}! Here it is:\n```json\n' + TEXT + '\n```\nLet me know {if} that helps.'
+    parser = parse(text, 5)
+    assert parser.complete and parser.snapshot() == REPLY
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    text = r'{"a": "say \"}\" and \\", "b": "{"}'
+    assert parse(text, 1).snapshot() == {"a": 'say "}" and \\', "b": "{"}
+
+
+def test_truncated_input_keeps_complete_items():
+    parser = parse(TEXT[:TEXT.index('"Shaft": "a rot') + 12], 3)
+    assert not parser.complete
+    assert parser.snapshot() == {"concepts": {name: REPLY["concepts"][name] for name in ("Pump", 'Seal "mechanical"')}}
+
+
+def test_no_object_gives_none():
+    assert parse("I could not find any concepts.").snapshot() is None
+    assert parse("").snapshot() is None
+
+
+def test_every_prefix_parses_to_whole_items_only():
+    parser = JSONStreamParser(atomic_depth=ITEM_DEPTH)
+    for char in TEXT:
+        snapshot = parser.feed(char).snapshot() or {}
+        for name, attributes in snapshot.get("concepts", {}).items():
+            # A concept shows up with all of its attributes or not at all
+            assert REPLY["concepts"][name] == attributes
+        relationships = snapshot.get("relationships", [])
+        assert relationships == REPLY["relationships"][:len(relationships)]
+    assert parser.snapshot() == REPLY
+
+
+def test_half_streamed_concept_is_left_out_until_it_closes():
+    text = '{"concepts": {"A": {"x": 1}, "B": {"y": "lo'
+    assert parse(text).snapshot() == {"concepts": {"A": {"x": 1}, "B": {}}}
+    parser = parse(text, atomic_depth=ITEM_DEPTH)
+    assert parser.snapshot() == {"concepts": {"A": {"x": 1}}}
+    parser.feed('ng"}}}')
+    assert parser.snapshot() == {"concepts": {"A": {"x": 1}, "B": {"y": "long"}}}
+
+
+def test_extraction_schema_tolerates_malformed_items():
+    extraction = validate_extraction({
+        "concepts": ["Pump", {"name": "Seal", "material": "carbon"}, {"material": "steel"}, ""],
+        "relationships": [["Pump", "has", "Seal"], {"source": "Pump", "relation": ""}, "Pump has Seal"],
+    })
+
+    assert extraction.to_result() == {
+        "concepts": {"Pump": {}, "Seal": {"material": "carbon"}},
+        "relationships": [{"source": "Pump", "relation": "has", "target": "Seal"}],
+    }
+    assert extraction.dropped == 4
+    assert validate_extraction(["Pump"]) is None
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from knowledge_base import KnowledgeBase
+from knowledge_io import import_stream, write_ndjson
+from storage import SQLiteBackend
+
+CONCEPTS = {"Pump": {"type": "component"}, "Seal": {"type": "component", "material": "carbon"}}
+RELATIONSHIPS = [{"source": "Pump", "relation": "has", "target": "Seal"}]
+
+
+def session_kb() -> KnowledgeBase:
+    st.session_state.clear()
+    return KnowledgeBase()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_ndjson_round_trip(compression):
+    kb = session_kb()
+    kb.bulk_upsert(CONCEPTS, RELATIONSHIPS)
+    buffer = io.BytesIO()
+    # A header line, then one per concept and relationship
+    assert write_ndjson(kb, buffer, compression=compression) == 4
+
+    buffer.seek(0)
+    restored = session_kb()
+    import_stream(restored, buffer)
+    assert dict(restored.iter_concepts()) == CONCEPTS
+    assert list(restored.iter_relationships()) == RELATIONSHIPS
+
+
+@pytest.mark.parametrize("storage", ["session", "sqlite"])
+@pytest.mark.parametrize("export_format", ["NDJSON (gzip)", "NDJSON", "JSON (legacy)"])
+def test_export_button(monkeypatch, tmp_path, storage, export_format):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("KB_STORAGE", storage)
+    monkeypatch.setenv("KB_SQLITE_PATH", str(tmp_path / "kb.db"))
+    if storage == "sqlite":
+        KnowledgeBase(SQLiteBackend(str(tmp_path / "kb.db"))).bulk_upsert(CONCEPTS, RELATIONSHIPS)
+
+    at = AppTest.from_file("../main.py", default_timeout=60)
+    if storage == "session":
+        at.session_state["knowledge_base"] = {"concepts": dict(CONCEPTS), "relationships": list(RELATIONSHIPS)}
+    at.run()
+    at.sidebar.selectbox[0].set_value(export_format).run()
+    next(button for button in at.sidebar.button if button.label == "Export Knowledge Base").click().run()
+
+    assert not at.exception
+    downloads = [element.proto for element in at.get("download_button")]
+    assert len(downloads) == 1
+    assert downloads[0].url.endswith(".gz") == (export_format == "NDJSON (gzip)")
@@ -0,0 +1,70 @@
+import openai
+import pytest
+from tenacity import wait_none
+from benchmarks.fake_openai import FakeOpenAIServer
+from llm_clients import API_ATTEMPTS, StreamInterrupted, complete_streaming, stream_chat
+
+REPLY = "The impeller is driven by the motor shaft."
+TOKENS = ["The", " impeller", " is", " driven", " by", " the", " motor", " shaft."]
+MESSAGES = [{"role": "user", "content": "What drives the impeller?"}]
+
+
+class FlakyServer(FakeOpenAIServer):
+    """Fails the first `errors` requests, and cuts off the first `interrupts` streamed replies"""
+
+    def __init__(self, errors: int = 0, interrupts: int = 0):
+        super().__init__(reply=REPLY, error_rate=float(errors > 0), interrupt_rate=float(interrupts > 0))
+        self.left = {"errors": errors, "interrupted": interrupts}
+
+    def _count(self, key: str):
+        super()._count(key)
+        kind = key.rsplit(" ", 1)[-1]
+        if kind in self.left:
+            self.left[kind] -= 1
+            if not self.left[kind]:
+                setattr(self, "error_rate" if kind == "errors" else "interrupt_rate", 0.0)
+
+
+def llm_config(server: FakeOpenAIServer):
+    return {"config_list": [{"model": "gpt-4o", "api_key": "sk-test", "base_url": server.base_url}]}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(complete_streaming.retry, "wait", wait_none())
+
+
+def test_stream_chat_yields_deltas_as_they_arrive():
+    with FakeOpenAIServer(reply=REPLY) as server:
+        assert list(stream_chat(MESSAGES, llm_config(server))) == TOKENS
+
+
+def test_complete_streaming_retries_errors_before_any_text():
+    deltas = []
+    with FlakyServer(errors=2) as server:
+        reply = complete_streaming(MESSAGES, llm_config(server), on_delta=deltas.append)
+
+    assert reply == REPLY
+    # Failed attempts sent nothing, so every delta is passed on exactly once
+    assert deltas == TOKENS
+    assert server.counts["chat/completions"] == 3
+
+
+def test_complete_streaming_gives_up_after_the_last_attempt():
+    with FlakyServer(errors=API_ATTEMPTS + 1) as server:
+        with pytest.raises(openai.InternalServerError):
+            complete_streaming(MESSAGES, llm_config(server))
+
+    assert server.counts["chat/completions"] == API_ATTEMPTS
+
+
+def test_interrupted_stream_keeps_the_text_that_arrived():
+    deltas = []
+    with FlakyServer(interrupts=1) as server:
+        with pytest.raises(StreamInterrupted) as interrupted:
+            complete_streaming(MESSAGES, llm_config(server), on_delta=deltas.append)
+
+    assert interrupted.value.text == "".join(TOKENS[:len(TOKENS) // 2])
+    assert deltas == TOKENS[:len(TOKENS) // 2]
+    # Retrying would repeat the text already shown
+    assert server.counts["chat/completions"] == 1
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+from speech_pipeline import run_voice_turn, split_sentences
+
+REPLY = (
+    "The centrifugal pump moves water with an impeller. "
+    "Its mechanical seal keeps the shaft from leaking. "
+    "Check the bearing temperature every shift, it should stay below 80 degrees."
+)
+SENTENCES = [
+    "The centrifugal pump moves water with an impeller.",
+    "Its mechanical seal keeps the shaft from leaking.",
+    "Check the bearing temperature every shift, it should stay below 80 degrees.",
+]
+
+
+def token_stream(text, size=3):
+    # Deltas cut mid-word and mid-punctuation, as a model streams them
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_split_sentences_reassembles_split_tokens():
+    assert list(split_sentences(token_stream(REPLY))) == SENTENCES
+
+
+def test_split_sentences_merges_short_sentences_and_keeps_closing_quotes():
+    deltas = token_stream('Yes. It is. The gauge reads "3.5 bar." Then it drops slowly and stops')
+    assert list(split_sentences(deltas, min_chars=20)) == [
+        "Yes. It is. The gauge reads \"3.5 bar.\"",
+        "Then it drops slowly and stops",
+    ]
+
+
+def test_split_sentences_yields_each_sentence_before_the_stream_ends():
+    seen = []
+
+    def deltas():
+        for delta in token_stream(REPLY):
+            seen.append(delta)
+            yield delta
+
+    first = next(split_sentences(deltas()))
+    assert first == SENTENCES[0]
+    assert len("".join(seen)) < len(REPLY)
+
+
+def test_audio_is_delivered_in_sentence_order():
+    def synthesize(sentence):
+        # Later sentences finish first
+        time.sleep(0.05 * (len(SENTENCES) - SENTENCES.index(sentence)))
+        return sentence.encode()
+
+    delivered, texts = [], []
+    result = run_voice_turn(
+        token_stream(REPLY), synthesize,
+        on_text=texts.append, on_audio=lambda i, audio: delivered.append((i, audio)),
+    )
+
+    expected = [sentence.encode() for sentence in SENTENCES]
+    assert result["segments"] == expected
+    assert delivered == list(enumerate(expected))
+    assert result["text"] == REPLY and texts[-1] == REPLY
+    assert result["errors"] == []
+
+
+def test_synthesis_errors_leave_a_gap_and_are_reported():
+    def synthesize(sentence):
+        if sentence == SENTENCES[1]:
+            raise ConnectionError("TTS unavailable")
+        return sentence.encode()
+
+    delivered = []
+    result = run_voice_turn(token_stream(REPLY), synthesize, on_audio=lambda i, audio: delivered.append(i))
+
+    assert result["segments"] == [SENTENCES[0].encode(), b"", SENTENCES[2].encode()]
+    assert result["errors"] == ["TTS unavailable"]
+    assert delivered == [0, 2]
+
+
+def test_stream_errors_propagate():
+    def deltas():
+        yield from token_stream(SENTENCES[0] + " ")
+        raise ConnectionError("stream interrupted")
+
+    with pytest.raises(ConnectionError):
+        run_voice_turn(deltas(), lambda sentence: b"audio")
+
+
+def test_metrics_follow_the_turn():
+    first_sentence_synthesized = threading.Event()
+
+    def deltas():
+        yield from token_stream(SENTENCES[0] + " ")
+        # The first sentence is synthesized while the rest is still streaming
+        assert first_sentence_synthesized.wait(5)
+        yield from token_stream(" ".join(SENTENCES[1:]))
+
+    def synthesize(sentence):
+        first_sentence_synthesized.set()
+        return b"audio"
+
+    metrics = run_voice_turn(deltas(), synthesize, max_workers=1)["metrics"]
+
+    assert metrics["segments"] == len(SENTENCES)
+    assert 0 <= metrics["first_token_s"] <= metrics["first_audio_s"] <= metrics["total_s"]
+    assert metrics["llm_done_s"] <= metrics["total_s"]
@@ -0,0 +1,24 @@
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+DEFAULT_MODEL = "gpt-4o"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = DEFAULT_MODEL) -> Optional[tiktoken.Encoding]:
+    """tiktoken encoding for a model, or None if it can't be loaded (e.g. offline first run)"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Number of tokens in text, estimated at ~4 characters per token without an encoding"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,320 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Tuple
+
+# Off unless TRACING=1 or the metrics exporter is on; when off, span() and traced
+# functions cost a flag check
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Local only by default; set METRICS_HOST=0.0.0.0 to let a remote Prometheus scrape it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+TRACING = os.getenv("TRACING", "").lower() in ("1", "true", "yes") or bool(METRICS_PORT)
+METRIC_PREFIX = "knowledge_system"
+# Upper bounds of the span duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Finished traces kept per root span name, and spans kept per trace, for the diagnostics page
+TRACES_PER_ROOT = 10
+SPANS_PER_TRACE = 1000
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class SpanStats:
+    """Call count, total and max duration and a duration histogram of one span name"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(DURATION_BUCKETS, seconds)] += 1
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start", "depth", "trace")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        stack = self.tracer._local.stack
+        self.depth = len(stack)
+        # Spans nested on one thread form a trace, named after its root
+        self.trace = stack[0].trace if stack else {"name": self.name, "start": time.time(), "spans": []}
+        stack.append(self)
+        self.start = time.perf_counter()
+        if not self.depth:
+            self.trace["perf_start"] = self.start
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stack = self.tracer._local.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            # Spans above it were left open (an abandoned generator); drop them with it
+            del stack[stack.index(self):]
+        self.tracer._finish(self, seconds)
+        return False
+
+
+class _Local(threading.local):
+    def __init__(self):
+        # Open spans on this thread, innermost last
+        self.stack: List[_Span] = []
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Timing spans, counters and gauges for the whole server process. Collectors are
+    read only when metrics are exported, so state that is already tracked elsewhere
+    (cache hit counts, job queue sizes) costs nothing on the hot path.
+    """
+
+    def __init__(self, enabled: bool = TRACING):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = _Local()
+        self.spans: Dict[str, SpanStats] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.traces: Dict[str, Deque[Dict]] = {}
+
+    def _finish(self, span: _Span, seconds: float):
+        trace = span.trace
+        with self._lock:
+            stats = self.spans.get(span.name)
+            if stats is None:
+                stats = self.spans[span.name] = SpanStats()
+            stats.observe(seconds)
+            if len(trace["spans"]) < SPANS_PER_TRACE:
+                # (name, depth, offset from the root's start, seconds)
+                trace["spans"].append((span.name, span.depth, span.start - trace["perf_start"], seconds))
+            if not span.depth:
+                trace["seconds"] = seconds
+                self.traces.setdefault(span.name, deque(maxlen=TRACES_PER_ROOT)).append(trace)
+
+    def observe(self, name: str, seconds: float):
+        """Record a duration measured by the caller, e.g. across a generator's yields"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.observe(seconds)
+
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, float]]):
+        """collect() returns {metric: value}; exported as gauges named "<name>_<metric>" """
+        with self._lock:
+            self.collectors[name] = collect
+
+    def collected(self) -> Dict[str, float]:
+        with self._lock:
+            collectors = list(self.collectors.items())
+        values = {}
+        for name, collect in collectors:
+            try:
+                items = collect().items()
+            except Exception:
+                # A failing collector shouldn't take the others down
+                continue
+            for metric, value in items:
+                if isinstance(value, (int, float)):
+                    values[f"{name}_{metric}"] = value
+        return values
+
+    def metric_rows(self) -> List[Dict]:
+        """Counters, gauges and collected values, one row per labelled series"""
+        with self._lock:
+            rows = [{"metric": name, "labels": dict(labels), "kind": "counter", "value": value}
+                    for (name, labels), value in self.counters.items()]
+            rows += [{"metric": name, "labels": dict(labels), "kind": "gauge", "value": value}
+                     for (name, labels), value in self.gauges.items()]
+        rows += [{"metric": name, "labels": {}, "kind": "collected", "value": value}
+                 for name, value in self.collected().items()]
+        return sorted(rows, key=lambda row: (row["metric"], sorted(row["labels"].items())))
+
+    def span_table(self) -> List[Dict]:
+        """One row per span name, slowest in total first"""
+        with self._lock:
+            rows = [
+                {"span": name, "count": stats.count, "total_s": stats.total,
+                 "mean_ms": stats.total / stats.count * 1000, "max_ms": stats.max * 1000}
+                for name, stats in self.spans.items()
+            ]
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def trace_roots(self) -> List[str]:
+        with self._lock:
+            return sorted(self.traces)
+
+    def recent_traces(self, root: str) -> List[Dict]:
+        """
+        Finished traces rooted at a span called root, newest first; "spans" holds
+        (name, depth, offset, seconds) tuples in the order the spans finished
+        """
+        with self._lock:
+            return list(reversed(self.traces.get(root, ())))
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.traces.clear()
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            spans = {name: (stats.count, stats.total, list(stats.buckets)) for name, stats in self.spans.items()}
+            counters, gauges = dict(self.counters), dict(self.gauges)
+
+        histogram = f"{METRIC_PREFIX}_span_seconds"
+        lines += [f"# HELP {histogram} Time spent in traced code, by span",
+                  f"# TYPE {histogram} histogram"]
+        for name, (count, total, buckets) in sorted(spans.items()):
+            cumulative = 0
+            for bound, hits in zip(DURATION_BUCKETS + (float("inf"),), buckets):
+                cumulative += hits
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{histogram}_bucket{{span="{_escape(name)}",le="{le}"}} {cumulative}')
+            lines.append(f'{histogram}_sum{{span="{_escape(name)}"}} {total:.6f}')
+            lines.append(f'{histogram}_count{{span="{_escape(name)}"}} {count}')
+
+        for kind, values, suffix in (("counter", counters, "_total"), ("gauge", gauges, "")):
+            families: Dict[str, List[str]] = {}
+            for (name, labels), value in sorted(values.items()):
+                metric = f"{METRIC_PREFIX}_{_metric_name(name)}{suffix}"
+                families.setdefault(metric, []).append(f"{metric}{_labels(labels)} {_number(value)}")
+            for metric, samples in families.items():
+                lines.append(f"# TYPE {metric} {kind}")
+                lines += samples
+        for name, value in sorted(self.collected().items()):
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{_metric_name(key)}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6f}"
+
+
+tracer = Tracer()
+
+
+def span(name: str):
+    """Time a block as a span: `with span("kb.bulk_upsert"): ...`"""
+    return tracer.span(name)
+
+
+def traced(name: str):
+    """Decorator timing every call of a function as a span"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with _Span(tracer, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(name: str, seconds: float):
+    tracer.observe(name, seconds)
+
+
+def count(name: str, value: float = 1, **labels):
+    tracer.count(name, value, **labels)
+
+
+def gauge(name: str, value: float, **labels):
+    tracer.gauge(name, value, **labels)
+
+
+def tracing_enabled() -> bool:
+    """For work done only to feed a metric, such as counting tokens"""
+    return tracer.enabled
+
+
+def start_exporter(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve the metrics at http://<host>:<port>/metrics on a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-exporter").start()
+    return server
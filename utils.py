@@ -1,78 +1,127 @@
-import json
 import os
-from typing import Dict, List, Optional
-import autogen
+from typing import Callable, Dict, List, Optional
 import streamlit as st
 from knowledge_base import KnowledgeBase
+from extraction_pipeline import run_chunked_extraction
+from extraction_schema import ITEM_DEPTH, JSON_RESPONSE_FORMAT, validate_extraction
+from json_stream import JSONStreamParser
+from llm_clients import StreamInterrupted, chat_settings, complete_streaming
+from response_cache import get_response_cache
+from tracing import traced
+
+EXTRACTION_SYSTEM_MESSAGE = (
+    "You are an expert knowledge extraction system. Your task is to analyze the"
+    " conversation and extract key concepts, their attributes, and relationships between them."
+    " Format your response as a JSON object with two main keys:"
+    " 'concepts' (a dictionary of concept names to their attributes) and"
+    " 'relationships' (a list of source-relation-target triples)."
+)
 
 
 # Function to extract knowledge from conversation
-def extract_knowledge(conversation_text: str, llm_config: Dict) -> Dict:
+@traced("extract_knowledge")
+def extract_knowledge(conversation_text: str, llm_config: Dict, context: str = "") -> Dict:
     """
     Extract knowledge from conversation text using an LLM.
-    Returns a dictionary with concepts and relationships.
+    Long conversations are split into overlapping chunks that are extracted in
+    parallel and merged. Returns a dictionary with concepts and relationships, plus
+    "stats" on chunking and throughput.
     """
-    extraction_agent = autogen.AssistantAgent(
-        name="knowledge_extractor",
-        llm_config=llm_config,
-        system_message=(
-            "You are an expert knowledge extraction system. Your task is to analyze the"
-            " conversation and extract key concepts, their attributes, and relationships between them."
-            " Format your response as a JSON object with two main keys:"
-            " 'concepts' (a dictionary of concept names to their attributes) and"
-            " 'relationships' (a list of source-relation-target triples)."
-        ),
-        code_execution_config={"use_docker": False}
-    )
-    
-    user_proxy = autogen.UserProxyAgent(
-        name="user_proxy",
-        human_input_mode="NEVER",
-        code_execution_config={"work_dir": "knowledge_extraction", "use_docker": False},
-    )
-    
-    user_proxy.initiate_chat(
-        extraction_agent, 
-        message=(
+    result = run_extraction(conversation_text, llm_config, context)
+    if result["stats"]["unparsed_chunks"]:
+        st.error("Error parsing JSON from extraction agent")
+    if result["stats"]["partial_chunks"]:
+        st.warning(f"{result['stats']['partial_chunks']} extraction replies were cut off; kept their complete items")
+    return result
+
+def extraction_message(text: str, context: str = "") -> str:
+    if not context:
+        return (
             f"Please extract structured knowledge from the following conversation:"
-            f"\n\n{conversation_text}\n\n"
+            f"\n\n{text}\n\n"
             f"Return only the JSON object with the extracted knowledge."
-        ),
-        max_turns=1
+        )
+    # Earlier turns are only there to resolve references; they were already extracted
+    return (
+        f"Earlier in the conversation (already processed, for reference only):"
+        f"\n\n{context}\n\n"
+        f"Please extract structured knowledge from the following new part of the conversation:"
+        f"\n\n{text}\n\n"
+        f"Return only the JSON object with the knowledge from the new part."
     )
-    
-    # Get the last message from the extraction agent
-    last_message = extraction_agent.last_message().get("content", "")
-    
-    # Extract the JSON part from the message
-    try:
-        # Try to find JSON between triple backticks
-        import re
-        json_match = re.search(r"```json\n(.*?)\n```", last_message, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # If not found, try to extract any JSON-like structure
-            start_idx = last_message.find("{")
-            end_idx = last_message.rfind("}")
-            if start_idx != -1 and end_idx != -1:
-                json_str = last_message[start_idx:end_idx+1]
-            else:
-                return {"concepts": {}, "relationships": []}
-        
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        st.error("Error parsing JSON from extraction agent")
-        return {"concepts": {}, "relationships": []}
+
+@traced("extraction.run")
+def run_extraction(
+    conversation_text: str,
+    llm_config: Dict,
+    context: str = "",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict:
+    """
+    extract_knowledge without any Streamlit calls, so it can run on a background thread.
+    progress(done, total) reports finished chunks. Replies are requested in JSON mode and
+    parsed as they stream in, then validated against the extraction schema. stats counts
+    chunks whose reply could not be parsed ("unparsed_chunks"), chunks recovered from a
+    reply that was cut off ("partial_chunks") and malformed items dropped ("dropped_items").
+    """
+    model = chat_settings(llm_config)["model"]
+    unparsed, partial, dropped = [], [], []
+
+    def extract(chunk: str) -> Optional[Dict]:
+        message = extraction_message(chunk, context)
+        parser = JSONStreamParser(atomic_depth=ITEM_DEPTH)
+
+        def call() -> str:
+            return complete_streaming(
+                [{"role": "system", "content": EXTRACTION_SYSTEM_MESSAGE}, {"role": "user", "content": message}],
+                llm_config,
+                on_delta=parser.feed,
+                response_format=JSON_RESPONSE_FORMAT,
+            )
+
+        try:
+            # The prompt holds only conversation text, so replies don't depend on the KB version
+            reply = get_response_cache().get_or_call(model, EXTRACTION_SYSTEM_MESSAGE, message, call)
+        except StreamInterrupted:
+            # Keep the items that arrived complete instead of wasting the call
+            reply = None
+        if reply is not None and not parser.text:
+            # Cached reply
+            parser.feed(reply)
+        extraction = validate_extraction(parser.snapshot())
+        if extraction is None:
+            if parser.text.strip():
+                unparsed.append(chunk)
+            return None
+        if not parser.complete:
+            # Interrupted, or truncated at the token limit
+            partial.append(chunk)
+        dropped.append(extraction.dropped)
+        return extraction.to_result()
+
+    result, stats = run_chunked_extraction(conversation_text, extract, progress=progress)
+    stats["unparsed_chunks"] = len(unparsed)
+    stats["partial_chunks"] = len(partial)
+    stats["dropped_items"] = sum(dropped)
+    result["stats"] = stats
+    return result
+
+def parse_json_object(message: str) -> Optional[Dict]:
+    """
+    Parse the JSON object in an LLM reply, skipping any prose or ```json fence around
+    it. A reply cut off mid-object gives the items that were complete. Returns None if
+    there is no object.
+    """
+    result = JSONStreamParser().feed(message).snapshot()
+    return result if isinstance(result, dict) else None
 
 # Function to update the knowledge base with extraction results
-def update_knowledge_base(extraction_result: Dict, kb: KnowledgeBase):
-    """Update the knowledge base with new extraction results"""
-    # Add concepts
-    for concept_name, attributes in extraction_result.get("concepts", {}).items():
-        kb.add_concept(concept_name, attributes)
-    
-    # Add relationships
-    for rel in extraction_result.get("relationships", []):
-        if all(k in rel for k in ["source", "relation", "target"]):
-            kb.add_relationship(rel["source"], rel["relation"], rel["target"])
+def update_knowledge_base(extraction_result: Dict, kb: KnowledgeBase) -> Dict[str, int]:
+    """
+    Update the knowledge base with new extraction results in a single batch.
+    Returns the inserted/updated/unchanged counts from KnowledgeBase.bulk_upsert.
+    """
+    return kb.bulk_upsert(
+        extraction_result.get("concepts", {}),
+        extraction_result.get("relationships", []),
+    )